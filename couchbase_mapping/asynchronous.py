@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Non-blocking access to Couchbase buckets.
+
+The official Couchbase client only offers a blocking API. The asynchronous
+methods of `Document` and `ViewDefinition` (``aload()``, ``astore()``,
+``aview()`` and ``aiter()``) therefore hand the blocking calls to an
+`AsyncBucket`, which runs them in a pool of worker threads and immediately
+returns an `AsyncResult`. Calling ``get()`` on the result waits for the
+operation to complete and returns its value, or re-raises its exception.
+
+The worker threads use the bucket at the same time, and the connections of the
+client must not be shared between threads, so the bucket should be a
+`BucketPool` with as many connections as there are worker threads:
+
+>>> from couchbase import Couchbase
+>>> from couchbase_mapping.pool import BucketPool
+>>> server = Couchbase('localhost', 'Administrator', 'password')
+>>> server.create('python-tests')                           #doctest: +ELLIPSIS
+<couchbase.client.Bucket object at ...>
+>>> pool = BucketPool(lambda: server.bucket('python-tests'), size=20)
+>>> db = AsyncBucket(pool, size=20)
+
+>>> from couchbase_mapping import Document, TextField
+>>> class Person(Document):
+...     name = TextField()
+>>> pending = [Person(name='Person %d' % i).astore(db) for i in range(10)]
+>>> people = [result.get() for result in pending]
+>>> pending = [Person.aload(db, person.id) for person in people]
+>>> [result.get().name for result in pending]         #doctest: +ELLIPSIS
+[u'Person 0', u'Person 1', ...]
+
+A bucket that is not wrapped in an `AsyncBucket` is run in a thread pool
+shared by the whole process, which runs up to 10 operations at a time, so it
+too should be a `BucketPool`.
+
+>>> db.close()
+>>> server.delete('python-tests')
+"""
+
+from multiprocessing.pool import ThreadPool
+from threading import Lock
+
+__all__ = ['AsyncBucket']
+__docformat__ = 'restructuredtext en'
+
+DEFAULT_POOL_SIZE = 10
+
+_shared_pool = None
+_shared_pool_lock = Lock()
+
+
+class AsyncBucket(object):
+    """Adapter that runs operations on a blocking `Bucket` in a pool of worker
+    threads.
+    """
+
+    def __init__(self, bucket, size=DEFAULT_POOL_SIZE, pool=None):
+        """Initialize the adapter.
+
+        :param bucket: the bucket to wrap, which is used from all worker
+                       threads at once and must therefore be thread-safe,
+                       such as a `BucketPool`
+        :param size: the number of worker threads
+        :param pool: an existing `ThreadPool` to use instead of creating one
+        """
+        self.bucket = bucket
+        self._own_pool = pool is None
+        if pool is None:
+            pool = ThreadPool(size)
+        self.pool = pool
+
+    @property
+    def name(self):
+        """The name of the wrapped bucket."""
+        return getattr(self.bucket, 'name', None)
+
+    def apply_async(self, func, *args, **kwargs):
+        """Call ``func(bucket, *args, **kwargs)`` in a worker thread.
+
+        :return: an `AsyncResult` for the return value of `func`
+        """
+        return self.pool.apply_async(func, (self.bucket,) + args, kwargs)
+
+    def close(self):
+        """Wait for pending operations to finish and stop the worker threads
+        of this adapter.
+        """
+        if self._own_pool:
+            self.pool.close()
+            self.pool.join()
+
+
+def async_bucket(db):
+    """Return `db` if it is an asynchronous bucket adapter, or wrap it in an
+    `AsyncBucket` that uses the shared thread pool.
+    """
+    global _shared_pool
+    if hasattr(db, 'apply_async'):
+        return db
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ThreadPool(DEFAULT_POOL_SIZE)
+    return AsyncBucket(db, pool=_shared_pool)
+
+
+def iter_result(result):
+    """Iterate over the items of the sequence returned by an `AsyncResult`."""
+    for item in result.get():
+        yield item
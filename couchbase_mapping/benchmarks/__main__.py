@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+"""Run the benchmarks, or compare the results of two runs.
+
+    python -m couchbase_mapping.benchmarks [-o results.json] [module ...]
+    python -m couchbase_mapping.benchmarks compare old.json new.json
+
+Without ``-o``, the results are reported as text. The comparison lists the
+times of both runs and exits with status 1 if any of them got slower by more
+than the threshold, 25% by default, as the shortest benchmarks vary that much
+between runs on a busy machine.
+"""
+
+import argparse
+import sys
+
+from couchbase_mapping.benchmarks import (benchutil, codegen, compression,
+                                          containers, dates, defaults,
+                                          designsync, dirty, fanout, fetch,
+                                          fields, finders, load, lookups,
+                                          memory, rows, serialization, store,
+                                          throughput, viewcache, views)
+
+MODULES = [
+    ('load', load),
+    ('store', store),
+    ('dirty', dirty),
+    ('compression', compression),
+    ('fields', fields),
+    ('containers', containers),
+    ('dates', dates),
+    ('codegen', codegen),
+    ('defaults', defaults),
+    ('memory', memory),
+    ('serialization', serialization),
+    ('rows', rows),
+    ('views', views),
+    ('fetch', fetch),
+    ('viewcache', viewcache),
+    ('fanout', fanout),
+    ('lookups', lookups),
+    ('finders', finders),
+    ('designsync', designsync),
+    ('throughput', throughput),
+]
+
+
+def run(names=None):
+    results = []
+    for name, module in MODULES:
+        if not names or name in names:
+            results.extend(module.run())
+    return results
+
+
+def main(args=None):
+    if args is None:
+        args = sys.argv[1:]
+    if not args or args[0] not in ('run', 'compare'):
+        args = ['run'] + list(args)
+    parser = argparse.ArgumentParser(
+        prog='python -m couchbase_mapping.benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    run_parser = commands.add_parser('run', help='run the benchmarks')
+    run_parser.add_argument('modules', nargs='*', metavar='module',
+                            help='the benchmark modules to run (all of them '
+                                 'by default)')
+    run_parser.add_argument('-o', '--output', metavar='FILE',
+                            help='write the results as JSON to FILE, or to '
+                                 'the standard output if FILE is -')
+    compare_parser = commands.add_parser(
+        'compare', help='compare the JSON results of two runs')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('-t', '--threshold', type=float,
+                                default=0.25,
+                                help='the relative slowdown from which a '
+                                     'result is a regression (default: 0.25)')
+    options = parser.parse_args(args)
+
+    if options.command == 'compare':
+        comparison = benchutil.compare(benchutil.load(options.baseline),
+                                       benchutil.load(options.current),
+                                       options.threshold)
+        benchutil.report_comparison(comparison)
+        return int(any(item['regression'] for item in comparison))
+
+    unknown = set(options.modules) - set(name for name, _ in MODULES)
+    if unknown:
+        run_parser.error('unknown modules: %s' % ', '.join(sorted(unknown)))
+    results = run(options.modules)
+    if options.output == '-':
+        benchutil.dump(results)
+    elif options.output:
+        with open(options.output, 'w') as out:
+            benchutil.dump(results, out)
+    else:
+        benchutil.report(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
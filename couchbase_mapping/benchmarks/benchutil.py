@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import json
+import platform
+import sys
+import timeit
+
+
+def measure(func, number=1, repeat=3):
+    """Return the best wall clock time, in seconds, of `repeat` runs of
+    `number` calls to `func`, divided by `number`.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def result(name, seconds=None, **extra):
+    extra['name'] = name
+    extra['seconds'] = seconds
+    return extra
+
+
+def report(results, out=sys.stdout):
+    for item in results:
+        extra = ', '.join('%s=%s' % (key, item[key]) for key in sorted(item)
+                          if key not in ('name', 'seconds'))
+        if item['seconds'] is None:
+            seconds = '%14s' % '-'
+        else:
+            seconds = '%12.3e s' % item['seconds']
+        out.write('%-40s %s  %s\n' % (item['name'], seconds, extra))
+
+
+def dump(results, out=sys.stdout):
+    """Write results as JSON, along with the Python version they were
+    measured with.
+    """
+    json.dump({'python': platform.python_version(),
+               'implementation': platform.python_implementation(),
+               'results': results}, out, indent=2, sort_keys=True)
+    out.write('\n')
+
+
+def load(path):
+    """Return the results written to the given file by `dump`."""
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def compare(baseline, current, threshold=0.25):
+    """Compare the times of the results of two runs.
+
+    :param baseline: the results of the reference run
+    :param current: the results of the run to check
+    :param threshold: the relative slowdown from which a result is flagged
+                      as a regression
+    :return: a list of dicts with the ``name``, ``baseline`` and ``current``
+             times of every result measured in both runs, the relative
+             ``change`` and whether it is a ``regression``, in the order of
+             `current`
+    """
+    before = dict((item['name'], item['seconds']) for item in baseline)
+    retval = []
+    for item in current:
+        old, new = before.get(item['name']), item['seconds']
+        if not old or new is None:
+            continue
+        change = new / old - 1
+        retval.append({'name': item['name'], 'baseline': old, 'current': new,
+                       'change': change, 'regression': change > threshold})
+    return retval
+
+
+def report_comparison(comparison, out=sys.stdout):
+    for item in comparison:
+        flag = '  REGRESSION' if item['regression'] else ''
+        out.write('%-40s %12.3e s %12.3e s  %+7.1f%%%s\n' % (
+            item['name'], item['baseline'], item['current'],
+            item['change'] * 100, flag))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+
+
+Item = mapping.Document.build(**dict(
+    [('text_%d' % i, mapping.TextField()) for i in range(10)] +
+    [('number_%d' % i, mapping.IntegerField(default=i)) for i in range(10)]
+))
+
+DATA = dict([('text_%d' % i, 'text %d' % i) for i in range(10)] +
+            [('number_%d' % i, i) for i in range(10)])
+
+
+def generic_init(self, **values):
+    self._pending_defaults = False
+    self._data = {}
+    for attrname, field in self._fields.items():
+        if field.name in values:
+            setattr(self, attrname, values.pop(field.name))
+        else:
+            setattr(self, attrname, getattr(self, attrname))
+
+
+def generic_from_json(cls, data, id=None, silent=False):
+    instance = cls()
+    data = data.copy()
+    for field_name, field in instance._fields.items():
+        value = data.pop(field.name, None)
+        if value is not None:
+            setattr(instance, field_name, field.from_json(value))
+    if data and not silent:
+        raise ValueError("Extraneous field %s present" % data.keys()[0])
+    instance.id = id
+    return instance
+
+
+class GenericItem(Item):
+    __init__ = generic_init
+    from_json = classmethod(generic_from_json)
+
+
+def run(count=1000):
+    results = []
+    for name, cls in [('generated', Item), ('generic', GenericItem)]:
+        def init():
+            for i in xrange(count):
+                cls(**DATA)
+
+        def from_json():
+            for i in xrange(count):
+                cls.from_json(DATA)
+
+        def wrap():
+            for i in xrange(count):
+                cls.wrap(DATA)
+        results.extend([
+            result('codegen.init.%s' % name, measure(init) / count),
+            result('codegen.from_json.%s' % name, measure(from_json) / count),
+            result('codegen.wrap.%s' % name, measure(wrap) / count),
+        ])
+    return results
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import compression, mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+
+
+class Log(mapping.Document):
+    lines = mapping.ListField(mapping.DictField())
+
+
+def document(size):
+    # Roughly `size` bytes of JSON, with the repetitive structure of a log
+    count = size // 80
+    return Log(id='log', lines=[{'level': 'info', 'time': 1369753800 + i,
+                                 'message': 'Request %d served in %d ms' %
+                                            (i, i % 997)}
+                                for i in range(count)])
+
+
+def run(sizes=(1024, 10 * 1024, 200 * 1024, 800 * 1024)):
+    results = []
+    for name in compression.names():
+        Compressed = type('Compressed', (Log,), {
+            '__compress_threshold__': 0,
+            '__compressor__': compression.find(name),
+        })
+        for size in sizes:
+            number = max(1, 100000 // size)
+            timings = []
+            for cls in (Log, Compressed):
+                db = MemoryBucket()
+                log = document(size)
+                log.__class__ = cls
+                store = measure(lambda: log.store(db), number=number)
+                load = measure(lambda: cls.load(db, 'log'), number=number)
+                timings.append((store + load, len(db.data['log'][1])))
+            (plain, raw), (compressed, packed) = timings
+            # Compression pays off below the bandwidth at which transferring
+            # the bytes it saves on a store and a load takes as long as it
+            # costs
+            extra = compressed - plain
+            if extra > 0:
+                breakeven = int(2 * (raw - packed) * 8 / extra / 1e6)
+            else:
+                breakeven = 'any'
+            results.append(result(
+                'compression.%s[%dK]' % (name, size // 1024), compressed,
+                plain_seconds='%.3e' % plain, bytes=raw,
+                compressed_bytes=packed,
+                ratio='%.2f' % (float(packed) / raw),
+                breakeven_mbps=breakeven))
+    return results
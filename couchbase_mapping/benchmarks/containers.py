@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+
+
+class Address(mapping.Mapping):
+    street = mapping.TextField()
+    city = mapping.TextField()
+
+
+class Company(mapping.Mapping):
+    name = mapping.TextField()
+    address = mapping.DictField(Address)
+
+
+class Person(mapping.Document):
+    tags = mapping.ListField(mapping.TextField())
+    employer = mapping.DictField(Company)
+
+
+def run(size=100, count=1000):
+    tags = ['tag-%d' % i for i in range(size)]
+    person = Person.wrap({'tags': tags, 'employer': {
+        'name': 'Acme', 'address': {'street': 'Main St', 'city': 'Springfield'}
+    }})
+    proxy = person.tags
+
+    def iterate():
+        for i in xrange(count):
+            for tag in proxy:
+                pass
+
+    def contains():
+        for i in xrange(count):
+            'tag-%d' % (size - 1) in proxy
+
+    def append():
+        proxy = Person(tags=[]).tags
+        for i in xrange(count):
+            proxy.append('tag')
+
+    def nested():
+        for i in xrange(count):
+            person.employer.address.city
+
+    return [
+        result('containers.list.iterate', measure(iterate) / count,
+               items=size),
+        result('containers.list.contains', measure(contains) / count,
+               items=size),
+        result('containers.list.append', measure(append) / count),
+        result('containers.dict.nested_read', measure(nested) / count),
+    ]
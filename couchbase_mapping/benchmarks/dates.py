@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime, time
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+
+
+# (name, field, canonical JSON value, value only strptime can parse,
+#  Python value)
+FIELDS = [
+    ('date', mapping.DateField(), '2013-05-28', '2013-5-28',
+     date(2013, 5, 28)),
+    ('datetime', mapping.DateTimeField(), '2013-05-28T15:10:00Z',
+     '2013-5-28T15:10:00Z', datetime(2013, 5, 28, 15, 10, 0, 1234)),
+    ('time', mapping.TimeField(), '15:10:00', '15:10:0',
+     time(15, 10, 0, 1234)),
+]
+
+
+def run(count=10000):
+    results = []
+    for name, field, value, unusual, python in FIELDS:
+        for label, arg, func in [('parse', value, field._to_python),
+                                 ('parse.fallback', unusual, field._to_python),
+                                 ('format', python, field._to_json)]:
+            def loop():
+                for i in xrange(count):
+                    func(arg)
+            seconds = measure(loop) / count
+            results.append(result('dates.%s.%s' % (name, label), seconds,
+                                  per_second=int(1 / seconds)))
+    return results
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import json
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+
+
+def fields():
+    return dict(
+        [('text_%d' % i, mapping.TextField()) for i in range(20)] +
+        [('number_%d' % i, mapping.IntegerField(default=i))
+         for i in range(20)] +
+        [('dict_%d' % i, mapping.DictField()) for i in range(10)] +
+        [('list_%d' % i, mapping.ListField(mapping.TextField()))
+         for i in range(10)])
+
+
+EagerItem = type('EagerItem', (mapping.Document,), fields())
+LazyItem = type('LazyItem', (mapping.Document,),
+                dict(fields(), __lazy_defaults__=True))
+
+VALUES = {'text_0': 'foo', 'number_0': 42}
+
+
+def run(count=1000):
+    results = []
+    for name, cls in [('eager', EagerItem), ('lazy', LazyItem)]:
+        def init():
+            for i in xrange(count):
+                cls(**VALUES)
+
+        def init_store():
+            for i in xrange(count):
+                json.dumps(cls(**VALUES).unwrap())
+        results.extend([
+            result('defaults.init.%s' % name, measure(init) / count),
+            result('defaults.init_store.%s' % name,
+                   measure(init_store) / count),
+        ])
+    return results
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.design import MANIFEST_KEY, ViewDefinition
+from couchbase_mapping.memory import MemoryBucket
+
+
+def run(designs=40, views=5, latency=0.005):
+    db = MemoryBucket(latency=latency)
+    definitions = [ViewDefinition('design_%d' % i, 'view_%d' % j,
+                                  'function(doc) { emit(doc.field_%d); }' % j)
+                   for i in range(designs) for j in range(views)]
+    ViewDefinition.sync_many(db, definitions, manifest_key=MANIFEST_KEY)
+
+    def full():
+        ViewDefinition.sync_many(db, definitions)
+
+    def manifest():
+        ViewDefinition.sync_many(db, definitions, manifest_key=MANIFEST_KEY)
+
+    return [
+        result('designsync.full', measure(full), designs=designs,
+               latency=latency),
+        result('designsync.manifest', measure(manifest), designs=designs,
+               latency=latency),
+    ]
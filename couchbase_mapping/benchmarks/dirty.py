@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+
+
+class Item(mapping.Document):
+    __track_changes__ = True
+    name = mapping.TextField()
+    count = mapping.IntegerField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+def run(count=1000, latency=0.0005):
+    db = MemoryBucket(latency=latency)
+    Item(id='item', name='item', count=1, tags=['a', 'b']).store(db)
+    item = Item.load(db, 'item')
+    plain = Item(name='item', count=1, tags=['a', 'b'])
+
+    def write_loaded():
+        for i in xrange(count):
+            item.count = i
+
+    def write_new():
+        for i in xrange(count):
+            plain.count = i
+
+    item.count = 1
+
+    def is_dirty():
+        for i in xrange(count):
+            item.is_dirty
+
+    def store_unchanged():
+        for i in xrange(100):
+            item.store(db)
+
+    def store_only_if_dirty():
+        for i in xrange(100):
+            item.store(db, only_if_dirty=True)
+
+    return [
+        result('dirty.field_write.loaded', measure(write_loaded) / count),
+        result('dirty.field_write.new', measure(write_new) / count),
+        result('dirty.is_dirty', measure(is_dirty) / count),
+        result('dirty.store_unchanged', measure(store_unchanged) / 100,
+               latency=latency),
+        result('dirty.store_only_if_dirty', measure(store_only_if_dirty) / 100,
+               latency=latency),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.design import ViewDefinition
+from couchbase_mapping.pool import BucketPool
+from couchbase_mapping.tests.testutil import RowsBucket
+
+ROWS = [{'id': 'item-%d' % i, 'key': i,
+         'value': {'number': i, 'name': 'Item %d' % i}} for i in range(20)]
+
+
+class Item(mapping.Document):
+    number = mapping.IntegerField()
+    name = mapping.TextField()
+
+
+def run(count=8, latency=0.005):
+    db = BucketPool(lambda: RowsBucket(ROWS, latency=latency), size=count)
+    views = [ViewDefinition('items', 'view_%d' % i, 'function(doc) {}',
+                            wrapper=Item._wrap_row) for i in range(count)]
+
+    def sequential():
+        for view in views:
+            view(db, limit=10)
+
+    def query_many():
+        ViewDefinition.query_many(db, [(view, {'limit': 10})
+                                       for view in views], max_workers=count)
+
+    return [
+        result('fanout.sequential', measure(sequential), queries=count,
+               latency=latency),
+        result('fanout.query_many', measure(query_many), queries=count,
+               latency=latency),
+    ]
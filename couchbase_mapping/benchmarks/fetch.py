@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.tests.testutil import RowsBucket
+
+VIEW = '_design/items/_view/by_number'
+
+
+class Item(mapping.Document):
+    number = mapping.IntegerField()
+    name = mapping.TextField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+class IncludeDocsBucket(RowsBucket):
+    """`RowsBucket` that also emulates the ``include_docs`` option."""
+
+    def view(self, viewname, **options):
+        rows = RowsBucket.view(self, viewname, **options)
+        if options.get('include_docs'):
+            rows = [dict(row, doc={'json': self.data[row['id']][1]})
+                    for row in rows]
+        return rows
+
+
+def run(count=1000, page_size=100, latency=0.0005, work=0.00002):
+    db = IncludeDocsBucket([{'id': 'item-%05d' % i, 'key': i, 'value': None}
+                            for i in range(count)], latency=latency)
+    for i in range(count):
+        Item(id='item-%05d' % i, number=i, name='Item %d' % i,
+             tags=['a', 'b', 'c']).store(db)
+
+    def consume(items):
+        # Simulate some processing of every document
+        for item in items:
+            time.sleep(work)
+
+    def load_rows():
+        consume(Item.load(db, row['id'])
+                for row in db.view(VIEW, include_docs=False))
+
+    def include_docs():
+        consume(Item.iterview(db, VIEW, page_size=page_size,
+                              include_docs=True))
+
+    def fetch_docs():
+        consume(Item.iterview(db, VIEW, page_size=page_size,
+                              fetch_docs=True))
+
+    def prefetch():
+        consume(Item.iterview(db, VIEW, page_size=page_size,
+                              fetch_docs=True, prefetch=True))
+
+    results = []
+    for name, func in [('load', load_rows), ('include_docs', include_docs),
+                       ('fetch_docs', fetch_docs), ('prefetch', prefetch)]:
+        db.calls = 0
+        seconds = measure(func)
+        results.append(result('fetch.%s' % name, seconds, docs=count,
+                              latency=latency, requests=db.calls // 3))
+    return results
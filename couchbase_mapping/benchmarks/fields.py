@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+
+
+FIELDS = [
+    ('text', mapping.TextField, 'Foo bar', u'Foo bar'),
+    ('float', mapping.FloatField, 3.14, 3.14),
+    ('integer', mapping.IntegerField, 42, 42),
+    ('long', mapping.LongField, 9999999999999999999L, 9999999999999999999L),
+    ('boolean', mapping.BooleanField, True, True),
+    ('decimal', mapping.DecimalField, '3.14159265358979323846',
+     Decimal('3.14159265358979323846')),
+    ('date', mapping.DateField, '2013-05-28', date(2013, 5, 28)),
+    ('datetime', mapping.DateTimeField, '2013-05-28T15:10:00Z',
+     datetime(2013, 5, 28, 15, 10)),
+    ('time', mapping.TimeField, '15:10:00', time(15, 10)),
+    ('dict', lambda memoize: mapping.DictField(
+        mapping.Mapping.build(name=mapping.TextField()), memoize=memoize),
+     {'name': 'Jane Doe'}, {'name': 'Jane Doe'}),
+    ('list', lambda memoize: mapping.ListField(mapping.TextField(),
+                                               memoize=memoize),
+     ['a', 'b', 'c'], ['a', 'b', 'c']),
+]
+
+
+def run(reads=1000):
+    results = []
+    for name, field, value, python_value in FIELDS:
+        for memoize in (False, True):
+            Doc = mapping.Document.build(value=field(memoize=memoize))
+            doc = Doc.wrap({'value': value})
+
+            def read():
+                for i in xrange(reads):
+                    doc.value
+            results.append(result('fields.read.%s%s' % (
+                name, '.memoized' if memoize else ''),
+                measure(read) / reads))
+
+        def write():
+            for i in xrange(reads):
+                doc.value = python_value
+        results.append(result('fields.write.%s' % name,
+                              measure(write) / reads))
+    return results
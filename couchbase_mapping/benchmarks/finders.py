@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.benchmarks.lookups import KeysBucket
+
+
+class Item(mapping.Document):
+    number = mapping.IntegerField(index=True)
+    name = mapping.TextField()
+
+
+def run(count=1000, latency=0.0005):
+    db = KeysBucket()
+    for i in xrange(count):
+        Item(id='item-%d' % i, number=i, name='Item %d' % i).store(db)
+    db.latency = latency
+    values = range(count)
+
+    def find():
+        for value in values:
+            Item.find_by_number(db, value)
+
+    def find_many():
+        Item.find_by_number_many(db, values)
+
+    return [
+        result('finders.find', measure(find, repeat=1), values=count,
+               latency=latency),
+        result('finders.find_many', measure(find_many), values=count,
+               latency=latency),
+    ]
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+from couchbase_mapping.pool import BucketPool
+
+
+class Item(mapping.Document):
+    name = mapping.TextField()
+    count = mapping.IntegerField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+class LazyItem(Item):
+    __lazy_load__ = True
+
+
+class ClientBucket(MemoryBucket):
+    """Bucket without a multi-get, like the `Bucket` of the client."""
+
+    get_multi = None
+
+
+def run(count=200, latency=0.0005, connections=10):
+    db = MemoryBucket(latency=latency)
+    ids = ['item-%d' % i for i in range(count)]
+    for id in ids:
+        Item(id=id, name=id, count=1).store(db)
+    client = ClientBucket(latency=latency)
+    client.data = db.data
+    pool = BucketPool(lambda: client, size=connections)
+
+    def load_loop():
+        return [Item.load(db, id) for id in ids]
+
+    def load_many():
+        return Item.load_many(db, ids)
+
+    def load_many_client():
+        return Item.load_many(client, ids)
+
+    def load_many_pool():
+        return Item.load_many(pool, ids)
+
+    # Only `MemoryBucket` has a multi-get; with the client, `load_many` gets
+    # the documents one at a time, or over several connections with a pool
+    results = [
+        result('load.loop', measure(load_loop), docs=count, latency=latency),
+        result('load.load_many', measure(load_many), docs=count,
+               latency=latency, bucket='memory'),
+        result('load.load_many.client', measure(load_many_client),
+               docs=count, latency=latency, bucket='client'),
+        result('load.load_many.pool', measure(load_many_pool), docs=count,
+               latency=latency, bucket='client', connections=connections),
+    ]
+
+    # Forwarding the JSON of documents without reading their fields
+    db = MemoryBucket()
+    for id in ids:
+        Item(id=id, name=id, count=1, tags=['tag-%d' % i for i in range(50)]
+             ).store(db)
+    for name, cls in [('eager', Item), ('lazy', LazyItem)]:
+        def pass_through():
+            return [doc.raw_json() for doc in cls.load_many(db, ids)]
+        results.append(result('load.pass_through.%s' % name,
+                              measure(pass_through), docs=count))
+    return results
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+import json
+from urllib import unquote_plus
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+
+
+class KeysBucket(MemoryBucket):
+    """Serves a view with one row per integer key, computed on the fly."""
+
+    def view(self, viewname, **options):
+        self._round_trip('view')
+        if 'keys' in options:
+            keys = json.loads(unquote_plus(options['keys']))
+        else:
+            keys = [options['key']]
+        return [{'id': 'item-%d' % key, 'key': key,
+                 'value': {'number': key, 'name': 'Item %d' % key}}
+                for key in keys]
+
+
+class Item(mapping.Document):
+    number = mapping.IntegerField()
+    name = mapping.TextField()
+    by_number = mapping.ViewField('items', 'function(doc) {}')
+
+
+def run(sizes=(1000, 10000, 100000), per_key_size=1000, latency=0.0005):
+    db = KeysBucket(latency=latency)
+
+    def per_key():
+        for key in xrange(per_key_size):
+            Item.by_number(db, key=key)
+
+    results = [result('lookups.per_key', measure(per_key, repeat=1),
+                      keys=per_key_size, latency=latency)]
+    for size in sizes:
+        keys = range(size)
+        results.append(result(
+            'lookups.lookup_many[%d]' % size,
+            measure(lambda: Item.by_number.lookup_many(db, keys), repeat=1),
+            keys=size, latency=latency))
+    return results
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import gc
+import sys
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import result
+from couchbase_mapping.memory import MemoryBucket
+
+
+class Legacy(object):
+    """Instance layout of documents before they used slots."""
+
+    def __init__(self, data, id):
+        self._data = data
+        self.id = id
+
+
+class Item(mapping.Document):
+    name = mapping.TextField()
+    count = mapping.IntegerField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+class SlottedItem(mapping.Document):
+    __slots__ = ()
+    name = mapping.TextField()
+    count = mapping.IntegerField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+class TrackedItem(mapping.Document):
+    __slots__ = ()
+    __track_changes__ = True
+    name = mapping.TextField()
+    count = mapping.IntegerField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+def sizeof(obj):
+    """Return the size of an instance, including its instance dictionary if
+    it has one and the JSON it keeps to track changes, but not the data it
+    refers to.
+    """
+    size = sys.getsizeof(obj) + sum(
+        sys.getsizeof(ref) for ref in gc.get_referents(obj)
+        if isinstance(ref, dict) and ref is not obj._data
+    )
+    stored = getattr(obj, '_stored', None)
+    if stored is not None:
+        size += sys.getsizeof(stored)
+    return size
+
+
+def deep_sizeof(obj):
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key) + deep_sizeof(value)
+                    for key, value in obj.items())
+    elif isinstance(obj, list):
+        size += sum(deep_sizeof(item) for item in obj)
+    return size
+
+
+def run():
+    data = {'name': 'item', 'count': 1, 'tags': ['a', 'b']}
+    data_size = deep_sizeof(data)
+    db = MemoryBucket()
+    Item(id='item', **data).store(db)
+    results = []
+    for name, instance in [('legacy', Legacy(data, 'item')),
+                           ('document', Item.wrap(data, id='item')),
+                           ('slotted', SlottedItem.wrap(data, id='item')),
+                           ('loaded', SlottedItem.load(db, 'item')),
+                           ('loaded.tracked', TrackedItem.load(db, 'item'))]:
+        size = sizeof(instance)
+        results.append(result('memory.%s' % name, bytes=size,
+                              bytes_with_data=size + data_size))
+    return results
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+
+
+class Item(mapping.Document):
+    number = mapping.IntegerField()
+    name = mapping.TextField()
+    tags = mapping.ListField(mapping.TextField())
+
+
+def run(count=1000):
+    db = MemoryBucket()
+    for i in xrange(count):
+        Item(id='item-%d' % i, number=i, name='Item %d' % i,
+             tags=['a', 'b']).store(db)
+    db.register_view('items', 'by_number',
+                     lambda doc, meta: [(doc['number'], doc)])
+    viewname = '_design/items/_view/by_number'
+    # Build the index before measuring
+    db.view(viewname)
+
+    results = []
+    for name, options in [('value', {}), ('include_docs',
+                                          {'include_docs': True})]:
+        rows = db.view(viewname, **options)
+        results.append(result('rows.wrap.%s' % name,
+                              measure(lambda: [Item._wrap_row(row)
+                                               for row in rows]) / count))
+        results.append(result('rows.view.%s' % name,
+                              measure(lambda: Item.view(db, viewname,
+                                                        **options)) / count,
+                              rows=count))
+    return results
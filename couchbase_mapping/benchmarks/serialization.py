@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import codec
+from couchbase_mapping.benchmarks.benchutil import measure, result
+
+
+def document(size):
+    return {
+        'title': u'Document of size %d' % size,
+        'published': True,
+        'rating': 4.5,
+        'tags': ['tag-%d' % i for i in range(size)],
+        'comments': [{'author': u'user-%d' % i, 'votes': i,
+                      'text': u'Comment number %d ☃' % i}
+                     for i in range(size)],
+    }
+
+
+DOCUMENTS = [('small', document(1)), ('medium', document(20)),
+             ('large', document(500))]
+
+
+def run(count=200):
+    results = []
+    for name in codec.names():
+        dumps, loads = codec.find(name).dumps, codec.find(name).loads
+        for size, doc in DOCUMENTS:
+            encoded = dumps(doc)
+
+            def encode():
+                for i in xrange(count):
+                    dumps(doc)
+
+            def decode():
+                for i in xrange(count):
+                    loads(encoded)
+            results.extend([
+                result('serialization.dumps.%s.%s' % (name, size),
+                       measure(encode) / count, bytes=len(encoded)),
+                result('serialization.loads.%s.%s' % (name, size),
+                       measure(decode) / count, bytes=len(encoded)),
+            ])
+    return results
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+from couchbase_mapping.pool import BucketPool
+
+
+class Item(mapping.Document):
+    name = mapping.TextField()
+    count = mapping.IntegerField()
+
+
+class ClientBucket(MemoryBucket):
+    """Bucket without a multi-set, like the `Bucket` of the client."""
+
+    set_multi = None
+
+
+def run(count=1000, latency=0.0005, chunk_sizes=(1, 10, 100, 1000),
+        connections=10):
+    db = MemoryBucket(latency=latency)
+    items = [Item(name='item-%d' % i, count=i) for i in range(count)]
+
+    def store_loop():
+        for item in items:
+            item.store(db)
+
+    results = [result('store.loop', measure(store_loop), docs=count,
+                      latency=latency)]
+    for chunk_size in chunk_sizes:
+        seconds = measure(lambda: Item.store_many(db, items,
+                                                  chunk_size=chunk_size))
+        results.append(result('store.store_many[%d]' % chunk_size, seconds,
+                              docs=count, latency=latency, bucket='memory',
+                              docs_per_second=int(count / seconds)))
+
+    # Only `MemoryBucket` has a multi-set; with the client, `store_many` sets
+    # the documents one at a time, or over several connections with a pool
+    client = ClientBucket(latency=latency)
+    pool = BucketPool(lambda: client, size=connections)
+    for name, bucket, size in [('client', client, 1),
+                               ('pool', pool, connections)]:
+        seconds = measure(lambda: Item.store_many(bucket, items))
+        results.append(result('store.store_many.%s' % name, seconds,
+                              docs=count, latency=latency, bucket='client',
+                              connections=size,
+                              docs_per_second=int(count / seconds)))
+    return results
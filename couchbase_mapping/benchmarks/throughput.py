@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.memory import MemoryBucket
+
+
+class Person(mapping.Document):
+    name = mapping.TextField()
+    age = mapping.IntegerField(index=True)
+
+
+def run(count=500, latency=0.0002, jitter=0.0001, seed=0):
+    db = MemoryBucket(latency=latency, jitter=jitter, seed=seed)
+    db.register_view('person', 'by_age',
+                     lambda doc, meta: [(doc['age'], None)])
+    people = [Person(id='person-%d' % i, name='Person %d' % i, age=i % 50)
+              for i in range(count)]
+
+    def store():
+        for person in people:
+            person.store(db)
+
+    def load():
+        for person in people:
+            Person.load(db, person.id)
+
+    def find():
+        for age in range(50):
+            Person.find_by_age(db, age)
+
+    results = []
+    for name, func, operations in [('store', store, count),
+                                   ('load', load, count),
+                                   ('find', find, 50)]:
+        seconds = measure(func)
+        results.append(result('throughput.%s' % name, seconds / operations,
+                              ops_per_second=int(operations / seconds),
+                              latency=latency, jitter=jitter))
+    return results
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import measure, result
+from couchbase_mapping.cache import LRUCache
+from couchbase_mapping.tests.testutil import RowsBucket
+
+
+def item_class(cache):
+    class Item(mapping.Document):
+        number = mapping.IntegerField()
+        name = mapping.TextField()
+        by_number = mapping.ViewField('items', 'function(doc) {}',
+                                      cache=cache)
+    return Item
+
+
+def run(rows=100, queries=100, latency=0.002):
+    db = RowsBucket([{'id': 'item-%d' % i, 'key': i,
+                      'value': {'number': i, 'name': 'Item %d' % i}}
+                     for i in range(rows)], latency=latency)
+    results = []
+    for name, cache in [('uncached', None), ('cached', LRUCache(ttl=60))]:
+        Item = item_class(cache)
+
+        def query():
+            for i in xrange(queries):
+                Item.by_number(db, limit=rows)
+        results.append(result('viewcache.%s' % name,
+                              measure(query) / queries, rows=rows,
+                              latency=latency))
+    return results
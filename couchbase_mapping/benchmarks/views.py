@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+import os
+import resource
+import time
+
+from couchbase_mapping import mapping
+from couchbase_mapping.benchmarks.benchutil import result
+
+
+class Item(mapping.Document):
+    number = mapping.IntegerField()
+    name = mapping.TextField()
+
+
+class GeneratedViewBucket(object):
+    """Bucket serving a view of `count` rows that are generated on demand, so
+    that the bucket itself takes no memory.
+    """
+
+    def __init__(self, count):
+        self.count = count
+
+    def view(self, viewname, **options):
+        start = 0
+        if 'start_key' in options:
+            start = options['start_key']
+        stop = self.count
+        if options.get('limit') is not None:
+            stop = min(stop, start + options['limit'])
+        return [{'id': 'item-%07d' % i, 'key': i,
+                 'value': {'number': i, 'name': 'Item %d' % i}}
+                for i in xrange(start, stop)]
+
+
+def peak_memory(func):
+    """Run `func` in a child process, and return the time it took and the
+    growth of the peak resident set size of the child, in bytes.
+    """
+    read, write = os.pipe()
+    pid = os.fork()
+    if not pid:
+        os.close(read)
+        before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.time()
+        func()
+        seconds = time.time() - start
+        growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+        os.write(write, '%r %d' % (seconds, growth * 1024))
+        os._exit(0)
+    os.close(write)
+    output = os.read(read, 100)
+    os.close(read)
+    os.waitpid(pid, 0)
+    seconds, growth = output.split()
+    return float(seconds), int(growth)
+
+
+def run(count=1000000, page_sizes=(100, 1000)):
+    db = GeneratedViewBucket(count)
+
+    def scan_list():
+        for item in Item.view(db, '_design/items/_view/by_number'):
+            pass
+
+    results = []
+    seconds, growth = peak_memory(scan_list)
+    results.append(result('views.scan.view', seconds, rows=count,
+                          peak_bytes=growth))
+    for page_size in page_sizes:
+        def scan_pages():
+            for item in Item.iterview(db, '_design/items/_view/by_number',
+                                      page_size=page_size):
+                pass
+        seconds, growth = peak_memory(scan_pages)
+        results.append(result('views.scan.iterview[%d]' % page_size, seconds,
+                              rows=count, peak_bytes=growth))
+    return results
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+"""Client-side caching of documents.
+
+A `Document` subclass opts into caching by setting its ``__cache__``
+attribute to a cache instance:
+
+>>> from couchbase_mapping import Document, TextField
+>>> class Account(Document):
+...     __cache__ = LRUCache(maxsize=50000, ttl=30)
+...     owner = TextField()
+
+`Document.load` then serves documents from the cache when possible, and
+`Document.store` writes through to it. Entries are keyed by bucket name and
+document ID, so one cache can serve several buckets; documents of a bucket
+without a ``name`` are not cached. The cache holds the encoded JSON of the
+documents, so every load returns a fresh copy that can be modified without
+affecting the cached entry.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+import time
+
+__all__ = ['LRUCache']
+__docformat__ = 'restructuredtext en'
+
+# Memcached treats expiration values above 30 days as absolute timestamps
+MAX_RELATIVE_EXPIRATION = 60 * 60 * 24 * 30
+
+
+class LRUCache(object):
+    """Thread-safe cache that discards the least recently used entries once
+    it grows beyond `maxsize` entries.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set('a', '{}')
+    >>> cache.set('b', '{}')
+    >>> cache.get('a')
+    '{}'
+    >>> cache.set('c', '{}')
+    >>> print cache.get('b')
+    None
+    >>> cache.hits, cache.misses, cache.evictions
+    (1, 1, 1)
+    """
+
+    def __init__(self, maxsize=1000, ttl=None):
+        """Initialize the cache.
+
+        :param maxsize: the maximum number of entries
+        :param ttl: the number of seconds after which entries expire, or
+                    `None` to keep them until they are evicted
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the value cached for `key`, or `None` if there is no such
+        entry or it has expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or (entry[1] is not None and
+                                 entry[1] <= time.time()):
+                self.misses += 1
+                return None
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, expiration=0):
+        """Cache `value` for `key`.
+
+        :param expiration: the expiration the value was stored with in the
+                           bucket; the entry never outlives the stored item
+        """
+        now = time.time()
+        deadline = None
+        if self.ttl is not None:
+            deadline = now + self.ttl
+        if expiration:
+            if expiration <= MAX_RELATIVE_EXPIRATION:
+                expiration += now
+            deadline = min(deadline or expiration, expiration)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, deadline)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove the entry for `key`, if any."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Remove all entries."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+
+"""Pluggable encoding and decoding of documents.
+
+Documents are encoded and decoded with the standard library `json` module
+unless another codec is selected, either for the whole process:
+
+>>> use('simplejson')                                        #doctest: +SKIP
+
+or for a single `Document` subclass, through its ``__codec__`` attribute:
+
+>>> from couchbase_mapping import Document, TextField
+>>> class Person(Document):
+...     __codec__ = find('simplejson')
+...     name = TextField()
+
+Codecs are looked up by name among the ones registered with `register`.
+Codecs for optional libraries such as ``simplejson`` are only registered when
+the library can be imported, and `find` and `use` fall back to the standard
+library when none of the requested codecs is available. That way the same
+code runs with or without the faster implementation installed:
+
+>>> find('no-such-codec').name
+'json'
+
+Besides JSON, documents can be stored in a compact binary format, which is
+faster to encode and decode:
+
+>>> class Session(Document):
+...     __codec__ = find('msgpack', 'marshal')
+...     user = TextField()
+>>> session = Session(user='joe')
+>>> Session.from_json(Session._codec().dumps(session.unwrap())).user
+u'joe'
+
+Binary codecs are marked in the item flags, so that `Document.load` can also
+read the documents of such a class that were stored as JSON. Couchbase views
+cannot read binary documents, so declaring views or indexed fields on a
+`Document` subclass with a binary codec raises a `TypeError`, and `use` does
+not accept binary codecs as the default.
+
+``marshal`` is always available, and ``msgpack`` is registered when it can be
+imported. Both preserve the distinction between `str` and `unicode`, so
+documents come back exactly as they were stored. As the ``marshal`` format is
+specific to Python, it is only suitable for documents that no other program
+reads.
+
+The bits of `FLAGS_MASK` are reserved to mark binary codecs in the item flags,
+and cannot be set in the ``flags`` passed to `Document.store`. They lie
+outside the top byte that Couchbase SDKs use for the format of items, and are
+only interpreted for the classes that have a binary codec.
+"""
+
+import json
+import marshal
+
+__all__ = ['Codec', 'FLAGS_MASK', 'register', 'find', 'use', 'get_default',
+           'for_flags', 'names']
+__docformat__ = 'restructuredtext en'
+
+FLAGS_MASK = 0x000F0000
+
+
+class Codec(object):
+    """A named pair of functions converting between Python data structures
+    and JSON strings, or strings in a binary format.
+    """
+
+    def __init__(self, name, dumps, loads, flag=0):
+        """Initialize the codec.
+
+        :param name: the name under which the codec is registered
+        :param dumps: a function encoding a Python value as a string
+        :param loads: a function decoding a string
+        :param flag: the value marking items encoded with the codec, within
+                     the bits of `FLAGS_MASK`, or 0 for JSON codecs
+        """
+        if flag & ~FLAGS_MASK:
+            raise ValueError('Invalid codec flag %#x' % flag)
+        self.name = name
+        self.dumps = dumps
+        self.loads = loads
+        self.flag = flag
+
+    @property
+    def binary(self):
+        """Whether the codec produces a binary format rather than JSON."""
+        return bool(self.flag)
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+
+_registry = {}
+_by_flag = {}
+_default = None
+
+
+def register(name, dumps, loads, flag=0):
+    """Register a codec under the given name, replacing any codec previously
+    registered under that name, or for binary codecs, with that flag.
+
+    :return: the new `Codec`
+    """
+    codec = _registry[name] = Codec(name, dumps, loads, flag)
+    if flag:
+        _by_flag[flag] = codec
+    return codec
+
+
+def find(*names):
+    """Return the first of the named codecs that is registered, or the
+    standard library codec if there is none.
+    """
+    for name in names:
+        if name in _registry:
+            return _registry[name]
+    return _registry['json']
+
+
+def use(*names):
+    """Select the codec used by documents that do not specify one, as the
+    first of the named codecs that is registered, or the standard library
+    codec if there is none.
+
+    Binary codecs can only be selected per class, through ``__codec__``, as
+    documents stored with them cannot be indexed by views.
+
+    :return: the selected `Codec`
+    :raise ValueError: if the selected codec is a binary codec
+    """
+    global _default
+    selected = find(*names)
+    if selected.binary:
+        raise ValueError('Binary codec %r cannot be the default codec' %
+                         selected.name)
+    _default = selected
+    return _default
+
+
+def get_default():
+    """Return the codec used by documents that do not specify one."""
+    return _default
+
+
+def for_flags(flags):
+    """Return the codec to decode an item with the given flags: the binary
+    codec marked in them, or for other items, which are read as JSON, the
+    default codec.
+    """
+    return _by_flag.get(flags & FLAGS_MASK, _default)
+
+
+def names():
+    """Return the sorted names of the registered codecs."""
+    return sorted(_registry)
+
+
+register('json', json.dumps, json.loads)
+use('json')
+
+try:
+    import simplejson
+except ImportError:
+    pass
+else:
+    register('simplejson', simplejson.dumps, simplejson.loads)
+
+register('marshal', marshal.dumps, marshal.loads, 0x00010000)
+
+try:
+    import msgpack
+except ImportError:
+    pass
+else:
+    register('msgpack', lambda value: msgpack.packb(value, use_bin_type=True),
+             lambda value: msgpack.unpackb(value, raw=False), 0x00020000)
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""Transparent compression of large documents.
+
+A `Document` subclass opts into compression by setting its
+``__compress_threshold__`` attribute to a size in bytes. `Document.store` then
+compresses the encoded documents of at least that size, and marks the
+compressor used in the item flags. `Document.load` decompresses the values
+marked that way, for the classes that enable compression:
+
+>>> from couchbase_mapping import Document, ListField, TextField
+>>> class Log(Document):
+...     __compress_threshold__ = 16 * 1024
+...     __compressor__ = find('snappy')
+...     lines = ListField(TextField())
+
+Compressors are looked up by name among the ones registered with `register`.
+``zlib`` is always available, and ``snappy`` is registered when the
+``python-snappy`` library can be imported. `find` falls back to ``zlib``:
+
+>>> find('no-such-compressor').name
+'zlib'
+
+Compressed documents are stored as binary values, which Couchbase views do
+not index, so compression should only be enabled for classes that are not
+queried through views.
+
+The bits of `FLAGS_MASK` are reserved to mark compression in the item flags,
+and cannot be set in the ``flags`` passed to `Document.store`. They lie
+outside the top byte that Couchbase SDKs use for the format of items, and
+items with no registered compressor marked in them are read as they are.
+"""
+
+import zlib
+
+__all__ = ['Compressor', 'FLAGS_MASK', 'register', 'find', 'for_flags',
+           'names']
+__docformat__ = 'restructuredtext en'
+
+FLAGS_MASK = 0x00F00000
+
+
+class Compressor(object):
+    """A named pair of functions compressing and decompressing strings, with
+    the value it is marked with in the item flags.
+    """
+
+    def __init__(self, name, flag, compress, decompress):
+        """Initialize the compressor.
+
+        :param name: the name under which the compressor is registered
+        :param flag: the value marking items compressed with it, within the
+                     bits of `FLAGS_MASK`
+        :param compress: a function compressing a string
+        :param decompress: a function decompressing a string
+        """
+        if not flag or flag & ~FLAGS_MASK:
+            raise ValueError('Invalid compression flag %#x' % flag)
+        self.name = name
+        self.flag = flag
+        self.compress = compress
+        self.decompress = decompress
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, self.name)
+
+
+_registry = {}
+_by_flag = {}
+
+
+def register(name, flag, compress, decompress):
+    """Register a compressor under the given name, replacing any compressor
+    previously registered under that name or with that flag.
+
+    :return: the new `Compressor`
+    """
+    compressor = Compressor(name, flag, compress, decompress)
+    _registry[name] = _by_flag[flag] = compressor
+    return compressor
+
+
+def find(*names):
+    """Return the first of the named compressors that is registered, or the
+    ``zlib`` compressor if there is none.
+    """
+    for name in names:
+        if name in _registry:
+            return _registry[name]
+    return _registry['zlib']
+
+
+def for_flags(flags):
+    """Return the compressor marked in the given item flags, or `None` if the
+    item is not compressed or the flags mark no registered compressor.
+    """
+    return _by_flag.get(flags & FLAGS_MASK)
+
+
+def names():
+    """Return the sorted names of the registered compressors."""
+    return sorted(_registry)
+
+
+register('zlib', 0x00100000, zlib.compress, zlib.decompress)
+
+try:
+    import snappy
+except ImportError:
+    pass
+else:
+    register('snappy', 0x00200000, snappy.compress, snappy.decompress)
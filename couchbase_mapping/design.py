@@ -9,13 +9,24 @@
 """Utility code for managing design documents."""
 
 from copy import deepcopy
+import hashlib
 from itertools import groupby
+import json
 from operator import attrgetter
 from textwrap import dedent
+from threading import Lock
+from urllib import quote
 
-__all__ = ['ViewDefinition']
+from couchbase_mapping.asynchronous import (DEFAULT_POOL_SIZE, async_bucket,
+                                            iter_result)
+
+__all__ = ['ViewDefinition', 'LookupBatch']
 __docformat__ = 'restructuredtext en'
 
+# A key for the manifest of design document fingerprints, for applications
+# that opt into it; see `ViewDefinition.sync_many`
+MANIFEST_KEY = '_couchbase_mapping/design-manifest'
+
 
 class ViewDefinition(object):
     r"""Definition of a view stored in a specific design document.
@@ -60,10 +71,38 @@ class ViewDefinition(object):
     * All views are written in JavaScript. Python view server is not supported.
     * `ViewDefinition#__call__()` returns a `list` instead of `ViewResults`.
     * `ViewDefinition#get_doc()` returns a `DesignDoc` instead of `Document`.
+
+    Results can be cached on the client by passing a cache such as
+    `couchbase_mapping.cache.LRUCache` to the constructor. Calls with the same
+    options are then answered from the cache until the entry expires or is
+    evicted, except when the ``stale`` option is ``false``, which asks for
+    up-to-date results:
+
+    >>> from couchbase_mapping.cache import LRUCache
+    >>> view = ViewDefinition('tests', 'all', 'function(doc) {}',
+    ...                       cache=LRUCache(maxsize=100, ttl=5))
+
+    The cache holds the raw rows, so every call wraps them anew and callers do
+    not share the resulting objects. Entries are keyed by the name of the
+    bucket, and the results of a bucket without a ``name`` are not cached.
+
+    Rows for many keys are best fetched with `lookup_many()`, which sends the
+    keys in chunks through the ``keys`` option rather than querying the view
+    once per key, and returns the rows of each key in the order requested:
+
+    >>> rows_per_key = view.lookup_many(db, ['a', 'b', 'a'])   #doctest: +SKIP
+
+    Code that looks keys up one at a time can use a `LookupBatch`, which defers
+    the lookups until the results of one of them are needed, and then executes
+    all pending lookups together:
+
+    >>> with view.batch(db) as batch:                          #doctest: +SKIP
+    ...     pending = [batch.lookup(key) for key in ('a', 'b')]
+    >>> pending[0].get()                                       #doctest: +SKIP
     """
 
     def __init__(self, design, name, map_fun, reduce_fun=None,
-                 wrapper=None, options=None, **defaults):
+                 wrapper=None, options=None, cache=None, **defaults):
         """Initialize the view definition.
 
         Note that the code in `map_fun` and `reduce_fun` is automatically
@@ -77,6 +116,7 @@ class ViewDefinition(object):
         :param wrapper: an optional callable that should be used to wrap the
                         result rows
         :param options: view specific options (e.g. {'collation':'raw'})
+        :param cache: an optional cache such as `LRUCache` for the results
         """
         if design.startswith('_design/'):
             design = design[8:]
@@ -88,6 +128,7 @@ class ViewDefinition(object):
         self.reduce_fun = reduce_fun
         self.wrapper = wrapper
         self.options = options
+        self.cache = cache
         self.defaults = defaults
 
     def __call__(self, db, wrapper=None, **options):
@@ -98,16 +139,175 @@ class ViewDefinition(object):
         :return: the view results
         :rtype: `list`
         """
-        merged_options = self.defaults.copy()
-        merged_options.update(options)
-        rows = db.view('/'.join(['_design', self.design, '_view', self.name]),
-                       **merged_options)
+        rows = self._query(db, options)
         wrapper = wrapper or self.wrapper
         if wrapper:
             return [wrapper(row) for row in rows]
         else:
             return rows
 
+    def _query(self, db, options):
+        merged_options = self.defaults.copy()
+        merged_options.update(options)
+        viewname = '/'.join(['_design', self.design, '_view', self.name])
+        key = _cache_key(db, viewname, merged_options)
+        if self.cache is None or key is None or \
+                str(merged_options.get('stale')).lower() == 'false':
+            return db.view(viewname, **merged_options)
+        cached = self.cache.get(key)
+        if cached is None:
+            rows = db.view(viewname, **merged_options)
+            self.cache.set(key, json.dumps(rows))
+        else:
+            rows = json.loads(cached)
+        return rows
+
+    def lookup_many(self, db, keys, chunk_size=100, wrapper=None, **options):
+        """Execute the view in the given database for each of the given keys,
+        and return the results of every key.
+
+        The distinct keys are sent in chunks of `chunk_size` through the
+        ``keys`` option, so that looking up many keys takes a few requests
+        rather than one per key. The other options apply to every request; to
+        look up keys in a reduce view, pass ``group=True``.
+
+        :param db: the `Bucket` instance
+        :param keys: a sequence of view keys
+        :param chunk_size: the number of keys to request at a time
+        :param options: optional query string parameters
+        :return: a list holding, for every key in `keys`, the list of its
+                 results; a key requested several times gets its results
+                 several times
+        :rtype: `list`
+        """
+        if chunk_size < 1:
+            raise ValueError('Invalid chunk size: %r' % chunk_size)
+        keys = list(keys)
+        rows_by_key = {}
+        unique = []
+        for key in keys:
+            ident = _key_ident(key)
+            if ident not in rows_by_key:
+                rows_by_key[ident] = []
+                unique.append(key)
+        for start in xrange(0, len(unique), chunk_size):
+            # The client neither encodes ``keys`` as JSON nor quotes it in
+            # the query string, where ``+`` would be read as a space and
+            # ``&`` would end the parameter
+            chunk = quote(json.dumps(unique[start:start + chunk_size],
+                                     separators=(',', ':')), safe='')
+            for row in self._query(db, dict(options, keys=chunk)):
+                rows = rows_by_key.get(_key_ident(row['key']))
+                if rows is not None:
+                    rows.append(row)
+        wrapper = wrapper or self.wrapper
+        if wrapper:
+            return [[wrapper(row) for row in rows_by_key[_key_ident(key)]]
+                    for key in keys]
+        return [list(rows_by_key[_key_ident(key)]) for key in keys]
+
+    def batch(self, db, chunk_size=100, wrapper=None, **options):
+        """Return a `LookupBatch` collecting single-key lookups of the view in
+        the given database.
+
+        :param db: the `Bucket` instance
+        :param chunk_size: the number of keys to request at a time
+        :param options: optional query string parameters
+        :rtype: `LookupBatch`
+        """
+        return LookupBatch(self, db, chunk_size=chunk_size, wrapper=wrapper,
+                           **options)
+
+    def iterview(self, db, page_size=100, wrapper=None, **options):
+        """Execute the view in the given database one page at a time, and
+        iterate over the results.
+
+        Unlike `__call__`, this only holds one page of results in memory at a
+        time, which makes it suitable for scanning large views. Pages are
+        requested with keyset pagination: each page starts at the key and
+        document ID of the first row that did not fit in the previous one, so
+        requests stay cheap however far the scan gets. A ``limit`` option
+        caps the total number of results.
+
+        :param db: the `Bucket` instance
+        :param page_size: the number of rows to request at a time
+        :param options: optional query string parameters
+        :return: an iterator over the view results
+        """
+        merged_options = self.defaults.copy()
+        merged_options.update(options)
+        wrapper = wrapper or self.wrapper
+        for row in iter_rows(db, '/'.join(['_design', self.design, '_view',
+                                           self.name]),
+                             page_size, **merged_options):
+            if wrapper:
+                row = wrapper(row)
+            yield row
+
+    def aiter(self, db, wrapper=None, **options):
+        """Start executing the view in the given database without blocking,
+        and return an iterator over the results.
+
+        Iterating blocks until the results have arrived. The query runs in a
+        worker thread, alongside the other pending operations, so `db` should
+        be thread-safe, such as a `BucketPool`.
+
+        :param db: the `BucketPool` or `AsyncBucket` instance
+        :param options: optional query string parameters
+        :return: an iterator over the view results
+        """
+        result = async_bucket(db).apply_async(
+            lambda db: self(db, wrapper=wrapper, **options))
+        return iter_result(result)
+
+    @staticmethod
+    def query_many(db, queries, max_workers=None):
+        """Execute several views concurrently, and return their results once
+        all of them have completed.
+
+        The queries run in worker threads, so the time this takes is that of
+        the slowest query rather than the sum of all of them. The bucket is
+        used from several threads at once, so it should be thread-safe, such
+        as a `BucketPool`.
+
+        :param db: the `Bucket`, `BucketPool` or `AsyncBucket` instance
+        :param queries: a sequence of ``(view, options)`` tuples, where `view`
+                        is a `ViewDefinition` and `options` a dict of the
+                        keyword arguments to call it with
+        :param max_workers: the maximum number of queries to run at the same
+                            time, `DEFAULT_POOL_SIZE` by default; no more run
+                            at once than there are worker threads in the pool
+                            shared by the whole process, or in the pool of
+                            `db` if it is an `AsyncBucket`
+        :return: a list of ``(results, error)`` tuples in the order of
+                 `queries`, where `error` is the exception raised by the
+                 query, or `None` if it succeeded
+        """
+        bucket = async_bucket(db)
+        queries = list(queries)
+        pending = iter(enumerate(queries))
+        retval = [None] * len(queries)
+        lock = Lock()
+
+        def run(db):
+            # Each worker runs queries until there are none left, so that no
+            # more than `max_workers` of them are in progress at once
+            while True:
+                with lock:
+                    item = next(pending, None)
+                if item is None:
+                    return
+                index, (view, options) = item
+                try:
+                    retval[index] = (view(db, **options), None)
+                except Exception as e:
+                    retval[index] = (None, e)
+        workers = [bucket.apply_async(run) for _ in
+                   range(min(max_workers or DEFAULT_POOL_SIZE, len(queries)))]
+        for worker in workers:
+            worker.get()
+        return retval
+
     def __repr__(self):
         return '<%s %r>' % (type(self).__name__, '/'.join([
             '_design', self.design, '_view', self.name
@@ -138,11 +338,22 @@ class ViewDefinition(object):
         return type(self).sync_many(db, [self])
 
     @staticmethod
-    def sync_many(db, views, remove_missing=False, callback=None):
+    def sync_many(db, views, remove_missing=False, callback=None,
+                  manifest_key=None):
         """Ensure that the views stored in the database that correspond to a
         given list of `ViewDefinition` instances match the code defined in
         those instances.
 
+        The design documents are fetched concurrently. With a `manifest_key`
+        such as `MANIFEST_KEY`, a fingerprint of the views defined for every
+        design document is also kept in a manifest stored in the bucket under
+        that key, and the design documents whose fingerprint matches the
+        manifest are skipped without being fetched. The manifest is an
+        ordinary JSON document, so the map functions of the bucket should
+        ignore it, and design documents changed by other means than this
+        method are only synced again once their definitions change or the
+        manifest is deleted.
+
         :param db: the `Bucket` instance
         :param views: a sequence of `ViewDefinition` instances
         :param remove_missing: whether views found in a design document that
@@ -152,41 +363,267 @@ class ViewDefinition(object):
                          document gets updated; the callback gets passed the
                          design document as only parameter, before that doc
                          has actually been saved back to the database
+        :param manifest_key: the key of the manifest of fingerprints, or
+                             `None` (the default) to check every design
+                             document
+        """
+        return [doc for design, doc in _sync_designs(
+            db, views, remove_missing, callback, manifest_key)]
+
+    def _funcs(self):
+        funcs = {'map': self.map_fun}
+        if self.reduce_fun:
+            funcs['reduce'] = self.reduce_fun
+        if self.options:
+            funcs['options'] = self.options
+        return funcs
+
+
+class LookupBatch(object):
+    """Collects lookups of single keys in a view, and executes them together
+    with `ViewDefinition.lookup_many` when the results of one of them are
+    needed, or when the batch is flushed.
+
+    >>> from couchbase_mapping.memory import MemoryBucket
+    >>> db = MemoryBucket()
+    >>> db.set('a', 0, 0, '{"value": 1}')
+    >>> db.set('b', 0, 0, '{"value": 2}')
+    >>> db.register_view('tests', 'all',
+    ...                  lambda doc, meta: [(meta['id'], doc['value'])])
+    >>> view = ViewDefinition('tests', 'all', '''function(doc, meta) {
+    ...     emit(meta.id, doc.value);
+    ... }''')
+    >>> batch = view.batch(db)
+    >>> first, second = batch.lookup('b'), batch.lookup('c')
+    >>> db.calls = 0
+    >>> [row['value'] for row in first.get()]
+    [2]
+    >>> second.get()
+    []
+    >>> db.calls
+    1
+
+    Used as a context manager, the batch is flushed on exit.
+    """
+
+    def __init__(self, view, db, chunk_size=100, wrapper=None, **options):
+        """Initialize the batch.
+
+        :param view: the `ViewDefinition` to look the keys up in
+        :param db: the `Bucket` instance
+        :param chunk_size: the number of keys to request at a time
+        :param options: optional query string parameters
+        """
+        self.view = view
+        self.db = db
+        self.chunk_size = chunk_size
+        self.wrapper = wrapper
+        self.options = options
+        self._pending = []
+
+    def lookup(self, key):
+        """Add a lookup of the given key to the batch.
+
+        :return: a `PendingLookup` whose `get()` method returns the results
+        """
+        lookup = PendingLookup(self, key)
+        self._pending.append(lookup)
+        return lookup
+
+    def flush(self):
+        """Execute the pending lookups.
+
+        If the query fails, the lookups stay pending, so that the next
+        `flush` or `PendingLookup.get` retries them.
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            results = self.view.lookup_many(
+                self.db, [lookup.key for lookup in pending],
+                chunk_size=self.chunk_size, wrapper=self.wrapper,
+                **self.options)
+        except Exception:
+            self._pending[:0] = pending
+            raise
+        for lookup, rows in zip(pending, results):
+            lookup._rows = rows
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+
+class PendingLookup(object):
+    """The lookup of a key added to a `LookupBatch`."""
+
+    __slots__ = ('batch', 'key', '_rows')
+
+    def __init__(self, batch, key):
+        self.batch = batch
+        self.key = key
+        self._rows = None
+
+    def get(self):
+        """Return the results of the lookup, flushing the batch first if the
+        lookup has not been executed yet.
+
+        :rtype: `list`
         """
-        docs = []
-
-        views = sorted(views, key=attrgetter('design'))
-        for design, views in groupby(views, key=attrgetter('design')):
-            doc_id = '_design/%s' % design
-            try:
-                doc = db[doc_id].ddoc
-            except Exception:
-                doc = {}
-            orig_doc = deepcopy(doc)
-
-            missing = list(doc.get('views', {}).keys())
-            for view in views:
-                funcs = {'map': view.map_fun}
-                if view.reduce_fun:
-                    funcs['reduce'] = view.reduce_fun
-                if view.options:
-                    funcs['options'] = view.options
-                doc.setdefault('views', {})[view.name] = funcs
-                if view.name in missing:
-                    missing.remove(view.name)
-
-            if remove_missing and missing:
-                for name in missing:
-                    del doc['views'][name]
-
-            if doc != orig_doc:
-                if callback is not None:
-                    callback(doc)
-                db[doc_id] = doc
-                docs.append(doc)
+        if self._rows is None:
+            self.batch.flush()
+        return self._rows
+
+
+def iter_rows(db, viewname, page_size=100, **options):
+    """Query a view of the given bucket one page at a time, and iterate over
+    the rows.
+
+    :param db: the `Bucket` instance
+    :param viewname: the path of the view
+    :param page_size: the number of rows to request at a time
+    :param options: optional query string parameters
+    :return: an iterator over the rows
+    """
+    for rows in iter_pages(db, viewname, page_size, **options):
+        for row in rows:
+            yield row
 
+
+def iter_pages(db, viewname, page_size=100, **options):
+    """Query a view of the given bucket one page at a time, and iterate over
+    the lists of rows of the pages.
+
+    Every request asks for one row more than `page_size`; that row is not
+    returned, but its key and document ID are where the next page starts.
+    A ``skip`` option therefore only applies to the first request.
+
+    :param db: the `Bucket` instance
+    :param viewname: the path of the view
+    :param page_size: the number of rows per page
+    :param options: optional query string parameters
+    :return: an iterator over the lists of rows
+    """
+    if page_size < 1:
+        raise ValueError('Invalid page size: %r' % page_size)
+    limit = options.pop('limit', None)
+    while limit is None or limit > 0:
+        count = page_size if limit is None else min(page_size, limit)
+        rows = db.view(viewname, limit=count + 1, **options) or []
+        if rows[:count]:
+            yield rows[:count]
+        if len(rows) <= count:
+            break
+        if limit is not None:
+            limit -= count
+        # The client only encodes ``start_key`` as JSON, not ``startkey``
+        options.pop('startkey', None)
+        options.pop('skip', None)
+        options['start_key'] = rows[count]['key']
+        if 'id' in rows[count]:
+            options['startkey_docid'] = rows[count]['id']
+
+
+def _cache_key(db, viewname, options):
+    # Options are normalized so that equal values give the same key whatever
+    # their order, and the bucket name distinguishes the views of buckets;
+    # without a name, results are not cached
+    name = getattr(db, 'name', None)
+    if name is None:
+        return None
+    return (name, viewname, json.dumps(options, sort_keys=True))
+
+
+def _sync_designs(db, views, remove_missing, callback, manifest_key):
+    # Returns the ``(design, doc)`` tuples of the design documents written
+    docs = []
+
+    views = sorted(views, key=attrgetter('design'))
+    designs = [(design, list(views)) for design, views
+               in groupby(views, key=attrgetter('design'))]
+    fingerprints = dict((design, _fingerprint(views, remove_missing))
+                        for design, views in designs)
+    if manifest_key is None:
+        manifest = {}
+    else:
+        manifest = _load_manifest(db, manifest_key)
+        designs = [(design, views) for design, views in designs
+                   if manifest.get(design) != fingerprints[design]]
+    if not designs:
         return docs
 
+    for (design, views), doc in zip(designs, _fetch_design_docs(db, designs)):
+        doc_id = '_design/%s' % design
+        orig_doc = deepcopy(doc)
+
+        missing = list(doc.get('views', {}).keys())
+        for view in views:
+            doc.setdefault('views', {})[view.name] = view._funcs()
+            if view.name in missing:
+                missing.remove(view.name)
+
+        if remove_missing and missing:
+            for name in missing:
+                del doc['views'][name]
+
+        if doc != orig_doc:
+            if callback is not None:
+                callback(doc)
+            db[doc_id] = doc
+            docs.append((design, doc))
+        manifest[design] = fingerprints[design]
+
+    if manifest_key is not None:
+        db.set(manifest_key, 0, 0, json.dumps(manifest))
+    return docs
+
+
+def _fingerprint(views, remove_missing):
+    # Stable across processes, as the JSON has its keys sorted; whether other
+    # views are removed is part of it, since it changes the synced document
+    funcs = dict((view.name, view._funcs()) for view in views)
+    return hashlib.sha1(json.dumps([funcs, bool(remove_missing)],
+                                   sort_keys=True)).hexdigest()
+
+
+def _load_manifest(db, key):
+    try:
+        return json.loads(db.get(key)[2])
+    except Exception:
+        # couchbase-python-client does not return more meaningful errors
+        return {}
+
+
+def _get_design_doc(db, doc_id):
+    try:
+        return db[doc_id].ddoc
+    except Exception:
+        return {}
+
+
+def _fetch_design_docs(db, designs):
+    doc_ids = ['_design/%s' % design for design, views in designs]
+    if len(doc_ids) == 1:
+        return [_get_design_doc(db, doc_ids[0])]
+    # Design documents are fetched through the REST API, with a connection
+    # per request, so this is safe with a plain `Bucket` too
+    bucket = async_bucket(db)
+    pending = [bucket.apply_async(_get_design_doc, doc_id)
+               for doc_id in doc_ids]
+    return [result.get() for result in pending]
+
+
+def _key_ident(key):
+    # Keys come back from the server decoded from JSON, so every key is
+    # compared by its JSON encoding: this tells ``True`` from ``1`` and the
+    # string ``'[1, 2]'`` from the list, matches UTF-8 encoded strings with
+    # the unicode strings returned, and makes structured keys hashable
+    return json.dumps(key, sort_keys=True)
+
 
 def _strip_decorators(code):
     retval = []
@@ -20,3 +20,7 @@ class NotFoundError(Error):
 
 class InvalidArgumentError(Error):
     pass
+
+
+class PoolTimeoutError(Error):
+    pass
@@ -70,48 +70,94 @@ Differences from couchdb.mapping
 
 import copy
 import json
+import re
 import uuid
 
 from calendar import timegm
 from datetime import date, datetime, time
 from decimal import Decimal
+from itertools import islice
+from operator import attrgetter, itemgetter
 from time import strptime, struct_time
+from weakref import WeakKeyDictionary
 from couchbase.exception import MemcachedError
 from couchbase.constants import MemcachedConstants
-from couchbase_mapping.design import ViewDefinition
+from couchbase_mapping import codec, compression
+from couchbase_mapping.asynchronous import async_bucket
+from couchbase_mapping.design import (ViewDefinition, _sync_designs,
+                                      iter_pages)
 from exception import NotFoundError, InvalidArgumentError, MEMCACHED_STATUS_INVALID_ARGUMENTS
 
 __all__ = ['Mapping', 'Document', 'Field', 'TextField', 'FloatField',
            'IntegerField', 'LongField', 'BooleanField', 'DecimalField',
            'DateField', 'DateTimeField', 'TimeField', 'DictField', 'ListField',
-           'ViewField']
+           'ViewField', 'registered_views', 'sync_all']
 __docformat__ = 'restructuredtext en'
 
 DEFAULT = object()
 
+# Layouts produced by the date and time fields, parsed without strptime
+_DATE_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)\Z')
+_DATETIME_RE = re.compile(r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.|Z?\Z)')
+_TIME_RE = re.compile(r'(\d\d):(\d\d):(\d\d)(?:\.|\Z)')
+
 
 class Field(object):
     """Basic unit for mapping a piece of data between Python and JSON.
 
     Instances of this class can be added to subclasses of `Document` to describe
     the mapping of a document.
+
+    A field can memoize the Python values it decodes, so that reading the
+    attribute again does not repeat the conversion. This is enabled with the
+    `memoize` argument, or for all fields of a class that does not specify it
+    by setting ``__memoize__ = True`` on the class:
+
+    >>> class Event(Document):
+    ...     __memoize__ = True
+    ...     start = DateTimeField()
+    ...     price = DecimalField(memoize=False)
+    >>> event = Event.wrap({'start': '2007-04-01T15:30:00Z', 'price': '9.90'})
+    >>> event.start is event.start
+    True
+    >>> event.start = datetime(2007, 4, 2, 15, 30)
+    >>> event.start
+    datetime.datetime(2007, 4, 2, 15, 30)
+
+    Memoized values are discarded as soon as the underlying JSON value is
+    replaced, however that happens.
+
+    Fields of a `Document` subclass can be indexed by passing
+    ``index=True``, as described for `Document`.
     """
 
-    def __init__(self, name=None, default=None):
+    def __init__(self, name=None, default=None, memoize=None, index=False):
         self.name = name
         self.default = default
+        self.memoize = memoize
+        self.index = index
 
     def __get__(self, instance, owner):
         if instance is None:
             return self
         value = instance._data.get(self.name)
         if value is not None:
+            memoize = self.memoize
+            if memoize is None:
+                memoize = instance.__memoize__
+            if memoize:
+                return self._memoized(instance, value)
             value = self._to_python(value)
         elif self.default is not None:
             default = self.default
             if callable(default):
                 default = default()
             value = default
+            if instance._pending_defaults and self.name not in instance._data:
+                # Store the default like `Mapping.__init__` would have, so
+                # that mutable values are tied to the instance
+                self.__set__(instance, value)
+                return self.__get__(instance, owner)
         return value
 
     def __set__(self, instance, value):
@@ -119,6 +165,15 @@ class Field(object):
             value = self._to_json(value)
         instance._data[self.name] = value
 
+    def _memoized(self, instance, value):
+        decoded = instance._decoded
+        if decoded is None:
+            decoded = instance._decoded = {}
+        entry = decoded.get(self.name)
+        if entry is None or entry[0] is not value:
+            entry = decoded[self.name] = (value, self._to_python(value))
+        return entry[1]
+
     def _to_python(self, value):
         return unicode(value)
 
@@ -130,6 +185,78 @@ class Field(object):
         return self._to_python(value)
 
 
+def _build_codecs(cls):
+    """Generate the `_init_fields`, `_decode_fields` and `_fill_defaults`
+    methods of a mapping class.
+
+    They are equivalent to looping over ``cls._fields`` and calling `getattr`
+    and `setattr` for each field, but the loop is unrolled, with field names
+    and converters bound as locals, and `Field.__set__` is inlined.
+    """
+    lazy = cls.__lazy_defaults__
+    namespace = {'cls': cls}
+    init = ['def _init_fields(self, values):',
+            '    self._pending_defaults = %r' % lazy,
+            '    self._data = _data = {}']
+    fill = ['def _fill_defaults(self):',
+            '    self._pending_defaults = False',
+            '    data = self._data',
+            '    self._data = _data = {}']
+    decode = ['def _decode_fields(self, data, silent):',
+              '    _data = self._data',
+              '    data = data.copy()',
+              '    pop = data.pop']
+    for index, (attrname, field) in enumerate(cls._fields.items()):
+        namespace.update({
+            'get_%d' % index: field.__get__,
+            'set_%d' % index: field.__set__,
+            'from_json_%d' % index: field.from_json,
+            'to_json_%d' % index: field._to_json,
+        })
+        if getattr(cls, attrname, None) is not field:
+            get = 'getattr(self, %r)' % attrname
+            store = ['setattr(self, %r, value)' % attrname]
+        else:
+            get = 'get_%d(self, cls)' % index
+            if type(field).__set__.im_func is not Field.__set__.im_func:
+                store = ['set_%d(self, value)' % index]
+            else:
+                store = ['if value is not None:',
+                         '    value = to_json_%d(value)' % index,
+                         '_data[%r] = value' % field.name]
+        if lazy:
+            init.extend(['    if %r in values:' % field.name,
+                         '        value = values.pop(%r)' % field.name])
+            init.extend('        ' + line for line in store)
+        else:
+            init.extend(['    if %r in values:' % field.name,
+                         '        value = values.pop(%r)' % field.name,
+                         '    else:',
+                         '        value = %s' % get])
+            init.extend('    ' + line for line in store)
+        fill.extend(['    if %r in data:' % field.name,
+                     '        _data[%r] = data.pop(%r)' % (field.name,
+                                                           field.name),
+                     '    else:',
+                     '        value = %s' % get])
+        fill.extend('        ' + line for line in store)
+        decode.extend(['    value = pop(%r, None)' % field.name,
+                       '    if value is not None:',
+                       '        value = from_json_%d(value)' % index])
+        decode.extend('        ' + line for line in store)
+    decode.extend(['    if data and not silent:',
+                   '        raise ValueError("Extraneous field %s present" % '
+                   'data.keys()[0])'])
+    # Not `dict.update`, which can size the table differently than inserting
+    # the keys one by one, and with it the iteration order
+    fill.extend(['    for key, value in data.iteritems():',
+                 '        _data[key] = value'])
+    exec '\n'.join(init + [''] + decode + [''] + fill) in namespace
+    cls._init_fields = namespace['_init_fields']
+    cls._decode_fields = namespace['_decode_fields']
+    cls._fill_defaults = namespace['_fill_defaults']
+
+
 class MappingMeta(type):
 
     def __new__(cls, name, bases, d):
@@ -143,42 +270,89 @@ class MappingMeta(type):
                     attrval.name = attrname
                 fields[attrname] = attrval
         d['_fields'] = fields
-        return type.__new__(cls, name, bases, d)
+        newcls = type.__new__(cls, name, bases, d)
+        _build_codecs(newcls)
+        return newcls
 
 
 class Mapping(object):
+    """Base class for mapped JSON objects, such as nested dictionaries.
+
+    Classes that set ``__lazy_defaults__ = True`` do not compute the defaults
+    of the fields that are not passed to the constructor until the fields are
+    first read, or the instance is unwrapped or stored. The JSON ends up the
+    same as without the option, except that callable defaults are called
+    later:
+
+    >>> class Post(Mapping):
+    ...     __lazy_defaults__ = True
+    ...     title = TextField()
+    ...     tags = ListField(TextField())
+    >>> post = Post(title='Foo')
+    >>> post._data
+    {'title': u'Foo'}
+    >>> post.tags.append('bar')
+    >>> sorted(post.unwrap().items())
+    [('tags', [u'bar']), ('title', u'Foo')]
+    """
     __metaclass__ = MappingMeta
 
+    # ``_decoded`` holds the memoized values of fields, as
+    # ``(json_value, python_value)`` tuples, and ``_pending_defaults`` whether
+    # ``_data`` may still lack the defaults of some fields
+    __slots__ = ('_data', '_decoded', '_pending_defaults', 'id')
+
+    # Whether fields memoize decoded values unless they specify otherwise
+    __memoize__ = False
+
+    # Whether the defaults of fields are computed on demand rather than by
+    # the constructor
+    __lazy_defaults__ = False
+
+    # The `Codec` used to encode and decode documents, or `None` for the
+    # default one of the `codec` module
+    __codec__ = None
+
     def __init__(self, **values):
-        self._data = {}
-        for attrname, field in self._fields.items():
-            if field.name in values:
-                setattr(self, attrname, values.pop(field.name))
-            else:
-                setattr(self, attrname, getattr(self, attrname))
+        self._decoded = None
+        self._init_fields(values)
+
+    def __getstate__(self):
+        state = dict(getattr(self, '__dict__', ()))
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
 
     def __iter__(self):
-        return iter(self._data)
+        return iter(self.unwrap())
 
     def __len__(self):
-        return len(self._data or ())
+        return len(self.unwrap() or ())
 
     def __delitem__(self, name):
-        del self._data[name]
+        del self.unwrap()[name]
 
     def __getitem__(self, name):
-        return self._data[name]
+        return self.unwrap()[name]
 
     def __setitem__(self, name, value):
         self._data[name] = value
 
     def get(self, name, default=None):
-        return self._data.get(name, default)
+        return self.unwrap().get(name, default)
 
     def setdefault(self, name, default):
-        return self._data.setdefault(name, default)
+        return self.unwrap().setdefault(name, default)
 
     def unwrap(self):
+        if self._pending_defaults:
+            self._fill_defaults()
         return self._data
 
     @classmethod
@@ -189,12 +363,14 @@ class Mapping(object):
                 attrval.name = attrname
             fields[attrname] = attrval
         d['_fields'] = fields
+        d['__slots__'] = ()
         return type('AnonymousStruct', (cls,), d)
 
     @classmethod
     def wrap(cls, data, id=None):
         instance = cls()
         instance._data = data
+        instance._pending_defaults = False
         instance.id = id
         return instance
 
@@ -204,16 +380,16 @@ class Mapping(object):
     def _to_json(self, value):
         return self.unwrap()
 
+    @classmethod
+    def _codec(cls):
+        return cls.__codec__ or codec.get_default()
+
     @classmethod
     def from_json(cls, data, id=None, silent=False):
+        if isinstance(data, basestring):
+            data = cls._codec().loads(data)
         instance = cls()
-        data = data.copy()
-        for field_name, field in instance._fields.items():
-            value = data.pop(field.name, None)
-            if value is not None:
-                setattr(instance, field_name, field.from_json(value))
-        if data and not silent:
-            raise ValueError("Extraneous field %s present" % data.keys()[0])
+        instance._decode_fields(data, silent)
         instance.id = id
         return instance
 
@@ -249,10 +425,17 @@ class ViewField(object):
     mapping defined by the containing `Document` class. Alternatively, the
     ``include_docs`` query option can be used to inline the actual documents in
     the view results, which will then be used instead of the values.
+
+    The views declared on all `Document` subclasses are kept in a registry,
+    so that a single call to `sync_all` brings every design document of an
+    application up to date:
+
+    >>> sync_all(db)                                             #doctest: +SKIP
+    {'people': ['by_name']}
     """
 
     def __init__(self, design, map_fun, reduce_fun=None, name=None,
-                 wrapper=DEFAULT, **defaults):
+                 wrapper=DEFAULT, cache=None, **defaults):
         """Initialize the view descriptor.
 
         :param design: the name of the design document
@@ -262,6 +445,7 @@ class ViewField(object):
                      it differs from the name the descriptor is assigned to
         :param wrapper: an optional callable that should be used to wrap the
                         result rows
+        :param cache: an optional cache such as `LRUCache` for the results
         :param defaults: default query string parameters to apply
         """
         self.design = design
@@ -269,6 +453,7 @@ class ViewField(object):
         self.map_fun = map_fun
         self.reduce_fun = reduce_fun
         self.wrapper = wrapper
+        self.cache = cache
         self.defaults = defaults
 
     def __get__(self, instance, cls=None):
@@ -277,31 +462,310 @@ class ViewField(object):
         else:
             wrapper = self.wrapper
         return ViewDefinition(self.design, self.name, self.map_fun,
-                              self.reduce_fun, wrapper=wrapper, **self.defaults)
+                              self.reduce_fun, wrapper=wrapper,
+                              cache=self.cache, **self.defaults)
+
+
+# Names of the view fields declared by every `Document` subclass, which stay
+# registered for as long as the class exists
+_view_registry = WeakKeyDictionary()
 
 
 class DocumentMeta(MappingMeta):
 
     def __new__(cls, name, bases, d):
+        views = []
         for attrname, attrval in d.items():
             if isinstance(attrval, ViewField):
                 if not attrval.name:
                     attrval.name = attrname
-        return MappingMeta.__new__(cls, name, bases, d)
+                views.append(attrname)
+        new_cls = MappingMeta.__new__(cls, name, bases, d)
+        indexes = [(attrname,) for attrname, field in d.items()
+                   if isinstance(field, Field) and field.index]
+        indexes.extend(tuple(attrnames)
+                       for attrnames in d.get('__indexes__', ()))
+        if new_cls._codec().binary and (views or indexes or any(
+                base in _view_registry for base in new_cls.__mro__[1:])):
+            raise TypeError('%s documents are stored in the binary %r format, '
+                            'which views cannot read' %
+                            (name, new_cls._codec().name))
+        for attrnames in sorted(indexes):
+            views.append(_add_index(new_cls, attrnames))
+        if views:
+            _view_registry[new_cls] = sorted(views)
+        return new_cls
+
+
+def _add_index(cls, attrnames):
+    # Adds the view and finders of an index on the given fields to a class,
+    # and returns the name of the view
+    fields = []
+    for attrname in attrnames:
+        if attrname not in cls._fields:
+            raise ValueError('%s has no field %r to index' %
+                             (cls.__name__, attrname))
+        fields.append(cls._fields[attrname])
+    suffix = '_and_'.join(attrnames)
+    viewname = 'by_' + suffix
+    names = [viewname, 'find_by_' + suffix, 'find_by_%s_many' % suffix]
+    for attrname in names:
+        if attrname in cls.__dict__:
+            raise ValueError('%s.%s is already defined, and cannot be '
+                             'generated for an index' % (cls.__name__,
+                                                         attrname))
+    design = cls.__index_design__ or cls.__name__.lower()
+    values = ['doc[%s]' % json.dumps(field.name) for field in fields]
+    conditions = ['%s !== undefined' % value for value in values]
+    if cls.__index_condition__:
+        conditions.insert(0, '(%s)' % cls.__index_condition__)
+    if len(values) == 1:
+        key = values[0]
+    else:
+        key = '[%s]' % ', '.join(values)
+    view = ViewField(design, 'function(doc) {\n'
+                             '    if (%s) {\n'
+                             '        emit(%s, null);\n'
+                             '    }\n'
+                             '}' % (' && '.join(conditions), key),
+                     name=viewname)
+
+    def find_many(cls, db, values, **options):
+        keys = [_index_key(fields, value) for value in values]
+        ids = getattr(cls, viewname).lookup_many(
+            db, keys, wrapper=itemgetter('id'), **options)
+        docs = iter(cls.load_many(db, [id for group in ids for id in group],
+                                  missing='none'))
+        # Documents deleted since the view was last indexed are left out
+        return [[doc for doc in islice(docs, len(group)) if doc is not None]
+                for group in ids]
+
+    def find(cls, db, value, **options):
+        return find_many(cls, db, [value], **options)[0]
+
+    if len(attrnames) == 1:
+        what = 'the given value of %r' % attrnames[0]
+    else:
+        what = 'the given tuple of values of %s' % ', '.join(
+            repr(attrname) for attrname in attrnames)
+    find.__name__ = names[1]
+    find.__doc__ = ('Return the list of documents with %s, queried with '
+                    'the ``%s`` view.' % (what, viewname))
+    find_many.__name__ = names[2]
+    find_many.__doc__ = ('Return, for each of the given values, the list '
+                         'of documents with %s, queried with the ``%s`` '
+                         'view.' % (what.replace('the given ', ''),
+                                    viewname))
+    setattr(cls, viewname, view)
+    setattr(cls, names[1], classmethod(find))
+    setattr(cls, names[2], classmethod(find_many))
+    return viewname
+
+
+def _index_key(fields, value):
+    if len(fields) == 1:
+        value = (value,)
+    elif len(value) != len(fields):
+        raise ValueError('Expected %d values, got %r' % (len(fields), value))
+    key = [None if item is None else field._to_json(item)
+           for field, item in zip(fields, value)]
+    if len(fields) == 1:
+        return key[0]
+    return key
+
+
+def registered_views(designs=None):
+    """Return the views declared with `ViewField` on the `Document` subclasses
+    defined so far, grouped by design document.
+
+    A view inherited by subclasses is only listed once, as are views declared
+    identically by several classes.
+
+    :param designs: the names of the design documents to include, or `None`
+                    to include all of them
+    :return: a dict mapping the names of design documents to the lists of
+             their `ViewDefinition` instances, sorted by name
+    :raise ValueError: if a view is declared by several classes with
+                       different definitions
+    """
+    retval = {}
+    seen = {}
+    for cls, attrnames in _view_registry.items():
+        for attrname in attrnames:
+            view = getattr(cls, attrname)
+            if designs is not None and view.design not in designs:
+                continue
+            key = (view.design, view.name)
+            if key in seen:
+                other_cls, other = seen[key]
+                if other._funcs() != view._funcs():
+                    raise ValueError('Conflicting definitions of view %s/%s '
+                                     'in %s and %s' %
+                                     (view.design, view.name,
+                                      other_cls.__name__, cls.__name__))
+                continue
+            seen[key] = cls, view
+            retval.setdefault(view.design, []).append(view)
+    for views in retval.values():
+        views.sort(key=attrgetter('name'))
+    return retval
+
+
+def sync_all(db, remove_missing=False, callback=None, designs=None,
+             manifest_key=None):
+    """Ensure that the design documents in the database match the views
+    declared on all `Document` subclasses defined so far.
+
+    The modules defining the classes must have been imported. Every design
+    document is read and written at most once, and with a `manifest_key`,
+    the ones whose views have not changed since the last sync are skipped, as
+    described for `ViewDefinition.sync_many`.
+
+    Couchbase indexes all the views of a design document together, so every
+    design document written has the indexes of all its views rebuilt, which
+    can take a while for large buckets. The views concerned are returned.
+
+    :param db: the `Bucket` instance
+    :param remove_missing: whether views found in a design document that are
+                           not declared on any class should be removed
+    :param callback: a callback function that is invoked with every design
+                     document before it is saved
+    :param designs: the names of the design documents to sync, or `None` to
+                    sync all of them
+    :param manifest_key: the key of the manifest of fingerprints, or `None`
+                         (the default) to check every design document
+    :return: a dict mapping the names of the design documents written to the
+             sorted names of their views, whose indexes will be rebuilt
+    """
+    views = [view for views in registered_views(designs).values()
+             for view in views]
+    return dict((design, sorted(doc.get('views', {})))
+                for design, doc in _sync_designs(db, views, remove_missing,
+                                                 callback, manifest_key))
 
 
 class Document(Mapping):
+    """Base class for mapped documents.
+
+    Instances keep their state in slots. Subclasses that do not declare
+    ``__slots__`` themselves still only create an instance dictionary when
+    other attributes are set on them; declaring ``__slots__ = ()`` rules that
+    out and makes instances as compact as possible:
+
+    >>> class Point(Document):
+    ...     __slots__ = ()
+    ...     x = IntegerField()
+    ...     y = IntegerField()
+    >>> point = Point(x=1, y=2)
+    >>> point.color = 'red'
+    Traceback (most recent call last):
+      ...
+    AttributeError: 'Point' object has no attribute 'color'
+
+    Fields declared with ``index=True`` get a view emitting their value, and
+    finders looking documents up by value, with a single view request and
+    multi-get for many values:
+
+    >>> class User(Document):
+    ...     email = TextField(index=True)
+    >>> User.by_email
+    <ViewDefinition '_design/user/_view/by_email'>
+    >>> User.find_by_email(db, 'joe@example.com')               #doctest: +SKIP
+    [User(...)]
+    >>> User.find_by_email_many(db, ['joe@example.com'])        #doctest: +SKIP
+    [[User(...)]]
+
+    A class can also index tuples of fields by listing them in
+    ``__indexes__``. The generated view emits the values of the fields as an
+    array, and the finders take tuples:
+
+    >>> class Address(Document):
+    ...     __indexes__ = [('country', 'city')]
+    ...     country = TextField()
+    ...     city = TextField()
+    >>> print Address.by_country_and_city.map_fun
+    function(doc) {
+        if (doc["country"] !== undefined && doc["city"] !== undefined) {
+            emit([doc["country"], doc["city"]], null);
+        }
+    }
+    >>> Address.find_by_country_and_city(db, ('FR', 'Paris'))  #doctest: +SKIP
+    [Address(...)]
+
+    The views are generated in the design document named after the class in
+    lower case, unless ``__index_design__`` names another one. As views see
+    all the documents of a bucket, ``__index_condition__`` can restrict the
+    indexes to the documents of the class with a JavaScript condition such as
+    ``"doc.kind == 'address'"``, when documents of other classes have fields
+    of the same name.
+    """
     __metaclass__ = DocumentMeta
 
+    # ``_stored`` is the JSON the document was last loaded or stored as, kept
+    # by classes that track changes or load documents lazily
+    __slots__ = ('_stored',)
+
     def __init__(self, id=None, **values):
+        self._stored = None
         Mapping.__init__(self, **values)
-        if id is not None:
-            self.id = id
+        self.id = id
 
     def __repr__(self):
         return '%s(%r, **%r)' % (type(self).__name__, self.id, self._data or {})
 
-    id = None
+    # An optional cache such as `LRUCache` used by `load` and `store`
+    __cache__ = None
+
+    # Whether documents loaded from a bucket parse their JSON on first use
+    # rather than right away
+    __lazy_load__ = False
+
+    # Whether documents keep the JSON they were last loaded or stored as, to
+    # tell whether they have been modified since
+    __track_changes__ = False
+
+    # The size in bytes from which encoded documents are compressed with the
+    # `Compressor` in ``__compressor__`` (``zlib`` if `None`) when stored, or
+    # `None` to never compress them
+    __compress_threshold__ = None
+    __compressor__ = None
+
+    # The design document of the views generated for indexed fields (the
+    # lowercased class name if `None`), and a JavaScript condition on ``doc``
+    # that the documents of the class meet, if other documents have the same
+    # fields
+    __index_design__ = None
+    __index_condition__ = None
+
+    def __getattr__(self, name):
+        # Only called for ``_data`` while it is unset, which is the case for
+        # lazily loaded documents that have not been parsed yet
+        if name != '_data' or self._stored is None:
+            raise AttributeError('%r object has no attribute %r' %
+                                 (type(self).__name__, name))
+        data = self._data = self._codec().loads(self._stored)
+        return data
+
+    def raw_json(self):
+        """Return the JSON the document was last loaded or stored as, without
+        encoding it again.
+
+        Modifications made since are not reflected in the result.
+
+        >>> class Post(Document):
+        ...     __lazy_load__ = True
+        ...     title = TextField()
+        >>> post = Post._wrap_stored('{"title": "Foo"}', 'foo')
+        >>> post.raw_json()
+        '{"title": "Foo"}'
+        >>> post.title
+        u'Foo'
+
+        :return: the JSON string, or `None` if the document was never loaded
+                 or stored, or its class neither tracks changes nor loads
+                 documents lazily
+        """
+        return self._stored
 
     def items(self):
         """Return the fields as a list of ``(name, value)`` tuples.
@@ -322,7 +786,7 @@ class Document(Mapping):
         retval = []
         if self.id is not None:
             retval.append(('_id', self.id))
-        for name, value in self._data.items():
+        for name, value in self.unwrap().items():
             if name != '_id':
                 retval.append((name, value))
         return retval
@@ -336,48 +800,372 @@ class Document(Mapping):
         :return: the `Document` instance, or `None` if no document with the
                  given ID was found
         """
-        try:
-            _, _, doc = db.get(id)
-        except MemcachedError as e:
-            if e.status == MemcachedConstants.ERR_NOT_FOUND:
-                raise NotFoundError('Document with id {} not found'.format(id), e)
-            elif e.status == MEMCACHED_STATUS_INVALID_ARGUMENTS:
-                raise InvalidArgumentError('{} is not valid document id'.format(repr(id)), e)
-            else:
-                raise e
+        cache = _cache_for(cls, db)
+        if cache is not None:
+            doc = cache.get(_cache_key(db, id))
+            if doc is not None:
+                return cls._wrap_stored(doc, id)
+        flags, _, doc = _get(db, id)
         if doc is None:
             return None
-        return cls.wrap(json.loads(doc), id=id)
+        doc = cls._unpack(flags, doc)
+        if cache is not None:
+            cache.set(_cache_key(db, id), doc)
+        return cls._wrap_stored(doc, id)
+
+    @classmethod
+    def load_many(cls, db, ids, missing='raise'):
+        """Load a batch of documents from the given database.
+
+        If the bucket provides a ``get_multi`` method, it fetches all the
+        documents at once. The `Bucket` of the Couchbase client does not, so
+        it fetches them one at a time; a `BucketPool` fetches them over
+        several connections concurrently.
+
+        :param db: the `Bucket` object to retrieve the documents from
+        :param ids: a sequence of document IDs
+        :param missing: how to handle IDs that are not found: ``'raise'`` a
+                        `NotFoundError` (the default), ``'skip'`` them, or
+                        put ``None`` in their place (``'none'``)
+        :return: a list of `Document` instances, in the order of `ids`
+        """
+        if missing not in ('raise', 'skip', 'none'):
+            raise ValueError('Invalid value for missing: %r' % missing)
+        ids = list(ids)
+        cache = _cache_for(cls, db)
+        found = {}
+        if cache is not None:
+            for id in ids:
+                doc = cache.get(_cache_key(db, id))
+                if doc is not None:
+                    found[id] = doc
+        fetched = _get_multi(db, [id for id in ids if id not in found])
+        for id, (flags, _, doc) in fetched.items():
+            if doc is not None:
+                doc = found[id] = cls._unpack(flags, doc)
+                if cache is not None:
+                    cache.set(_cache_key(db, id), doc)
+        retval = []
+        for id in ids:
+            doc = found.get(id)
+            if doc is not None:
+                retval.append(cls._wrap_stored(doc, id))
+            elif missing == 'raise':
+                raise NotFoundError('Document with id {} not found'.format(id))
+            elif missing == 'none':
+                retval.append(None)
+        return retval
+
+    @classmethod
+    def aload(cls, db, id):
+        """Start loading a specific document from the given database without
+        blocking.
 
-    def store(self, db, expiration=0, flags=0):
+        The operation runs in a worker thread, alongside the other pending
+        operations, so `db` should be thread-safe, such as a `BucketPool`.
+
+        :param db: the `BucketPool` or `AsyncBucket` object to retrieve the
+                   document from
+        :param id: the document ID
+        :return: an `AsyncResult` whose ``get()`` method returns what `load`
+                 would return
+        """
+        return async_bucket(db).apply_async(lambda db: cls.load(db, id))
+
+    @classmethod
+    def _wrap_stored(cls, doc, id):
+        if cls.__lazy_load__:
+            instance = cls.wrap(None, id=id)
+            del instance._data
+        else:
+            instance = cls.wrap(cls._codec().loads(doc), id=id)
+            if not cls.__track_changes__:
+                return instance
+        instance._stored = doc
+        return instance
+
+    def _encode(self):
+        if not _is_parsed(self):
+            return self._stored
+        return self._codec().dumps(self.unwrap())
+
+    def _pack(self, doc, flags):
+        # Return the flags and value to store the encoded document with
+        if flags & (codec.FLAGS_MASK | compression.FLAGS_MASK):
+            raise ValueError('The flags %#x are reserved' %
+                             (codec.FLAGS_MASK | compression.FLAGS_MASK))
+        flags |= self._codec().flag
+        threshold = self.__compress_threshold__
+        if threshold is not None and len(doc) >= threshold:
+            compressor = self.__compressor__ or compression.find()
+            return flags | compressor.flag, compressor.compress(doc)
+        return flags, doc
+
+    @classmethod
+    def _unpack(cls, flags, value):
+        # Return the encoded document stored with the given flags and value.
+        # Other clients set flags of their own, so the markers are only
+        # interpreted by the classes that can have written them
+        own_codec = cls._codec()
+        if cls.__compress_threshold__ is None and not own_codec.binary:
+            return value
+        compressor = compression.for_flags(flags)
+        if compressor is not None:
+            value = compressor.decompress(value)
+        stored_codec = codec.for_flags(flags)
+        if stored_codec.flag != own_codec.flag:
+            # Convert documents stored in another format, such as JSON
+            # documents read by a class with a binary codec
+            value = own_codec.dumps(stored_codec.loads(value))
+        return value
+
+    @property
+    def is_dirty(self):
+        """Whether the document has been modified since it was last loaded or
+        stored.
+
+        Changes are only tracked for classes that set ``__track_changes__ =
+        True``, whose documents keep the JSON they were last loaded or stored
+        as, or ``__lazy_load__ = True``. Other documents, and documents that
+        were not loaded from or stored in a bucket, such as new instances or
+        view results, are always considered dirty.
+
+        >>> class Post(Document):
+        ...     __track_changes__ = True
+        ...     title = TextField()
+        >>> post = Post._wrap_stored('{"title": "Foo"}', 'foo')
+        >>> post.is_dirty
+        False
+        >>> post.title = 'Bar'
+        >>> post.is_dirty
+        True
+        """
+        if self._stored is None:
+            return True
+        if not _is_parsed(self):
+            return False
+        return self._codec().loads(self._stored) != self.unwrap()
+
+    @property
+    def changed_fields(self):
+        """The sorted list of the names of the top-level fields whose values
+        differ from the ones last loaded or stored.
+        """
+        if self._stored is not None and not _is_parsed(self):
+            return []
+        data = self.unwrap()
+        if self._stored is None:
+            return sorted(data)
+        stored = self._codec().loads(self._stored)
+        return sorted(name for name in set(stored) | set(data)
+                      if stored.get(name, DEFAULT) != data.get(name, DEFAULT))
+
+    def store(self, db, expiration=0, flags=0, only_if_dirty=False):
         """Store the document in the given bucket.
 
         :param db:  the `Bucket` object to store the document in
+        :param only_if_dirty: skip the request if the document has not been
+                              modified since it was last loaded or stored
 
         :return: this `Document` instance
         """
+        if only_if_dirty and not self.is_dirty:
+            return self
         if self.id is None:
             self.id = uuid.uuid4().hex
-        db.set(self.id, expiration, flags, self._data)
+        doc = self._encode()
+        db.set(self.id, expiration, *self._pack(doc, flags))
+        if self.__track_changes__ or self.__lazy_load__:
+            self._stored = doc
+        cache = _cache_for(type(self), db)
+        if cache is not None:
+            cache.set(_cache_key(db, self.id), doc, expiration)
         return self
 
+    def astore(self, db, expiration=0, flags=0):
+        """Start storing the document in the given bucket without blocking.
+
+        The operation runs in a worker thread, alongside the other pending
+        operations, so `db` should be thread-safe, such as a `BucketPool`.
+
+        :param db: the `BucketPool` or `AsyncBucket` object to store the
+                   document in
+        :return: an `AsyncResult` whose ``get()`` method returns this
+                 `Document` instance
+        """
+        return async_bucket(db).apply_async(
+            lambda db: self.store(db, expiration, flags))
+
+    @classmethod
+    def store_many(cls, db, docs, expiration=0, flags=0, chunk_size=100,
+                   only_if_dirty=False):
+        """Store a batch of documents in the given bucket.
+
+        Documents without an ID are assigned one first. If the bucket provides
+        a ``set_multi(expiration, flags, items)`` method, which takes a dict of
+        IDs to values and returns a dict of the IDs that failed to their
+        errors, each chunk of `chunk_size` documents is written in a single
+        pipelined request; otherwise the documents are written one at a time.
+        The `Bucket` of the Couchbase client has no such method; a
+        `BucketPool` provides one that writes the documents over several
+        connections concurrently. A failing document does not prevent the
+        others from being stored.
+
+        :param db: the `Bucket` object to store the documents in
+        :param docs: a sequence of `Document` instances
+        :param chunk_size: the number of documents to send per request
+        :param only_if_dirty: skip the documents that have not been modified
+                              since they were last loaded or stored
+        :return: a list of ``(document, error)`` tuples in the order of
+                 `docs`, where `error` is ``None`` if the document was stored
+                 or skipped
+        :raise ValueError: if different documents have the same ID, as only
+                           one of them could be stored
+        """
+        docs = list(docs)
+        pending = []
+        by_id = {}
+        for doc in docs:
+            if only_if_dirty and not doc.is_dirty:
+                continue
+            if doc.id is None:
+                doc.id = uuid.uuid4().hex
+            if doc.id in by_id:
+                if by_id[doc.id] is not doc:
+                    raise ValueError('Duplicate document id %r' % doc.id)
+                continue
+            by_id[doc.id] = doc
+            pending.append(doc)
+        values = dict((doc.id, doc._encode()) for doc in pending)
+        packed = dict((doc.id, doc._pack(values[doc.id], flags))
+                      for doc in pending)
+        set_multi = getattr(db, 'set_multi', None)
+        errors = {}
+        cache = _cache_for(cls, db)
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            if set_multi is None:
+                for doc in chunk:
+                    try:
+                        db.set(doc.id, expiration, *packed[doc.id])
+                    except Exception as e:
+                        errors[doc.id] = e
+                continue
+            # Compressed documents are stored with other flags than the rest
+            by_flags = {}
+            for doc in chunk:
+                item_flags, value = packed[doc.id]
+                by_flags.setdefault(item_flags, {})[doc.id] = value
+            for item_flags, items in by_flags.items():
+                try:
+                    errors.update(set_multi(expiration, item_flags, items))
+                except Exception as e:
+                    errors.update((id, e) for id in items)
+        for doc in pending:
+            if doc.id not in errors:
+                if doc.__track_changes__ or doc.__lazy_load__:
+                    doc._stored = values[doc.id]
+                if cache is not None:
+                    cache.set(_cache_key(db, doc.id), values[doc.id],
+                              expiration)
+        return [(doc, errors.get(doc.id)) for doc in docs]
+
     @classmethod
-    def view(cls, db, viewname, **options):
+    def view(cls, db, viewname, fetch_docs=False, **options):
         """Query a Couchbase view and map the result values back to
         objects of this mapping.
 
         Note that by default, any properties of the document that are not
         included in the values of the view will be treated as if they were
         missing from the document. If you want to load the full document for
-        every row, set the ``include_docs`` option to ``True``.
+        every row, set the ``include_docs`` option to ``True``, or
+        `fetch_docs` to fetch the documents of all rows with a single
+        multi-get instead.
+
+        :param fetch_docs: whether to load the documents of the rows with
+                           `load_many` rather than wrap the row values;
+                           documents deleted since the view was indexed are
+                           left out
+        """
+        rows = db.view(viewname, **options)
+        if fetch_docs:
+            return cls._fetch_docs(db, rows)
+        return [cls._wrap_row(row) for row in rows]
+
+    @classmethod
+    def iterview(cls, db, viewname, page_size=100, fetch_docs=False,
+                 prefetch=False, **options):
+        """Query a Couchbase view one page at a time, and iterate over the
+        result values mapped back to objects of this mapping.
+
+        Only one page of results is held in memory at a time; see
+        `ViewDefinition.iterview`.
+
+        With `fetch_docs`, the documents of each page are loaded with a single
+        multi-get, as in `view`. With `prefetch` as well, the next page and
+        its documents are fetched in a worker thread while the current page
+        is consumed. The bucket is then used from two threads at once, so it
+        should be thread-safe, such as a `BucketPool`.
+
+        :param page_size: the number of rows to request at a time
+        :param fetch_docs: whether to load the documents of the rows with
+                           `load_many` rather than wrap the row values
+        :param prefetch: whether to fetch the next page in the background
+                         while the current one is consumed
+        """
+        pages = iter_pages(db, viewname, page_size, **options)
+        if not fetch_docs:
+            for rows in pages:
+                for row in rows:
+                    yield cls._wrap_row(row)
+            return
+
+        def fetch_page(_):
+            rows = next(pages, None)
+            if rows is None:
+                return None
+            return cls._fetch_docs(db, rows)
+        if not prefetch:
+            for docs in iter(lambda: fetch_page(db), None):
+                for doc in docs:
+                    yield doc
+            return
+        bucket = async_bucket(db)
+        pending = bucket.apply_async(fetch_page)
+        while True:
+            docs = pending.get()
+            if docs is None:
+                break
+            pending = bucket.apply_async(fetch_page)
+            for doc in docs:
+                yield doc
+
+    @classmethod
+    def _fetch_docs(cls, db, rows):
+        return cls.load_many(db, [row['id'] for row in rows], missing='skip')
+
+    @classmethod
+    def aview(cls, db, viewname, **options):
+        """Start querying a Couchbase view without blocking.
+
+        The operation runs in a worker thread, alongside the other pending
+        operations, so `db` should be thread-safe, such as a `BucketPool`.
+
+        :param db: the `BucketPool` or `AsyncBucket` object to query
+        :return: an `AsyncResult` whose ``get()`` method returns what `view`
+                 would return
         """
-        return [cls._wrap_row(row) for row in db.view(viewname, **options)]
+        return async_bucket(db).apply_async(
+            lambda db: cls.view(db, viewname, **options))
 
     @classmethod
     def _wrap_row(cls, row):
         doc = row.get('doc')
         if doc is not None:
-            return cls.wrap(doc.get('json'), id=row['id'])
+            data = doc.get('json')
+            if isinstance(data, basestring):
+                data = cls._codec().loads(data)
+            return cls.wrap(data, id=row['id'])
         data = row['value']
         return cls.wrap(data)
 
@@ -456,6 +1244,13 @@ class DateField(Field):
 
     def _to_python(self, value):
         if isinstance(value, basestring):
+            match = _DATE_RE.match(value)
+            if match is not None:
+                year, month, day = match.groups()
+                try:
+                    return date(int(year), int(month), int(day))
+                except ValueError:
+                    pass  # let strptime report the error
             try:
                 value = date(*strptime(value, '%Y-%m-%d')[:3])
             except ValueError:
@@ -482,6 +1277,14 @@ class DateTimeField(Field):
 
     def _to_python(self, value):
         if isinstance(value, basestring):
+            match = _DATETIME_RE.match(value)
+            if match is not None:
+                year, month, day, hour, minute, second = match.groups()
+                try:
+                    return datetime(int(year), int(month), int(day),
+                                    int(hour), int(minute), int(second))
+                except ValueError:
+                    pass  # let strptime report the error
             try:
                 value = value.split('.', 1)[0]  # strip out microseconds
                 value = value.rstrip('Z')  # remove timezone separator
@@ -495,6 +1298,8 @@ class DateTimeField(Field):
             value = datetime.utcfromtimestamp(timegm(value))
         elif not isinstance(value, datetime):
             value = datetime.combine(value, time(0))
+        if value.tzinfo is None:
+            return value.isoformat()[:19] + 'Z'  # strip out microseconds
         return value.replace(microsecond=0).isoformat() + 'Z'
 
 
@@ -512,6 +1317,13 @@ class TimeField(Field):
 
     def _to_python(self, value):
         if isinstance(value, basestring):
+            match = _TIME_RE.match(value)
+            if match is not None:
+                hour, minute, second = match.groups()
+                try:
+                    return time(int(hour), int(minute), int(second))
+                except ValueError:
+                    pass  # let strptime report the error
             try:
                 value = value.split('.', 1)[0]  # strip out microseconds
                 value = time(*strptime(value, '%H:%M:%S')[3:6])
@@ -522,6 +1334,8 @@ class TimeField(Field):
     def _to_json(self, value):
         if isinstance(value, datetime):
             value = value.time()
+        if value.tzinfo is None:
+            return value.isoformat()[:8]  # strip out microseconds
         return value.replace(microsecond=0).isoformat()
 
 
@@ -559,9 +1373,11 @@ class DictField(Field):
 
     >>> server.delete('python-tests')
     """
-    def __init__(self, mapping=None, name=None, default=None):
+    def __init__(self, mapping=None, name=None, default=None, memoize=None,
+                 index=False):
         default = default or {}
-        Field.__init__(self, name=name, default=lambda: default.copy())
+        Field.__init__(self, name=name, default=lambda: default.copy(),
+                       memoize=memoize, index=index)
         self.mapping = mapping
 
     def _to_python(self, value):
@@ -623,9 +1439,11 @@ class ListField(Field):
     >>> server.delete('python-tests')
     """
 
-    def __init__(self, field, name=None, default=None):
+    def __init__(self, field, name=None, default=None, memoize=None,
+                 index=False):
         default = default or []
-        Field.__init__(self, name=name, default=lambda: copy.copy(default))
+        Field.__init__(self, name=name, default=lambda: copy.copy(default),
+                       memoize=memoize, index=index)
         if type(field) is type:
             if issubclass(field, Field):
                 field = field()
@@ -747,3 +1565,53 @@ class ListField(Field):
 
         def pop(self, *args):
             return self.field._to_python(self.list.pop(*args))
+
+
+def _is_parsed(doc):
+    # Whether ``_data`` is set, without parsing lazily loaded documents
+    try:
+        Mapping._data.__get__(doc)
+    except AttributeError:
+        return False
+    return True
+
+
+def _get(db, id):
+    try:
+        return db.get(id)
+    except MemcachedError as e:
+        if e.status == MemcachedConstants.ERR_NOT_FOUND:
+            raise NotFoundError('Document with id {} not found'.format(id), e)
+        elif e.status == MEMCACHED_STATUS_INVALID_ARGUMENTS:
+            raise InvalidArgumentError('{} is not valid document id'.format(repr(id)), e)
+        else:
+            raise e
+
+
+def _cache_for(cls, db):
+    # Documents are only cached for buckets with a name to key them by
+    if getattr(db, 'name', None) is None:
+        return None
+    return cls.__cache__
+
+
+def _cache_key(db, id):
+    # The bucket name keeps apart the documents of the same ID in different
+    # buckets
+    return (db.name, id)
+
+
+def _get_multi(db, ids):
+    keys = list(set(ids))
+    if not keys:
+        return {}
+    get_multi = getattr(db, 'get_multi', None)
+    if get_multi is not None:
+        return get_multi(keys)
+    found = {}
+    for id in keys:
+        try:
+            found[id] = _get(db, id)
+        except NotFoundError:
+            pass
+    return found
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+
+"""In-memory stand-in for a Couchbase bucket.
+
+A `MemoryBucket` implements the subset of the `couchbase.client.Bucket` API
+that the mapping layer uses, so that code can be tested and benchmarked
+without a Couchbase server:
+
+>>> from couchbase_mapping import Document, TextField
+>>> class Person(Document):
+...     name = TextField()
+>>> db = MemoryBucket()
+>>> person = Person(id='joe', name='Joe').store(db)
+>>> Person.load(db, 'joe').name
+u'Joe'
+
+Views cannot run JavaScript, so they are evaluated by Python functions
+registered for their design document and name. The map function takes the
+decoded document and its metadata, and returns the ``(key, value)`` pairs it
+emits:
+
+>>> db.register_view('people', 'by_name',
+...                  lambda doc, meta: [(doc['name'], None)])
+>>> [row['id'] for row in db.view('_design/people/_view/by_name', key='Joe')]
+['joe']
+
+Every operation can be made to take some time, with a random jitter, and to
+fail at a given rate, to simulate a network and a busy server. The random
+numbers come from a generator seeded with `seed`, so that runs can be
+reproduced:
+
+>>> db = MemoryBucket(latency={'get': 0.001, 'view': 0.01}, jitter=0.001,
+...                   error_rate=0.01, seed=42)
+"""
+
+import json
+import random
+from threading import Lock
+import time
+from urllib import unquote_plus
+
+from couchbase.client import DesignDoc
+from couchbase.constants import MemcachedConstants
+from couchbase.exception import MemcachedError
+
+from couchbase_mapping import codec, compression
+
+__all__ = ['MemoryBucket', 'ERR_TEMPORARY_FAILURE']
+__docformat__ = 'restructuredtext en'
+
+# The memcached status of temporary failures, the default injected error
+ERR_TEMPORARY_FAILURE = 0x86
+
+# Items with these flags are not JSON, and are not seen by views
+_BINARY_FLAGS = codec.FLAGS_MASK | compression.FLAGS_MASK
+
+# Bounds below and above the collation keys of all values and IDs
+_MIN = ()
+_MAX = (9,)
+
+
+class MemoryBucket(object):
+    """Bucket that keeps its items and design documents in memory."""
+
+    def __init__(self, latency=0, jitter=0, error_rate=0, error=None,
+                 seed=None, name='memory'):
+        """Initialize the bucket.
+
+        :param latency: the number of seconds every operation takes, or a
+                        dict of the number of seconds by operation name, such
+                        as ``'get'``, ``'set'`` or ``'view'``
+        :param jitter: the maximum number of seconds randomly added to the
+                       latency of every operation
+        :param error_rate: the probability for every operation to fail, or a
+                           dict of probabilities by operation name
+        :param error: a callable returning the exception raised by failed
+                      operations, by default a `MemcachedError` with the
+                      `ERR_TEMPORARY_FAILURE` status
+        :param seed: the seed of the random jitter and failures
+        :param name: the name of the bucket
+        """
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error = error or (lambda: MemcachedError(
+            ERR_TEMPORARY_FAILURE, 'Temporary failure'))
+        self.calls = 0
+        self.data = {}
+        self.design_docs = {}
+        self.views = {}
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        # Incremented on every write, to know when view indexes are outdated
+        self._version = 0
+        self._indexes = {}
+
+    def _round_trip(self, operation=None):
+        with self._lock:
+            self.calls += 1
+            delay = _setting(self.latency, operation)
+            if self.jitter:
+                delay += self._random.uniform(0, self.jitter)
+            error_rate = _setting(self.error_rate, operation)
+            failed = error_rate and self._random.random() < error_rate
+        if delay:
+            time.sleep(delay)
+        if failed:
+            raise self.error()
+
+    def _store(self, key, flags, value):
+        if isinstance(value, dict):
+            value = json.dumps(value)
+        self.data[key] = (flags, value)
+        self._version += 1
+
+    def get(self, key):
+        """Return the ``(flags, cas, value)`` tuple of the item with the
+        given key.
+
+        :raise MemcachedError: if there is no such item
+        """
+        self._round_trip('get')
+        try:
+            flags, value = self.data[key]
+        except KeyError:
+            raise MemcachedError(MemcachedConstants.ERR_NOT_FOUND, 'Not found')
+        return flags, 0, value
+
+    def get_multi(self, keys):
+        """Return a dict of the ``(flags, cas, value)`` tuples of the items
+        with the given keys that exist.
+        """
+        self._round_trip('get_multi')
+        data = self.data
+        return dict((key, (data[key][0], 0, data[key][1]))
+                    for key in keys if key in data)
+
+    def set(self, key, expiration, flags, value):
+        """Store an item; the expiration is ignored."""
+        self._round_trip('set')
+        self._store(key, flags, value)
+
+    def set_multi(self, expiration, flags, items):
+        """Store a dict of items with the same flags.
+
+        :return: a dict of the errors by key, which is always empty
+        """
+        self._round_trip('set_multi')
+        for key, value in items.items():
+            self._store(key, flags, value)
+        return {}
+
+    def delete(self, key, cas=0):
+        """Delete the item with the given key.
+
+        :raise MemcachedError: if there is no such item
+        """
+        self._round_trip('delete')
+        if key not in self.data:
+            raise MemcachedError(MemcachedConstants.ERR_NOT_FOUND, 'Not found')
+        del self.data[key]
+        self._version += 1
+
+    def __setitem__(self, key, value):
+        if key.startswith('_design/'):
+            self._round_trip('design')
+            self.design_docs[key[8:]] = json.dumps(value)
+        else:
+            self.set(key, 0, 0, value)
+
+    def __getitem__(self, key):
+        if key.startswith('_design/'):
+            self._round_trip('design')
+            if key[8:] not in self.design_docs:
+                raise MemcachedError(MemcachedConstants.ERR_NOT_FOUND,
+                                     'Design document not found')
+            return DesignDoc(key[8:], json.loads(self.design_docs[key[8:]]),
+                             self)
+        return self.get(key)
+
+    def register_view(self, design, name, map_fun, reduce_fun=None):
+        """Register the Python functions evaluating a view.
+
+        :param design: the name of the design document
+        :param name: the name of the view
+        :param map_fun: a function taking a document and a dict of its
+                        metadata (its ``id`` and ``flags``), and returning an
+                        iterable of ``(key, value)`` pairs
+        :param reduce_fun: ``'_count'``, ``'_sum'``, or a function taking the
+                           list of keys and the list of values to reduce, and
+                           returning the reduced value (optional)
+        """
+        if design.startswith('_design/'):
+            design = design[8:]
+        self.views[design, name] = map_fun, reduce_fun
+        self._indexes.pop((design, name), None)
+
+    def view(self, view, **options):
+        """Query a view evaluated by the registered Python functions, and
+        return the list of result rows.
+
+        The options of Couchbase views are supported, except ``stale``, as
+        views are always up to date, and the options that only affect the
+        HTTP request. Options that the official client passes through
+        unencoded, such as ``keys``, ``startkey`` and ``endkey``, are expected
+        as JSON strings, percent-encoded as in a query string. Strings are collated by code point, rather than with
+        the Unicode Collation Algorithm Couchbase uses.
+
+        :param view: the path of the view, as
+                     ``'_design/<design>/_view/<name>'``
+        :raise ValueError: if no Python function is registered for the view
+        """
+        self._round_trip('view')
+        parts = view.split('/')
+        if len(parts) != 4 or parts[0] != '_design' or parts[2] != '_view':
+            raise ValueError('Invalid view path %r' % view)
+        map_fun, reduce_fun = self._view_functions(parts[1], parts[3])
+        rows = _select(self._index(parts[1], parts[3], map_fun), options)
+        if reduce_fun is not None and _bool(options.get('reduce', True)):
+            rows = _reduce(rows, reduce_fun, options)
+        elif _bool(options.get('include_docs', False)):
+            rows = [dict(row, doc=self._doc(row['id'])) for row in rows]
+        skip = int(options.get('skip', 0))
+        limit = options.get('limit')
+        if limit is not None:
+            return rows[skip:skip + int(limit)]
+        return rows[skip:]
+
+    def _view_functions(self, design, name):
+        try:
+            return self.views[design, name]
+        except KeyError:
+            raise ValueError('No Python function is registered for view '
+                             '%s/%s' % (design, name))
+
+    def _index(self, design, name, map_fun):
+        # Rows of the view sorted by key and ID, with their collation keys,
+        # rebuilt when items have changed since they were computed
+        version, rows = self._indexes.get((design, name), (None, None))
+        if version == self._version:
+            return rows
+        version = self._version
+        rows = []
+        for id, (flags, value) in self.data.items():
+            doc = _decode(flags, value)
+            if doc is None:
+                continue
+            for key, value in map_fun(doc, {'id': id, 'flags': flags}) or ():
+                rows.append(((_collate(key), _collate(id)),
+                             {'id': id, 'key': key, 'value': value}))
+        rows.sort(key=lambda entry: entry[0])
+        self._indexes[design, name] = version, rows
+        return rows
+
+    def _doc(self, id):
+        item = self.data.get(id)
+        if item is None:
+            return None
+        return {'meta': {'id': id, 'flags': item[0]},
+                'json': _decode(*item)}
+
+
+def _setting(setting, operation):
+    if isinstance(setting, dict):
+        return setting.get(operation, 0)
+    return setting
+
+
+def _bool(value):
+    if isinstance(value, basestring):
+        return value.lower() == 'true'
+    return bool(value)
+
+
+def _json_option(options, name):
+    # The official client does not encode these options, so they are given
+    # as JSON strings, which are read from the query string as the server
+    # reads them
+    value = options[name]
+    if isinstance(value, basestring):
+        value = json.loads(unquote_plus(value))
+    return value
+
+
+def _decode(flags, value):
+    if flags & _BINARY_FLAGS:
+        return None
+    try:
+        return json.loads(value)
+    except ValueError:
+        return None
+
+
+def _collate(value):
+    # Sorts like Couchbase: null, false, true, numbers, strings, arrays, then
+    # objects
+    if value is None:
+        return (0,)
+    if value is False:
+        return (1,)
+    if value is True:
+        return (2,)
+    if isinstance(value, (int, long, float)):
+        return (3, value)
+    if isinstance(value, str):
+        return (4, value.decode('utf-8'))
+    if isinstance(value, unicode):
+        return (4, value)
+    if isinstance(value, (list, tuple)):
+        return (5, tuple(_collate(item) for item in value))
+    if isinstance(value, dict):
+        return (6, tuple((_collate(key), _collate(item))
+                         for key, item in sorted(value.items())))
+    raise TypeError('Cannot collate %r' % (value,))
+
+
+def _select(index, options):
+    # Returns copies of the rows of the index selected by the key options
+    if 'keys' in options or 'key' in options:
+        if 'keys' in options:
+            keys = _json_option(options, 'keys')
+        else:
+            keys = [options['key']]
+        by_key = {}
+        for (key, id), row in index:
+            by_key.setdefault(key, []).append(row)
+        rows = [row for key in keys for row in by_key.get(_collate(key), ())]
+        if _bool(options.get('descending', False)):
+            rows.reverse()
+        return [dict(row) for row in rows]
+
+    descending = _bool(options.get('descending', False))
+    inclusive_end = _bool(options.get('inclusive_end', True))
+    start = end = None
+    for name in ('start_key', 'startkey'):
+        if name in options:
+            start = (_collate(_json_option(options, name)
+                              if name == 'startkey' else options[name]),
+                     _docid_bound(options, 'startkey_docid',
+                                  _MAX if descending else _MIN))
+    for name in ('end_key', 'endkey'):
+        if name in options:
+            end = (_collate(_json_option(options, name)
+                            if name == 'endkey' else options[name]),
+                   _docid_bound(options, 'endkey_docid',
+                                _MIN if descending else _MAX))
+    if descending:
+        index = reversed(index)
+    rows = []
+    for sort_key, row in index:
+        if descending:
+            if start is not None and sort_key > start:
+                continue
+            if end is not None and (sort_key < end if inclusive_end
+                                    else sort_key[0] <= end[0]):
+                break
+        else:
+            if start is not None and sort_key < start:
+                continue
+            if end is not None and (sort_key > end if inclusive_end
+                                    else sort_key[0] >= end[0]):
+                break
+        rows.append(dict(row))
+    return rows
+
+
+def _docid_bound(options, name, default):
+    if name in options:
+        return _collate(options[name])
+    return default
+
+
+def _reduce(rows, reduce_fun, options):
+    if reduce_fun == '_count':
+        reduce_fun = lambda keys, values: len(values)
+    elif reduce_fun == '_sum':
+        reduce_fun = lambda keys, values: sum(values)
+    group_level = options.get('group_level')
+    if group_level is None and not _bool(options.get('group', False)):
+        if not rows:
+            return []
+        return [{'key': None,
+                 'value': reduce_fun([row['key'] for row in rows],
+                                     [row['value'] for row in rows])}]
+    groups = []
+    for row in rows:
+        key = row['key']
+        if group_level is not None and isinstance(key, list):
+            key = key[:int(group_level)]
+        if groups and _collate(groups[-1][0]) == _collate(key):
+            groups[-1][1].append(row)
+        else:
+            groups.append((key, [row]))
+    return [{'key': key,
+             'value': reduce_fun([row['key'] for row in group],
+                                 [row['value'] for row in group])}
+            for key, group in groups]
@@ -0,0 +1,326 @@
+# -*- coding: utf-8 -*-
+
+"""Thread-safe pooling of bucket connections.
+
+The connections of the official Couchbase client must not be shared between
+threads. A `BucketPool` keeps a bounded number of `Bucket` objects and lends
+each one to a single thread at a time:
+
+>>> from couchbase import Couchbase
+>>> server = Couchbase('localhost', 'Administrator', 'password')
+>>> server.create('python-tests')                           #doctest: +ELLIPSIS
+<couchbase.client.Bucket object at ...>
+>>> pool = BucketPool(lambda: server.bucket('python-tests'), size=4,
+...                   timeout=5)
+
+The pool provides the key/value and view methods of a `Bucket` listed in
+`BUCKET_METHODS`, each call checking out a connection for its duration, so it
+can be passed anywhere the mapping layer accepts a bucket:
+
+>>> from couchbase_mapping import Document, TextField
+>>> class Person(Document):
+...     name = TextField()
+>>> person = Person(name='John Doe').store(pool)
+>>> Person.load(pool, person.id).name
+u'John Doe'
+
+The client has no multi-get or multi-set, so `BucketPool.get_multi` and
+`BucketPool.set_multi` spread the items over several connections at once, and
+`Document.load_many` and `Document.store_many` use them:
+
+>>> people = [Person(name='Person %d' % i) for i in range(10)]
+>>> [error for doc, error in Person.store_many(pool, people)]
+[None, None, None, None, None, None, None, None, None, None]
+>>> [doc.name for doc in Person.load_many(pool, [person.id])]
+[u'John Doe']
+
+To run several operations on the same connection, check it out explicitly:
+
+>>> with pool.connection() as db:
+...     person = Person.load(db, person.id)
+...     person = person.store(db)
+
+>>> server.delete('python-tests')
+"""
+
+from contextlib import contextmanager
+from threading import Condition, Thread
+import time
+
+from couchbase.constants import MemcachedConstants
+from couchbase.exception import MemcachedError
+
+from couchbase_mapping.exception import PoolTimeoutError
+
+__all__ = ['BucketPool', 'BUCKET_METHODS']
+__docformat__ = 'restructuredtext en'
+
+DEFAULT = object()
+
+# The methods of `Bucket` that a `BucketPool` provides, each call checking out
+# a connection for its duration
+BUCKET_METHODS = ('get', 'set', 'add', 'replace', 'delete', 'append',
+                  'prepend', 'incr', 'decr', 'cas', 'touch', 'gat', 'getl',
+                  'stats', 'save', 'view', 'design_docs', 'flush')
+
+
+class BucketPool(object):
+    """Bounded pool of `Bucket` connections."""
+
+    def __init__(self, factory, size=10, timeout=None, max_idle=None,
+                 check=None):
+        """Initialize the pool.
+
+        :param factory: a callable that opens and returns a new `Bucket`
+        :param size: the maximum number of connections
+        :param timeout: the number of seconds to wait for a connection when
+                        all of them are in use, or `None` to wait forever
+        :param max_idle: the number of seconds after which an unused
+                         connection is closed, or `None` to keep connections
+                         open
+        :param check: an optional callable that is passed a connection before
+                      it is reused and returns whether it is still healthy;
+                      unhealthy connections are closed and replaced
+        """
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.check = check
+        # The name of the bucket, known once a connection has been opened
+        self.name = None
+        self._idle = []
+        self._in_use = 0
+        self._cond = Condition()
+
+    def __len__(self):
+        """Return the number of open connections."""
+        with self._cond:
+            return self._in_use + len(self._idle)
+
+    def checkout(self, timeout=DEFAULT):
+        """Take a connection out of the pool, opening a new one if none is
+        idle and the pool is not full.
+
+        :param timeout: overrides the `timeout` of the pool
+        :return: a `Bucket` instance, which must be returned with `checkin`
+        :raise PoolTimeoutError: if no connection became available in time
+        """
+        if timeout is DEFAULT:
+            timeout = self.timeout
+        if timeout is not None:
+            deadline = time.time() + timeout
+        evicted = []
+        try:
+            with self._cond:
+                evicted.extend(self._evict_idle())
+                while True:
+                    if self._idle:
+                        bucket = self._idle.pop()[0]
+                        break
+                    if self._in_use < self.size:
+                        bucket = None
+                        break
+                    if timeout is None:
+                        self._cond.wait()
+                    elif deadline <= time.time():
+                        raise PoolTimeoutError('No connection available '
+                                               'after %s seconds' % timeout)
+                    else:
+                        self._cond.wait(deadline - time.time())
+                    evicted.extend(self._evict_idle())
+                self._in_use += 1
+        finally:
+            _close_all(evicted)
+        try:
+            if bucket is not None and self.check is not None:
+                if not self.check(bucket):
+                    _close(bucket)
+                    bucket = None
+            if bucket is None:
+                bucket = self.factory()
+                self.name = getattr(bucket, 'name', None)
+        except Exception:
+            self.discard(None)
+            raise
+        return bucket
+
+    def checkin(self, bucket):
+        """Return a connection obtained from `checkout` to the pool."""
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((bucket, time.time()))
+            self._cond.notify()
+
+    def discard(self, bucket):
+        """Close a connection obtained from `checkout` instead of returning it
+        to the pool, for example because it is broken.
+        """
+        with self._cond:
+            self._in_use -= 1
+            self._cond.notify()
+        if bucket is not None:
+            _close(bucket)
+
+    @contextmanager
+    def connection(self, timeout=DEFAULT):
+        """Context manager that checks out a connection for the duration of
+        the ``with`` block.
+        """
+        bucket = self.checkout(timeout)
+        try:
+            yield bucket
+        finally:
+            self.checkin(bucket)
+
+    def evict_idle(self):
+        """Close the connections that have been idle for longer than
+        `max_idle` seconds.
+        """
+        with self._cond:
+            evicted = self._evict_idle()
+        _close_all(evicted)
+
+    def _evict_idle(self):
+        # Removes the connections to close from the pool, and returns them to
+        # be closed once the lock is released
+        evicted = []
+        if self.max_idle is not None:
+            limit = time.time() - self.max_idle
+            while self._idle and self._idle[0][1] < limit:
+                evicted.append(self._idle.pop(0)[0])
+        return evicted
+
+    def get_multi(self, keys):
+        """Fetch the items with the given keys, over up to `size` connections
+        at once.
+
+        A bucket with a ``get_multi`` method of its own fetches all items in a
+        single call. Otherwise the keys are shared among threads, each of
+        which fetches its items one at a time over a connection of its own,
+        so that the time taken is divided by the number of connections. Only
+        the connections that are free at the time are used, so the items are
+        fetched one at a time when all others are in use.
+
+        :return: a dict of the ``(flags, cas, value)`` tuples of the items
+                 that exist, by key
+        """
+        keys = list(keys)
+        found = {}
+        if not keys:
+            return found
+        with self.connection() as bucket:
+            get_multi = getattr(bucket, 'get_multi', None)
+            if get_multi is not None:
+                return get_multi(keys)
+            self._spread(bucket, keys,
+                         lambda bucket, keys: _get_items(bucket, keys, found))
+        return found
+
+    def set_multi(self, expiration, flags, items):
+        """Store a dict of items with the same flags, over up to `size`
+        connections at once.
+
+        A bucket with a ``set_multi`` method of its own stores all items in a
+        single call. Otherwise the items are shared among the connections
+        that are free, as with `get_multi`, and stored one at a time.
+
+        :return: a dict of the errors of the items that could not be stored,
+                 by key
+        """
+        errors = {}
+        if not items:
+            return errors
+        with self.connection() as bucket:
+            set_multi = getattr(bucket, 'set_multi', None)
+            if set_multi is not None:
+                return set_multi(expiration, flags, items)
+
+            def store(bucket, keys):
+                for key in keys:
+                    try:
+                        bucket.set(key, expiration, flags, items[key])
+                    except Exception as e:
+                        errors[key] = e
+            self._spread(bucket, list(items), store)
+        return errors
+
+    def _spread(self, bucket, keys, func):
+        # Calls `func(bucket, keys)` in threads on shares of the keys, over
+        # the given connection and the others that are free right now. Never
+        # waiting for a connection while holding one is what keeps concurrent
+        # callers, or a caller that already holds a connection, from
+        # deadlocking
+        buckets = [bucket]
+        try:
+            while len(buckets) < min(self.size, len(keys)):
+                try:
+                    buckets.append(self.checkout(timeout=0))
+                except PoolTimeoutError:
+                    break
+            count = len(buckets)
+            errors = []
+
+            def run(bucket, keys):
+                try:
+                    func(bucket, keys)
+                except Exception as e:
+                    errors.append(e)
+            threads = [Thread(target=run, args=(buckets[i], keys[i::count]))
+                       for i in range(1, count)]
+            for thread in threads:
+                thread.start()
+            try:
+                func(bucket, keys[::count])
+            finally:
+                for thread in threads:
+                    thread.join()
+        finally:
+            for other in buckets[1:]:
+                self.checkin(other)
+        if errors:
+            raise errors[0]
+
+    def __getitem__(self, key):
+        with self.connection() as bucket:
+            return bucket[key]
+
+    def __setitem__(self, key, value):
+        with self.connection() as bucket:
+            bucket[key] = value
+
+
+def _forward(name):
+    def method(self, *args, **kwargs):
+        with self.connection() as bucket:
+            return getattr(bucket, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = 'Call `Bucket.%s` on a connection of the pool.' % name
+    return method
+
+
+for _name in BUCKET_METHODS:
+    setattr(BucketPool, _name, _forward(_name))
+del _name
+
+
+def _close(bucket):
+    # The client has no public way to close a bucket, which closes its
+    # connections when it is garbage collected; `done()` does it right away
+    client = getattr(bucket, 'mc_client', None)
+    if client is not None:
+        client.done()
+
+
+def _close_all(buckets):
+    for bucket in buckets:
+        _close(bucket)
+
+
+def _get_items(bucket, keys, found):
+    for key in keys:
+        try:
+            found[key] = bucket.get(key)
+        except MemcachedError as e:
+            if e.status != MemcachedConstants.ERR_NOT_FOUND:
+                raise
@@ -8,13 +8,20 @@
 
 import unittest
 
-from couchbase_mapping.tests import design, mapping
+from couchbase_mapping.tests import (asynchronous, cache, codec, compression,
+                                    design, mapping, memory, pool)
 
 
 def suite():
     suite = unittest.TestSuite()
+    suite.addTest(asynchronous.suite())
+    suite.addTest(cache.suite())
+    suite.addTest(codec.suite())
+    suite.addTest(compression.suite())
     suite.addTest(design.suite())
     suite.addTest(mapping.suite())
+    suite.addTest(memory.suite())
+    suite.addTest(pool.suite())
     return suite
 
 
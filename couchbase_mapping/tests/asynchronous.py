@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+import doctest
+import time
+import unittest
+
+from couchbase_mapping import asynchronous, mapping
+from couchbase_mapping.exception import NotFoundError
+from couchbase_mapping.tests import testutil
+
+
+class Person(mapping.Document):
+    name = mapping.TextField()
+    by_name = mapping.ViewField('people', 'function(doc) { emit(doc.name); }')
+
+
+class ViewBucket(testutil.MemoryBucket):
+
+    def view(self, view, **options):
+        self._round_trip('view')
+        return [{'id': key, 'key': None, 'value': {'name': key}}
+                for key in sorted(self.data)]
+
+
+class AsyncBucketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = asynchronous.AsyncBucket(ViewBucket(latency=0.01), size=100)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_concurrent_loads(self):
+        for i in range(100):
+            Person(id='person-%d' % i, name='Person %d' % i).store(self.db.bucket)
+        ids = ['person-%d' % (i % 100) for i in range(1000)]
+        start = time.time()
+        pending = [Person.aload(self.db, id) for id in ids]
+        people = [result.get() for result in pending]
+        elapsed = time.time() - start
+        self.assertEqual(ids, [person.id for person in people])
+        # Sequential loads would take at least ten seconds
+        self.assertTrue(elapsed < 2, elapsed)
+
+    def test_load_error(self):
+        result = Person.aload(self.db, 'missing')
+        self.assertRaises(NotFoundError, result.get)
+
+    def test_store(self):
+        person = Person(name='John Doe').astore(self.db).get()
+        self.assertEqual('John Doe', Person.load(self.db.bucket, person.id).name)
+
+    def test_view(self):
+        Person(id='a').store(self.db.bucket)
+        Person(id='b').store(self.db.bucket)
+        people = Person.aview(self.db, '_design/people/_view/by_name').get()
+        self.assertEqual(['a', 'b'], [person.name for person in people])
+
+    def test_aiter(self):
+        Person(id='a').store(self.db.bucket)
+        Person(id='b').store(self.db.bucket)
+        rows = Person.by_name.aiter(self.db)
+        self.assertEqual(['a', 'b'], [person.name for person in rows])
+
+    def test_shared_pool(self):
+        db = self.db.bucket
+        Person(id='a', name='John Doe').store(db)
+        self.assertEqual('John Doe', Person.aload(db, 'a').get().name)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(asynchronous))
+    suite.addTest(unittest.makeSuite(AsyncBucketTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import doctest
+import time
+import unittest
+
+from couchbase_mapping import cache, mapping
+from couchbase_mapping.pool import BucketPool
+from couchbase_mapping.tests import testutil
+
+
+class LRUCacheTestCase(unittest.TestCase):
+
+    def test_eviction(self):
+        lru = cache.LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(1, lru.get('a'))
+        self.assertEqual(None, lru.get('b'))
+        self.assertEqual(3, lru.get('c'))
+        self.assertEqual(1, lru.evictions)
+        self.assertEqual(3, lru.hits)
+        self.assertEqual(1, lru.misses)
+
+    def test_ttl(self):
+        lru = cache.LRUCache(ttl=0.01)
+        lru.set('a', 1)
+        self.assertEqual(1, lru.get('a'))
+        time.sleep(0.02)
+        self.assertEqual(None, lru.get('a'))
+        self.assertEqual(0, len(lru))
+
+    def test_expiration(self):
+        lru = cache.LRUCache(ttl=30)
+        lru.set('a', 1, expiration=int(time.time()) - 1)
+        self.assertEqual(None, lru.get('a'))
+        lru.set('b', 1, expiration=30)
+        self.assertEqual(1, lru.get('b'))
+
+    def test_delete_clear(self):
+        lru = cache.LRUCache()
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.delete('a')
+        self.assertEqual(None, lru.get('a'))
+        lru.clear()
+        self.assertEqual(0, len(lru))
+
+
+class DocumentCacheTestCase(unittest.TestCase):
+
+    class Account(mapping.Document):
+        __cache__ = cache.LRUCache(maxsize=10)
+        owner = mapping.TextField()
+        tags = mapping.ListField(mapping.TextField())
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        self.Account.__cache__.clear()
+
+    def test_read_through(self):
+        self.db['a'] = {'owner': 'John Doe'}
+        self.assertEqual('John Doe', self.Account.load(self.db, 'a').owner)
+        self.db.calls = 0
+        self.assertEqual('John Doe', self.Account.load(self.db, 'a').owner)
+        self.assertEqual(0, self.db.calls)
+
+    def test_write_through(self):
+        account = self.Account(id='a', owner='John Doe').store(self.db)
+        self.db.calls = 0
+        account.owner = 'Jane Doe'
+        account.store(self.db)
+        self.assertEqual('Jane Doe', self.Account.load(self.db, 'a').owner)
+        self.assertEqual(1, self.db.calls)
+
+    def test_store_expiration(self):
+        self.Account(id='a').store(self.db, expiration=int(time.time()) - 1)
+        self.db.calls = 0
+        self.Account.load(self.db, 'a')
+        self.assertEqual(1, self.db.calls)
+
+    def test_copies(self):
+        self.Account(id='a', tags=['x']).store(self.db)
+        account = self.Account.load(self.db, 'a')
+        account.tags.append('y')
+        account.owner = 'Someone'
+        other = self.Account.load(self.db, 'a')
+        self.assertEqual(['x'], other.tags)
+        self.assertEqual(None, other.owner)
+
+    def test_load_many(self):
+        self.Account(id='a').store(self.db)
+        self.db['b'] = {'owner': 'John Doe'}
+        self.db.calls = 0
+        accounts = self.Account.load_many(self.db, ['a', 'b'])
+        self.assertEqual(['a', 'b'], [account.id for account in accounts])
+        self.assertEqual(1, self.db.calls)
+        self.Account.load_many(self.db, ['a', 'b'])
+        self.assertEqual(1, self.db.calls)
+
+    def test_store_many(self):
+        accounts = [self.Account(owner='Owner %d' % i) for i in range(3)]
+        self.Account.store_many(self.db, accounts)
+        self.db.calls = 0
+        self.assertEqual('Owner 1',
+                         self.Account.load(self.db, accounts[1].id).owner)
+        self.assertEqual(0, self.db.calls)
+
+    def test_buckets(self):
+        db_a = testutil.MemoryBucket(name='a')
+        db_b = testutil.MemoryBucket(name='b')
+        self.Account(id='x', owner='A').store(db_a)
+        self.Account(id='x', owner='B').store(db_b)
+        self.assertEqual('A', self.Account.load(db_a, 'x').owner)
+        self.assertEqual('B', self.Account.load(db_b, 'x').owner)
+        accounts = self.Account.load_many(db_a, ['x'])
+        self.assertEqual('A', accounts[0].owner)
+
+    def test_pool(self):
+        pool = BucketPool(lambda: self.db)
+        self.Account(id='x', owner='A').store(pool)
+        self.assertEqual('A', self.Account.load(pool, 'x').owner)
+        self.db.calls = 0
+        self.Account.load(pool, 'x')
+        self.assertEqual(0, self.db.calls)
+
+    def test_nameless_bucket(self):
+        self.db.name = None
+        self.Account(id='x', owner='A').store(self.db)
+        self.assertEqual(0, len(self.Account.__cache__))
+        self.Account.load(self.db, 'x')
+        self.assertEqual(0, len(self.Account.__cache__))
+
+    def test_uncached_class(self):
+        class Account(mapping.Document):
+            owner = mapping.TextField()
+        Account(id='a').store(self.db)
+        self.db.calls = 0
+        Account.load(self.db, 'a')
+        Account.load(self.db, 'a')
+        self.assertEqual(2, self.db.calls)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(cache))
+    suite.addTest(unittest.makeSuite(LRUCacheTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(DocumentCacheTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+from datetime import date, datetime
+from datetime import time as dtime
+from decimal import Decimal
+import doctest
+import json
+import marshal
+import unittest
+
+from couchbase_mapping import codec, compression, mapping
+from couchbase_mapping.tests import testutil
+
+
+class CountingCodec(object):
+
+    def __init__(self):
+        self.dumped = self.loaded = 0
+
+    def dumps(self, value):
+        self.dumped += 1
+        return json.dumps(value, sort_keys=True)
+
+    def loads(self, value):
+        self.loaded += 1
+        return json.loads(value)
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.default = codec.get_default()
+
+    def tearDown(self):
+        codec._registry.pop('counting', None)
+        codec.use(self.default.name)
+
+    def test_stdlib(self):
+        self.assertTrue('json' in codec.names())
+        self.assertEqual(json.dumps, codec.find('json').dumps)
+
+    def test_find(self):
+        counting = codec.register('counting', json.dumps, json.loads)
+        self.assertEqual(counting, codec.find('missing', 'counting'))
+        self.assertEqual('json', codec.find('missing').name)
+
+    def test_use(self):
+        counting = codec.register('counting', json.dumps, json.loads)
+        self.assertEqual(counting, codec.use('counting'))
+        self.assertEqual(counting, codec.get_default())
+        self.assertEqual('json', codec.use('missing').name)
+
+    def test_use_binary(self):
+        self.assertRaises(ValueError, codec.use, 'marshal')
+        self.assertRaises(ValueError, codec.use, 'missing', 'marshal')
+        self.assertEqual('json', codec.get_default().name)
+
+
+class DocumentCodecTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.counting = CountingCodec()
+        self.db = testutil.MemoryBucket()
+
+        class Post(mapping.Document):
+            __codec__ = codec.Codec('counting', self.counting.dumps,
+                                    self.counting.loads)
+            title = mapping.TextField()
+            views = mapping.IntegerField()
+        self.Post = Post
+
+    def tearDown(self):
+        codec.use('json')
+
+    def test_store_load(self):
+        self.Post(id='foo', title='Foo', views=1).store(self.db)
+        self.assertEqual('{"title": "Foo", "views": 1}', self.db.get('foo')[2])
+        self.assertEqual(1, self.counting.dumped)
+        post = self.Post.load(self.db, 'foo')
+        self.assertEqual('Foo', post.title)
+        self.assertEqual(1, self.counting.loaded)
+
+    def test_store_many(self):
+        self.Post.store_many(self.db, [self.Post(title='Foo'),
+                                       self.Post(title='Bar')])
+        self.assertEqual(2, self.counting.dumped)
+
+    def test_from_json(self):
+        post = self.Post.from_json('{"title": "Foo"}', id='foo')
+        self.assertEqual('Foo', post.title)
+        self.assertEqual(1, self.counting.loaded)
+
+    def test_wrap_row(self):
+        post = self.Post._wrap_row({'id': 'foo',
+                                    'doc': {'json': '{"title": "Foo"}'}})
+        self.assertEqual('Foo', post.title)
+        self.assertEqual(1, self.counting.loaded)
+
+    def test_global_default(self):
+        counting = CountingCodec()
+        codec.use(codec.register('counting', counting.dumps,
+                                 counting.loads).name)
+        try:
+            class Post(mapping.Document):
+                title = mapping.TextField()
+            Post(id='foo', title='Foo').store(self.db)
+            self.assertEqual(1, counting.dumped)
+        finally:
+            codec._registry.pop('counting')
+
+
+class Event(mapping.Document):
+    __codec__ = codec.find('marshal')
+    __track_changes__ = True
+    title = mapping.TextField()
+    start = mapping.DateTimeField()
+    price = mapping.DecimalField()
+    ratio = mapping.FloatField()
+    venue = mapping.DictField(mapping.Mapping.build(
+        name=mapping.TextField(),
+        opened=mapping.DateField()))
+    sessions = mapping.ListField(mapping.DictField(mapping.Mapping.build(
+        title=mapping.TextField(),
+        start=mapping.TimeField())))
+    extra = mapping.DictField()
+
+
+class BinaryFormatTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        self.event = Event(
+            id='foo', title=u'Caf\xe9', start=datetime(2013, 5, 28, 15, 10),
+            price=Decimal('3.14159265358979323846'), ratio=0.1,
+            venue={'name': 'Hall', 'opened': date(1999, 1, 1)},
+            sessions=[{'title': 'Intro', 'start': dtime(9, 30)}],
+            extra={'nested': {'list': [1, 2L, 'three', None, True]}})
+
+    def test_flags(self):
+        self.event.store(self.db)
+        flags, value = self.db.data['foo']
+        self.assertEqual(codec.find('marshal').flag, flags)
+        self.assertEqual(self.event.unwrap(), marshal.loads(value))
+
+    def test_round_trip(self):
+        self.event.store(self.db)
+        event = Event.load(self.db, 'foo')
+        self.assertEqual(self.event.unwrap(), event.unwrap())
+        self.assertEqual(u'Caf\xe9', event.title)
+        self.assertEqual(datetime(2013, 5, 28, 15, 10), event.start)
+        self.assertEqual(Decimal('3.14159265358979323846'), event.price)
+        self.assertEqual(0.1, event.ratio)
+        self.assertEqual(date(1999, 1, 1), event.venue.opened)
+        self.assertEqual(dtime(9, 30), event.sessions[0].start)
+        self.assertEqual(type(self.event['extra']['nested']['list'][2]),
+                         type(event['extra']['nested']['list'][2]))
+        self.assertFalse(event.is_dirty)
+
+    def test_compressed(self):
+        class Compressed(Event):
+            __compress_threshold__ = 0
+        Compressed(id='foo', title='Foo').store(self.db)
+        self.assertEqual(codec.find('marshal').flag |
+                         compression.find().flag, self.db.data['foo'][0])
+        self.assertEqual('Foo', Compressed.load(self.db, 'foo').title)
+
+    def test_read_other_format(self):
+        class Plain(mapping.Document):
+            title = mapping.TextField()
+        Plain(id='plain', title='Foo').store(self.db)
+        self.assertEqual('Foo', Event.load(self.db, 'plain').title)
+
+    def test_reserved_flags(self):
+        self.assertRaises(ValueError, self.event.store, self.db,
+                          flags=0x00010000)
+
+    def test_unknown_flag(self):
+        # Other clients use the top byte for the format of items
+        self.db.set('plain', 0, 0x020F0000, '{"title": "Foo"}')
+        self.assertEqual('Foo', Event.load(self.db, 'plain').title)
+
+    def test_views(self):
+        def declare(**attrs):
+            attrs.update(__codec__=codec.find('marshal'),
+                         user=attrs.get('user', mapping.TextField()))
+            return type('Session', (mapping.Document,), attrs)
+        self.assertRaises(TypeError, declare,
+                          by_user=mapping.ViewField('sessions',
+                                                    'function(doc) {}'))
+        self.assertRaises(TypeError, declare,
+                          user=mapping.TextField(index=True))
+        self.assertRaises(TypeError, declare, __indexes__=[('user',)])
+
+        class Person(mapping.Document):
+            by_name = mapping.ViewField('people', 'function(doc) {}')
+        self.assertRaises(TypeError, type, 'Session', (Person,),
+                          {'__codec__': codec.find('marshal')})
+        self.assertEqual([], [cls for cls in mapping._view_registry.keys()
+                              if cls._codec().binary])
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(codec))
+    suite.addTest(unittest.makeSuite(RegistryTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(DocumentCodecTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(BinaryFormatTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import doctest
+import unittest
+import zlib
+
+from couchbase_mapping import cache, compression, mapping
+from couchbase_mapping.tests import testutil
+
+
+class Log(mapping.Document):
+    __compress_threshold__ = 1024
+    __track_changes__ = True
+    lines = mapping.ListField(mapping.TextField())
+
+
+class RegistryTestCase(unittest.TestCase):
+
+    def test_find(self):
+        self.assertEqual('zlib', compression.find().name)
+        self.assertEqual('zlib', compression.find('missing', 'zlib').name)
+
+    def test_for_flags(self):
+        zlib_compressor = compression.find('zlib')
+        self.assertEqual(None, compression.for_flags(0))
+        self.assertEqual(None, compression.for_flags(0x8F000001))
+        self.assertEqual(zlib_compressor,
+                         compression.for_flags(zlib_compressor.flag | 1))
+        self.assertEqual(None, compression.for_flags(0x00F00000))
+
+    def test_invalid_flag(self):
+        self.assertRaises(ValueError, compression.Compressor, 'foo', 1,
+                          zlib.compress, zlib.decompress)
+        self.assertRaises(ValueError, compression.Compressor, 'foo', 0,
+                          zlib.compress, zlib.decompress)
+
+
+class DocumentCompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        self.lines = ['Line %d' % i for i in range(500)]
+
+    def test_below_threshold(self):
+        Log(id='foo', lines=['Line']).store(self.db)
+        flags, value = self.db.data['foo']
+        self.assertEqual(0, flags)
+        self.assertEqual('{"lines": ["Line"]}', value)
+
+    def test_above_threshold(self):
+        log = Log(id='foo', lines=self.lines).store(self.db)
+        flags, value = self.db.data['foo']
+        self.assertEqual(compression.find('zlib').flag, flags)
+        self.assertEqual(log.raw_json(), zlib.decompress(value))
+        self.assertTrue(len(value) < len(log.raw_json()))
+        self.assertEqual(self.lines, Log.load(self.db, 'foo').lines)
+
+    def test_user_flags(self):
+        Log(id='foo', lines=self.lines).store(self.db, flags=3)
+        self.assertEqual(compression.find('zlib').flag | 3,
+                         self.db.data['foo'][0])
+        self.assertEqual(self.lines, Log.load(self.db, 'foo').lines)
+        self.assertRaises(ValueError, Log(lines=[]).store, self.db,
+                          flags=0x00100000)
+
+    def test_other_class(self):
+        class Plain(mapping.Document):
+            lines = mapping.ListField(mapping.TextField())
+        Plain(id='bar', lines=self.lines).store(self.db)
+        self.assertEqual(0, self.db.data['bar'][0])
+        # The format flags of Couchbase SDKs, and for classes without
+        # compression, the compression flags are not interpreted
+        for flags in (0x01000000, 0x02000000, compression.find().flag):
+            self.db.set('foo', 0, flags, '{"lines": ["Line"]}')
+            self.assertEqual(['Line'], Plain.load(self.db, 'foo').lines)
+
+    def test_unknown_flag(self):
+        self.db.set('foo', 0, 0x02F00000, '{"lines": ["Line"]}')
+        self.assertEqual(['Line'], Log.load(self.db, 'foo').lines)
+
+    def test_many(self):
+        report = Log.store_many(self.db, [Log(id='foo', lines=self.lines),
+                                          Log(id='bar', lines=['Line'])])
+        self.assertEqual([None, None], [error for _, error in report])
+        self.assertEqual(compression.find('zlib').flag,
+                         self.db.data['foo'][0])
+        self.assertEqual(0, self.db.data['bar'][0])
+        logs = Log.load_many(self.db, ['foo', 'bar'])
+        self.assertEqual([self.lines, ['Line']], [log.lines for log in logs])
+
+    def test_cache(self):
+        class CachedLog(Log):
+            __cache__ = cache.LRUCache()
+        log = CachedLog(id='foo', lines=self.lines).store(self.db)
+        key = (self.db.name, 'foo')
+        self.assertEqual(log.raw_json(), CachedLog.__cache__.get(key))
+        CachedLog.__cache__.clear()
+        CachedLog.load(self.db, 'foo')
+        self.assertEqual(log.raw_json(), CachedLog.__cache__.get(key))
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(compression))
+    suite.addTest(unittest.makeSuite(RegistryTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(DocumentCompressionTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
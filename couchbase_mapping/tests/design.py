@@ -7,9 +7,16 @@
 # you should have received as part of this distribution.
 
 import doctest
+import json
+import threading
+import time
 import unittest
+import urllib
 
-from couchbase_mapping import design
+from couchbase.exception import MemcachedError
+
+from couchbase_mapping import asynchronous, cache, design, mapping
+from couchbase_mapping.pool import BucketPool
 from couchbase_mapping.tests import testutil
 
 
@@ -45,9 +52,395 @@ class DesignTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         self.assertEqual(design_doc['views']['by_id']['map'], map_by_id)
 
 
+class IterViewTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # Duplicate keys make pages start in the middle of a key
+        self.db = testutil.RowsBucket([{'id': 'doc-%02d' % i, 'key': i // 3,
+                               'value': {'number': i}} for i in range(10)])
+        self.view = design.ViewDefinition('test', 'by_number',
+                                          'function(doc) {}')
+
+    def test_all_rows(self):
+        for page_size in range(1, 12):
+            rows = list(self.view.iterview(self.db, page_size=page_size))
+            self.assertEqual(self.db.rows, rows)
+
+    def test_requests(self):
+        list(self.view.iterview(self.db, page_size=4))
+        self.assertEqual([{'limit': 5},
+                          {'limit': 5, 'start_key': 1,
+                           'startkey_docid': 'doc-04'},
+                          {'limit': 5, 'start_key': 2,
+                           'startkey_docid': 'doc-08'}],
+                         self.db.requests)
+
+    def test_limit(self):
+        rows = list(self.view.iterview(self.db, page_size=4, limit=6))
+        self.assertEqual(self.db.rows[:6], rows)
+        self.assertEqual([5, 3], [request['limit']
+                                  for request in self.db.requests])
+
+    def test_skip(self):
+        rows = list(self.view.iterview(self.db, page_size=3, skip=2))
+        self.assertEqual(self.db.rows[2:], rows)
+        self.assertEqual([2, None, None],
+                         [request.get('skip') for request in self.db.requests])
+
+    def test_lazy(self):
+        rows = self.view.iterview(self.db, page_size=2)
+        next(rows)
+        self.assertEqual(1, len(self.db.requests))
+
+    def test_wrapper(self):
+        rows = self.view.iterview(self.db, page_size=3,
+                                  wrapper=lambda row: row['value']['number'])
+        self.assertEqual(range(10), list(rows))
+
+    def test_document(self):
+        class Item(mapping.Document):
+            number = mapping.IntegerField()
+        items = Item.iterview(self.db, '_design/test/_view/by_number',
+                              page_size=3)
+        self.assertEqual(range(10), [item.number for item in items])
+
+    def test_invalid_page_size(self):
+        self.assertRaises(ValueError, list,
+                          self.view.iterview(self.db, page_size=0))
+
+
+class ViewCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = testutil.RowsBucket([{'id': 'doc-%d' % i, 'key': i,
+                                        'value': {'number': i}}
+                                       for i in range(3)])
+        self.view = design.ViewDefinition('test', 'by_number',
+                                          'function(doc) {}',
+                                          cache=cache.LRUCache(), limit=10)
+
+    def test_hit(self):
+        rows = self.view(self.db, descending=False, skip=0)
+        self.assertEqual(rows, self.view(self.db, skip=0, descending=False))
+        self.assertEqual(1, len(self.db.requests))
+        self.assertEqual(1, self.view.cache.hits)
+
+    def test_options(self):
+        self.view(self.db)
+        self.view(self.db, limit=2)
+        self.view(self.db, limit=10)
+        self.assertEqual(2, len(self.db.requests))
+
+    def test_stale_false(self):
+        self.view(self.db)
+        self.view(self.db, stale='false')
+        self.view(self.db, stale=False)
+        self.assertEqual(3, len(self.db.requests))
+
+    def test_ttl(self):
+        self.view.cache.ttl = 0
+        self.view(self.db)
+        self.view(self.db)
+        self.assertEqual(2, len(self.db.requests))
+
+    def test_size_bound(self):
+        self.view.cache.maxsize = 1
+        self.view(self.db, skip=1)
+        self.view(self.db, skip=2)
+        self.view(self.db, skip=1)
+        self.assertEqual(3, len(self.db.requests))
+
+    def test_buckets(self):
+        def pool(name, number):
+            db = testutil.RowsBucket([{'id': 'doc', 'key': 0,
+                                       'value': {'number': number}}])
+            db.name = name
+            return BucketPool(lambda: db)
+        pool_a, pool_b = pool('a', 1), pool('b', 2)
+        for db in [pool_a, pool_b, pool_a, pool_b]:
+            self.view(db)
+        self.assertEqual(1, self.view(pool_a)[0]['value']['number'])
+        self.assertEqual(2, self.view(pool_b)[0]['value']['number'])
+        wrapped = asynchronous.AsyncBucket(pool_b, size=1)
+        self.assertEqual(2, self.view(wrapped)[0]['value']['number'])
+        wrapped.close()
+
+    def test_nameless_bucket(self):
+        self.db.name = None
+        self.view(self.db)
+        self.view(self.db)
+        self.assertEqual(2, len(self.db.requests))
+        self.assertEqual(0, len(self.view.cache))
+
+    def test_fresh_objects(self):
+        class Item(mapping.Document):
+            number = mapping.IntegerField()
+        self.view(self.db)
+        items = self.view(self.db, wrapper=Item._wrap_row)
+        items[0].number = 42
+        self.view(self.db)[1]['value']['number'] = 42
+        items = self.view(self.db, wrapper=Item._wrap_row)
+        self.assertEqual([0, 1, 2], [item.number for item in items])
+
+    def test_view_field(self):
+        class Item(mapping.Document):
+            number = mapping.IntegerField()
+            by_number = mapping.ViewField('test', 'function(doc) {}',
+                                          cache=cache.LRUCache())
+        self.assertEqual([0, 1, 2],
+                         [item.number for item in Item.by_number(self.db)])
+        Item.by_number(self.db)
+        self.assertEqual(1, len(self.db.requests))
+
+
+class QueryManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = testutil.RowsBucket([{'id': 'doc-%d' % i, 'key': i,
+                                        'value': {'number': i}}
+                                       for i in range(5)], latency=0.05)
+        self.view = design.ViewDefinition('test', 'by_number',
+                                          'function(doc) {}')
+
+    def test_order(self):
+        results = design.ViewDefinition.query_many(
+            self.db, [(self.view, {'limit': limit}) for limit in range(5)])
+        self.assertEqual([(self.db.rows[:limit], None)
+                          for limit in range(5)], results)
+
+    def test_concurrent(self):
+        start = time.time()
+        design.ViewDefinition.query_many(self.db, [(self.view, {})] * 5,
+                                         max_workers=5)
+        self.assertTrue(time.time() - start < 0.2)
+
+    def test_max_workers(self):
+        start = time.time()
+        results = design.ViewDefinition.query_many(
+            self.db, [(self.view, {'limit': limit}) for limit in range(4)],
+            max_workers=2)
+        # Two rounds of two queries
+        self.assertTrue(0.1 <= time.time() - start < 0.2)
+        self.assertEqual([(self.db.rows[:limit], None)
+                          for limit in range(4)], results)
+
+    def test_shared_pool(self):
+        db = testutil.RowsBucket([])
+        threads = threading.active_count()
+        for max_workers in range(1, 30):
+            design.ViewDefinition.query_many(db, [(self.view, {})] * 2,
+                                             max_workers=max_workers)
+        self.assertTrue(threading.active_count() <=
+                        threads + asynchronous.DEFAULT_POOL_SIZE)
+
+    def test_errors(self):
+        failing = design.ViewDefinition('test', 'failing', 'function(doc) {}',
+                                        wrapper=lambda row: 1 / 0)
+        results = design.ViewDefinition.query_many(
+            self.db, [(failing, {}), (self.view, {'wrapper': len})])
+        self.assertEqual(None, results[0][0])
+        self.assertTrue(isinstance(results[0][1], ZeroDivisionError))
+        self.assertEqual(([3] * 5, None), results[1])
+
+    def test_empty(self):
+        self.assertEqual([], design.ViewDefinition.query_many(self.db, []))
+
+
+class LookupManyTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = testutil.RowsBucket([
+            {'id': 'doc-1', 'key': 'a', 'value': 1},
+            {'id': 'doc-2', 'key': 'a', 'value': 2},
+            {'id': 'doc-3', 'key': 'b', 'value': 3},
+            {'id': 'doc-4', 'key': ['c', 1], 'value': 4},
+        ])
+        self.view = design.ViewDefinition('test', 'by_key', 'function(doc) {}',
+                                          wrapper=lambda row: row['value'])
+
+    def test_order_and_duplicates(self):
+        self.assertEqual([[3], [1, 2], [], [3]],
+                         self.view.lookup_many(self.db, ['b', 'a', 'x', 'b']))
+        self.assertEqual(['["b","a","x"]'],
+                         [urllib.unquote(request['keys'])
+                          for request in self.db.requests])
+
+    def test_structured_keys(self):
+        self.assertEqual([[4], [4]],
+                         self.view.lookup_many(self.db, [['c', 1], ('c', 1)]))
+
+    def test_scalar_keys(self):
+        self.db.rows = [
+            {'id': 'doc-1', 'key': 1, 'value': 1},
+            {'id': 'doc-2', 'key': True, 'value': 2},
+            {'id': 'doc-3', 'key': '[1, 2]', 'value': 3},
+            {'id': 'doc-4', 'key': [1, 2], 'value': 4},
+            {'id': 'doc-5', 'key': u'caf\xe9', 'value': 5},
+        ]
+        self.assertEqual([[1], [2], [3], [4], [5]],
+                         self.view.lookup_many(self.db, [
+                             1, True, '[1, 2]', [1, 2], 'caf\xc3\xa9']))
+
+    def test_quoted_keys(self):
+        self.db.rows = [
+            {'id': 'doc-1', 'key': 'a&b', 'value': 1},
+            {'id': 'doc-2', 'key': 'joe+tag@example.com', 'value': 2},
+        ]
+        self.assertEqual([[2], [1]], self.view.lookup_many(
+            self.db, ['joe+tag@example.com', 'a&b']))
+        self.assertEqual('%5B%22joe%2Btag%40example.com%22%2C%22a%26b%22%5D',
+                         self.db.requests[0]['keys'])
+
+    def test_chunks(self):
+        results = self.view.lookup_many(self.db, ['a', 'b', 'x'],
+                                        chunk_size=2)
+        self.assertEqual([[1, 2], [3], []], results)
+        self.assertEqual(['["a","b"]', '["x"]'],
+                         [urllib.unquote(request['keys'])
+                          for request in self.db.requests])
+        self.assertRaises(ValueError, self.view.lookup_many, self.db, ['a'],
+                          chunk_size=0)
+
+    def test_empty(self):
+        self.assertEqual([], self.view.lookup_many(self.db, []))
+        self.assertEqual([], self.db.requests)
+
+    def test_view_field(self):
+        class Item(mapping.Document):
+            name = mapping.TextField()
+            by_key = mapping.ViewField('test', 'function(doc) {}',
+                                       include_docs=False)
+        self.db.rows[0]['value'] = {'name': 'first'}
+        results = Item.by_key.lookup_many(self.db, ['a'])
+        self.assertEqual('first', results[0][0].name)
+        self.assertEqual(False, self.db.requests[0]['include_docs'])
+
+    def test_batch(self):
+        with self.view.batch(self.db, chunk_size=10) as batch:
+            pending = [batch.lookup(key) for key in ['a', 'b', 'a']]
+            self.assertEqual([], self.db.requests)
+        self.assertEqual(1, len(self.db.requests))
+        self.assertEqual([[1, 2], [3], [1, 2]],
+                         [lookup.get() for lookup in pending])
+
+    def test_batch_get_flushes(self):
+        batch = self.view.batch(self.db)
+        first = batch.lookup('a')
+        second = batch.lookup('b')
+        self.assertEqual([3], second.get())
+        self.assertEqual([1, 2], first.get())
+        third = batch.lookup('a')
+        self.assertEqual([1, 2], third.get())
+        self.assertEqual(2, len(self.db.requests))
+
+    def test_batch_error(self):
+        batch = self.view.batch(self.db)
+        first = batch.lookup('a')
+        second = batch.lookup('b')
+        self.db.error_rate = 1.0
+        self.assertRaises(MemcachedError, first.get)
+        self.assertRaises(MemcachedError, second.get)
+        self.db.error_rate = 0
+        self.assertEqual([3], second.get())
+        self.assertEqual([1, 2], first.get())
+        self.assertEqual(1, len(self.db.requests))
+
+
+class ManifestSyncTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        self.views = [
+            design.ViewDefinition('a', 'first', 'function(doc) {}'),
+            design.ViewDefinition('a', 'second', 'function(doc) {}',
+                                  '_count'),
+            design.ViewDefinition('b', 'third', 'function(doc) {}',
+                                  options={'collation': 'raw'}),
+        ]
+
+    def sync(self, **options):
+        options.setdefault('manifest_key', design.MANIFEST_KEY)
+        return design.ViewDefinition.sync_many(self.db, self.views, **options)
+
+    def test_initial_sync(self):
+        docs = self.sync()
+        self.assertEqual(2, len(docs))
+        self.assertEqual(['first', 'second'],
+                         sorted(self.db['_design/a'].ddoc['views']))
+        self.assertEqual({'collation': 'raw'},
+                         self.db['_design/b'].ddoc['views']['third']['options'])
+        manifest = json.loads(self.db.get(design.MANIFEST_KEY)[2])
+        self.assertEqual(['a', 'b'], sorted(manifest))
+
+    def test_unchanged_skips_fetch(self):
+        self.sync()
+        calls = self.db.calls
+        callbacks = []
+        self.assertEqual([], self.sync(callback=callbacks.append))
+        self.assertEqual([], callbacks)
+        # Only the manifest was read
+        self.assertEqual(calls + 1, self.db.calls)
+
+    def test_changed_design(self):
+        self.sync()
+        self.views[2] = design.ViewDefinition('b', 'third',
+                                              'function(doc) { emit(1); }')
+        callbacks = []
+        docs = self.sync(callback=callbacks.append)
+        self.assertEqual(1, len(docs))
+        self.assertEqual(docs, callbacks)
+        self.assertEqual('function(doc) { emit(1); }',
+                         docs[0]['views']['third']['map'])
+
+    def test_remove_missing_is_fingerprinted(self):
+        self.db['_design/a'] = {'views': {'old': {'map': 'function() {}'}}}
+        self.sync()
+        self.assertTrue('old' in self.db['_design/a'].ddoc['views'])
+        docs = self.sync(remove_missing=True)
+        self.assertEqual(1, len(docs))
+        self.assertFalse('old' in self.db['_design/a'].ddoc['views'])
+
+    def test_without_manifest(self):
+        self.sync()
+        self.db['_design/a'] = {'views': {}}
+        self.assertEqual([], self.sync())
+        docs = self.sync(manifest_key=None)
+        self.assertEqual(1, len(docs))
+        self.assertEqual(['first', 'second'],
+                         sorted(self.db['_design/a'].ddoc['views']))
+
+    def test_manifest_is_opt_in(self):
+        self.db.register_view('a', 'all',
+                              lambda doc, meta: [(meta['id'], None)])
+        self.db.set('doc', 0, 0, '{}')
+        design.ViewDefinition.sync_many(self.db, self.views)
+        self.assertEqual(['doc'], list(self.db.data))
+        rows = self.db.view('_design/a/_view/all')
+        self.assertEqual(['doc'], [row['id'] for row in rows])
+
+    def test_unchanged_document_recorded(self):
+        self.sync(manifest_key=None)
+        self.assertEqual([], self.sync())
+        self.assertTrue(self.db.get(design.MANIFEST_KEY))
+
+    def test_concurrent_fetch(self):
+        self.db.latency = 0.05
+        views = [design.ViewDefinition('design_%d' % i, 'all',
+                                       'function(doc) {}') for i in range(5)]
+        start = time.time()
+        design.ViewDefinition.sync_many(self.db, views, manifest_key=None)
+        # Five fetches in parallel, then five sequential writes
+        self.assertTrue(time.time() - start < 0.45)
+
+
 def suite():
     suite = unittest.TestSuite()
     suite.addTest(unittest.makeSuite(DesignTestCase))
+    suite.addTest(unittest.makeSuite(IterViewTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ViewCacheTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(QueryManyTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(LookupManyTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ManifestSyncTestCase, 'test'))
     suite.addTest(doctest.DocTestSuite(design))
     return suite
 
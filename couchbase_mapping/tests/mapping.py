@@ -6,12 +6,20 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
+import copy
+from datetime import date, datetime, timedelta, tzinfo
+from datetime import time as dtime
 from decimal import Decimal
 import doctest
-import time
+import gc
+import json
+import pickle
 import unittest
+import urllib
 
 from couchbase_mapping import design, mapping
+from couchbase_mapping.exception import NotFoundError
+from couchbase_mapping.memory import MemoryBucket
 from couchbase_mapping.tests import testutil
 
 
@@ -156,6 +164,789 @@ class DocumentTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         instance.store(self.db)
 
 
+class LoadManyTestCase(unittest.TestCase):
+
+    class Post(mapping.Document):
+        title = mapping.TextField()
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        for id in ('a', 'b', 'c'):
+            self.Post(id=id, title='Post %s' % id).store(self.db)
+
+    def test_input_order(self):
+        posts = self.Post.load_many(self.db, ['c', 'a', 'b', 'a'])
+        self.assertEqual(['c', 'a', 'b', 'a'], [post.id for post in posts])
+        self.assertEqual('Post c', posts[0].title)
+
+    def test_single_round_trip(self):
+        self.db.calls = 0
+        self.Post.load_many(self.db, ['a', 'b', 'c'])
+        self.assertEqual(1, self.db.calls)
+
+    def test_missing_raise(self):
+        self.assertRaises(NotFoundError, self.Post.load_many, self.db,
+                          ['a', 'x'])
+
+    def test_missing_skip(self):
+        posts = self.Post.load_many(self.db, ['a', 'x', 'b'], missing='skip')
+        self.assertEqual(['a', 'b'], [post.id for post in posts])
+
+    def test_missing_none(self):
+        posts = self.Post.load_many(self.db, ['a', 'x'], missing='none')
+        self.assertEqual('a', posts[0].id)
+        self.assertEqual(None, posts[1])
+
+    def test_without_get_multi(self):
+        class Bucket(testutil.MemoryBucket):
+            get_multi = None
+        db = Bucket()
+        self.Post(id='a', title='Post a').store(db)
+        posts = self.Post.load_many(db, ['a', 'x'], missing='none')
+        self.assertEqual('Post a', posts[0].title)
+        self.assertEqual(None, posts[1])
+
+
+class StoreManyTestCase(unittest.TestCase):
+
+    class Post(mapping.Document):
+        title = mapping.TextField()
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+
+    def test_assigns_ids(self):
+        posts = [self.Post(title='Post %d' % i) for i in range(3)]
+        posts.append(self.Post(id='explicit', title='Explicit'))
+        report = self.Post.store_many(self.db, posts)
+        self.assertEqual(posts, [doc for doc, error in report])
+        self.assertEqual([None] * 4, [error for doc, error in report])
+        self.assertEqual('explicit', posts[3].id)
+        for post in posts:
+            self.assertEqual(post.title, self.Post.load(self.db, post.id).title)
+
+    def test_chunks(self):
+        posts = [self.Post(title='Post %d' % i) for i in range(10)]
+        self.Post.store_many(self.db, posts, chunk_size=4)
+        self.assertEqual(3, self.db.calls)
+
+    def test_duplicate_ids(self):
+        posts = [self.Post(id='a', title='First'),
+                 self.Post(id='a', title='Second')]
+        self.assertRaises(ValueError, self.Post.store_many, self.db, posts)
+        self.assertEqual({}, self.db.data)
+        post = self.Post(id='a', title='First')
+        report = self.Post.store_many(self.db, [post, post])
+        self.assertEqual([None, None], [error for doc, error in report])
+        self.assertEqual(1, self.db.calls)
+
+    def test_set_multi_errors(self):
+        error = Exception('Boom')
+
+        class Bucket(testutil.MemoryBucket):
+            def set_multi(self, expiration, flags, items):
+                testutil.MemoryBucket.set_multi(self, expiration, flags, items)
+                return {'b': error}
+        db = Bucket()
+        posts = [self.Post(id=id) for id in ('a', 'b', 'c')]
+        report = self.Post.store_many(db, posts)
+        self.assertEqual([None, error, None], [e for doc, e in report])
+
+    def test_without_set_multi(self):
+        class Bucket(testutil.MemoryBucket):
+            set_multi = None
+
+            def set(self, key, expiration, flags, value):
+                if key == 'b':
+                    raise ValueError(key)
+                testutil.MemoryBucket.set(self, key, expiration, flags, value)
+        db = Bucket()
+        posts = [self.Post(id=id) for id in ('a', 'b', 'c')]
+        report = self.Post.store_many(db, posts)
+        self.assertEqual(None, report[0][1])
+        self.assertTrue(isinstance(report[1][1], ValueError))
+        self.assertEqual(None, report[2][1])
+        self.assertEqual('c', self.Post.load(db, 'c').id)
+
+
+class DirtyTrackingTestCase(unittest.TestCase):
+
+    class Post(mapping.Document):
+        __track_changes__ = True
+        title = mapping.TextField()
+        tags = mapping.ListField(mapping.TextField())
+        author = mapping.DictField(mapping.Mapping.build(
+            name=mapping.TextField()
+        ))
+        extra = mapping.DictField()
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        self.Post(id='post', title='Foo', tags=['a'], author={'name': 'Joe'},
+                  extra={'x': 1}).store(self.db)
+        self.post = self.Post.load(self.db, 'post')
+
+    def test_new_document(self):
+        post = self.Post(title='Foo')
+        self.assertTrue(post.is_dirty)
+        post.store(self.db)
+        self.assertFalse(post.is_dirty)
+
+    def test_loaded_document(self):
+        self.assertFalse(self.post.is_dirty)
+        self.assertEqual([], self.post.changed_fields)
+
+    def test_field_set(self):
+        self.post.title = 'Bar'
+        self.assertTrue(self.post.is_dirty)
+        self.assertEqual(['title'], self.post.changed_fields)
+        self.post.title = 'Foo'
+        self.assertFalse(self.post.is_dirty)
+
+    def test_item_set_and_delete(self):
+        self.post['other'] = 1
+        self.assertEqual(['other'], self.post.changed_fields)
+        del self.post['other']
+        del self.post['title']
+        self.assertEqual(['title'], self.post.changed_fields)
+
+    def test_list_proxy(self):
+        self.post.tags.append('b')
+        self.assertEqual(['tags'], self.post.changed_fields)
+        self.post.tags.pop()
+        self.assertFalse(self.post.is_dirty)
+        self.post.tags[0] = 'c'
+        self.assertEqual(['tags'], self.post.changed_fields)
+
+    def test_nested_dicts(self):
+        self.post.author.name = 'Jane'
+        self.post.extra['y'] = 2
+        self.assertEqual(['author', 'extra'], self.post.changed_fields)
+
+    def test_store_only_if_dirty(self):
+        self.db.calls = 0
+        self.post.store(self.db, only_if_dirty=True)
+        self.assertEqual(0, self.db.calls)
+        self.post.tags.append('b')
+        self.post.store(self.db, only_if_dirty=True)
+        self.assertEqual(1, self.db.calls)
+        self.assertEqual(['a', 'b'], self.Post.load(self.db, 'post').tags)
+
+    def test_store_many_only_if_dirty(self):
+        other = self.Post(title='Other')
+        self.db.calls = 0
+        report = self.Post.store_many(self.db, [self.post, other],
+                                      only_if_dirty=True)
+        self.assertEqual([(self.post, None), (other, None)], report)
+        self.assertEqual(1, self.db.calls)
+        self.assertFalse(other.is_dirty)
+
+    def test_untracked(self):
+        class Untracked(mapping.Document):
+            title = mapping.TextField()
+        post = Untracked.load(self.db, 'post')
+        self.assertEqual(None, post.raw_json())
+        self.assertTrue(post.is_dirty)
+        self.assertEqual(['author', 'extra', 'tags', 'title'],
+                         post.changed_fields)
+        self.db.calls = 0
+        post.store(self.db, only_if_dirty=True)
+        self.assertEqual(1, self.db.calls)
+        self.assertEqual(None, post.raw_json())
+
+
+class MemoizeTestCase(unittest.TestCase):
+
+    class Event(mapping.Document):
+        __memoize__ = True
+        start = mapping.DateTimeField()
+        price = mapping.DecimalField()
+        tags = mapping.ListField(mapping.TextField())
+        title = mapping.TextField(memoize=False)
+
+    def setUp(self):
+        self.event = self.Event.wrap({
+            'start': '2007-04-01T15:30:00Z',
+            'price': '9.90',
+            'tags': ['a'],
+            'title': 'Foo',
+        })
+
+    def test_per_class(self):
+        self.assertTrue(self.event.start is self.event.start)
+        self.assertTrue(self.event.price is self.event.price)
+        self.assertTrue(self.event.tags is self.event.tags)
+        self.assertFalse(self.event.title is self.event.title)
+
+    def test_per_field(self):
+        class Event(mapping.Document):
+            start = mapping.DateTimeField(memoize=True)
+            end = mapping.DateTimeField()
+        event = Event.wrap({'start': '2007-04-01T15:30:00Z',
+                            'end': '2007-04-01T16:30:00Z'})
+        self.assertTrue(event.start is event.start)
+        self.assertFalse(event.end is event.end)
+
+    def test_invalidate_on_set(self):
+        self.event.start
+        self.event.start = datetime(2007, 4, 2, 15, 30)
+        self.assertEqual(datetime(2007, 4, 2, 15, 30), self.event.start)
+        self.event['start'] = '2007-04-03T15:30:00Z'
+        self.assertEqual(datetime(2007, 4, 3, 15, 30), self.event.start)
+        self.event._data['start'] = '2007-04-04T15:30:00Z'
+        self.assertEqual(datetime(2007, 4, 4, 15, 30), self.event.start)
+        del self.event['start']
+        self.assertEqual(None, self.event.start)
+
+    def test_invalidate_on_wrap(self):
+        self.event.price
+        other = self.Event.wrap({'price': '1.00'})
+        self.assertEqual(Decimal('1.00'), other.price)
+        self.assertEqual(Decimal('9.90'), self.event.price)
+
+    def test_list_mutation(self):
+        self.event.tags.append('b')
+        self.assertEqual(['a', 'b'], self.event.tags)
+        self.event.tags = ['c']
+        self.assertEqual(['c'], self.event.tags)
+
+
+class DateTimeParsingTestCase(unittest.TestCase):
+
+    def test_datetime(self):
+        field = mapping.DateTimeField()
+        for value in ('2007-04-01T15:30:05', '2007-04-01T15:30:05Z',
+                      '2007-04-01T15:30:05.123456Z', '2007-04-01T15:30:05ZZ',
+                      '2007-4-1T15:30:05Z'):
+            self.assertEqual(datetime(2007, 4, 1, 15, 30, 5),
+                             field._to_python(value))
+
+    def test_datetime_errors(self):
+        field = mapping.DateTimeField()
+        for value, message in [
+                ('2007-13-01T15:30:05Z', "'2007-13-01T15:30:05'"),
+                ('2007-04-01T15:30:05+01:00', "'2007-04-01T15:30:05+01:00'"),
+                ('2007-02-30T15:30:05.1Z', "'2007-02-30T15:30:05'")]:
+            try:
+                field._to_python(value)
+            except ValueError as e:
+                self.assertEqual('Invalid ISO date/time %s' % message, str(e))
+            else:
+                self.fail(value)
+
+    def test_date(self):
+        field = mapping.DateField()
+        self.assertEqual(date(2007, 4, 1), field._to_python('2007-04-01'))
+        self.assertEqual(date(2007, 4, 1), field._to_python('2007-4-1'))
+        try:
+            field._to_python('2007-02-30')
+        except ValueError as e:
+            self.assertEqual("Invalid ISO date '2007-02-30'", str(e))
+        else:
+            self.fail()
+
+    def test_time(self):
+        field = mapping.TimeField()
+        self.assertEqual(dtime(15, 30, 5), field._to_python('15:30:05'))
+        self.assertEqual(dtime(15, 30, 5), field._to_python('15:30:05.123'))
+        try:
+            field._to_python('25:30:05.123')
+        except ValueError as e:
+            self.assertEqual("Invalid ISO time '25:30:05'", str(e))
+        else:
+            self.fail()
+
+    def test_to_json(self):
+        self.assertEqual('0005-04-01T15:30:05Z', mapping.DateTimeField()._to_json(
+            datetime(5, 4, 1, 15, 30, 5, 123)))
+        self.assertEqual('15:30:05', mapping.TimeField()._to_json(
+            dtime(15, 30, 5, 123)))
+
+    def test_to_json_timezone(self):
+        class UTC(tzinfo):
+            def utcoffset(self, dt):
+                return timedelta(0)
+        self.assertEqual('2007-04-01T15:30:05+00:00Z',
+                         mapping.DateTimeField()._to_json(
+                             datetime(2007, 4, 1, 15, 30, 5, 123, UTC())))
+        self.assertEqual('15:30:05+00:00', mapping.TimeField()._to_json(
+            dtime(15, 30, 5, 123, UTC())))
+
+
+class GeneratedCodecTestCase(unittest.TestCase):
+
+    def test_init(self):
+        class Test(mapping.Document):
+            text = mapping.TextField(name='Text')
+            number = mapping.IntegerField(default=42)
+            items = mapping.ListField(mapping.TextField())
+        test = Test(Text='foo', other='ignored')
+        self.assertEqual({'Text': u'foo', 'number': 42, 'items': []},
+                         test.unwrap())
+
+    def test_extraneous_field_message(self):
+        class Test(mapping.Document):
+            text = mapping.TextField()
+        try:
+            Test.from_json({'text': 'foo', 'extra': 'bar'})
+        except ValueError as e:
+            self.assertEqual('Extraneous field extra present', str(e))
+        else:
+            self.fail()
+        test = Test.from_json({'text': 'foo', 'extra': 'bar'}, silent=True)
+        self.assertEqual({'text': u'foo'}, test.unwrap())
+
+    def test_custom_set(self):
+        class UpperField(mapping.TextField):
+            def __set__(self, instance, value):
+                instance._data[self.name] = value and value.upper()
+
+        class Test(mapping.Document):
+            text = UpperField()
+        self.assertEqual('FOO', Test(text='foo')['text'])
+        self.assertEqual('FOO', Test.from_json({'text': 'foo'})['text'])
+
+    def test_shadowed_field(self):
+        class Base(mapping.Document):
+            text = mapping.TextField()
+
+        class Test(Base):
+            @property
+            def text(self):
+                return 'shadowed'
+
+            @text.setter
+            def text(self, value):
+                self._data['shadow'] = value
+        test = Test.from_json({'text': 'foo'})
+        self.assertEqual({'shadow': u'foo'}, test.unwrap())
+
+    def test_build(self):
+        Struct = mapping.Mapping.build(name=mapping.TextField())
+        self.assertEqual({'name': u'foo'},
+                         Struct.from_json({'name': 'foo'}).unwrap())
+        self.assertRaises(ValueError, Struct.from_json, {'other': 'foo'})
+
+
+class LazyLoadTestCase(unittest.TestCase):
+
+    class Post(mapping.Document):
+        __lazy_load__ = True
+        title = mapping.TextField()
+        tags = mapping.ListField(mapping.TextField())
+
+    def setUp(self):
+        self.db = testutil.MemoryBucket()
+        self.db.set('foo', 0, 0, '{"title": "Foo", "tags": ["a"]}')
+
+    def test_deferred(self):
+        post = self.Post.load(self.db, 'foo')
+        self.assertFalse(mapping._is_parsed(post))
+        self.assertEqual('foo', post.id)
+        self.assertEqual('Foo', post.title)
+        self.assertTrue(mapping._is_parsed(post))
+        self.assertEqual(['a'], post.tags)
+
+    def test_raw_json(self):
+        post = self.Post.load(self.db, 'foo')
+        self.assertEqual('{"title": "Foo", "tags": ["a"]}', post.raw_json())
+        self.assertFalse(mapping._is_parsed(post))
+        self.assertEqual(None, self.Post(title='Foo').raw_json())
+
+    def test_load_many(self):
+        posts = self.Post.load_many(self.db, ['foo'])
+        self.assertFalse(mapping._is_parsed(posts[0]))
+        self.assertEqual('Foo', posts[0].title)
+
+    def test_dirty_tracking(self):
+        post = self.Post.load(self.db, 'foo')
+        self.assertFalse(post.is_dirty)
+        self.assertEqual([], post.changed_fields)
+        self.assertFalse(mapping._is_parsed(post))
+        post.title = 'Bar'
+        self.assertTrue(post.is_dirty)
+        self.assertEqual(['title'], post.changed_fields)
+
+    def test_store_unparsed(self):
+        post = self.Post.load(self.db, 'foo')
+        post.id = 'bar'
+        post.store(self.db)
+        self.assertFalse(mapping._is_parsed(post))
+        self.assertEqual('{"title": "Foo", "tags": ["a"]}',
+                         self.db.get('bar')[2])
+
+    def test_store_modified(self):
+        post = self.Post.load(self.db, 'foo')
+        post.tags.append('b')
+        post.store(self.db)
+        self.assertEqual(['a', 'b'],
+                         self.Post.load(self.db, 'foo').tags)
+
+    def test_copy(self):
+        post = copy.deepcopy(self.Post.load(self.db, 'foo'))
+        self.assertEqual('Foo', post.title)
+
+    def test_missing_attribute(self):
+        post = self.Post.load(self.db, 'foo')
+        self.assertRaises(AttributeError, getattr, post, 'other')
+        post = self.Post()
+        del post._data
+        self.assertRaises(AttributeError, getattr, post, '_data')
+
+
+def _post_class(lazy):
+    # Not derived from each other, as that may change the order of the fields
+    class Post(mapping.Document):
+        __lazy_defaults__ = lazy
+        title = mapping.TextField()
+        views = mapping.IntegerField(default=0)
+        extra = mapping.DictField()
+        tags = mapping.ListField(mapping.TextField())
+        author = mapping.DictField(mapping.Mapping.build(
+            name=mapping.TextField(default='Anonymous')))
+    return Post
+
+
+class LazyDefaultsTestCase(unittest.TestCase):
+
+    Post = _post_class(lazy=True)
+    EagerPost = _post_class(lazy=False)
+
+    def test_constructor(self):
+        post = self.Post(title='Foo')
+        self.assertEqual({'title': u'Foo'}, post._data)
+
+    def test_read(self):
+        post = self.Post(title='Foo')
+        self.assertEqual(0, post.views)
+        self.assertEqual({'title': u'Foo', 'views': 0}, post._data)
+
+    def test_mutable_default(self):
+        post = self.Post()
+        post.extra['foo'] = 'bar'
+        post.tags.append('baz')
+        self.assertEqual({'foo': 'bar'}, post.unwrap()['extra'])
+        self.assertEqual(['baz'], post.unwrap()['tags'])
+
+    def test_callable_default(self):
+        calls = []
+
+        class Post(mapping.Document):
+            __lazy_defaults__ = True
+            added = mapping.IntegerField(default=lambda: calls.append(1) or 1)
+        post = Post()
+        self.assertEqual([], calls)
+        self.assertEqual(1, post.added)
+        self.assertEqual(1, post.added)
+        self.assertEqual([1], calls)
+
+    def test_same_json(self):
+        for values in [{}, {'title': 'Foo'}, {'views': 3, 'tags': ['a']},
+                       {'author': {}, 'extra': {'a': 1}}]:
+            post = self.Post(**values)
+            post.tags
+            self.assertEqual(json.dumps(self.EagerPost(**values).unwrap()),
+                             json.dumps(post.unwrap()))
+            self.assertFalse(post._pending_defaults)
+
+    def test_same_json_from_json(self):
+        data = {'title': 'Foo', 'views': 3}
+        self.assertEqual(
+            json.dumps(self.EagerPost.from_json(data).unwrap()),
+            json.dumps(self.Post.from_json(data).unwrap()))
+
+    def test_wrap(self):
+        post = self.Post.wrap({'title': 'Foo'})
+        self.assertEqual(0, post.views)
+        self.assertEqual({'title': 'Foo'}, post.unwrap())
+
+    def test_store(self):
+        db = testutil.MemoryBucket()
+        post = self.Post(id='foo', title='Foo').store(db)
+        self.assertEqual(json.dumps(self.EagerPost(title='Foo').unwrap()),
+                         db.get('foo')[2])
+
+    def test_mapping_protocol(self):
+        post = self.Post()
+        self.assertEqual(0, post['views'])
+        self.assertEqual(5, len(post))
+
+
+class Slotted(mapping.Document):
+    __slots__ = ()
+    title = mapping.TextField()
+
+
+class Unslotted(mapping.Document):
+    title = mapping.TextField()
+
+
+class SlotsTestCase(unittest.TestCase):
+
+    def test_slotted(self):
+        doc = Slotted(id='foo', title='Foo')
+        self.assertFalse(hasattr(doc, '__dict__'))
+        self.assertEqual('foo', doc.id)
+        self.assertRaises(AttributeError, setattr, doc, 'other', 1)
+
+    def test_build(self):
+        Struct = mapping.Mapping.build(name=mapping.TextField())
+        self.assertFalse(hasattr(Struct(name='foo'), '__dict__'))
+
+    def test_unslotted(self):
+        doc = Unslotted(title='Foo')
+        doc.other = 1
+        self.assertEqual(1, doc.other)
+        self.assertEqual({'title': u'Foo'}, doc.unwrap())
+
+    def test_pickle(self):
+        for cls in (Slotted, Unslotted):
+            doc = cls.wrap({'title': 'Foo'}, id='foo')
+            for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+                other = pickle.loads(pickle.dumps(doc, protocol))
+                self.assertEqual('foo', other.id)
+                self.assertEqual('Foo', other.title)
+                self.assertEqual(None, other._stored)
+
+    def test_pickle_instance_dict(self):
+        doc = Unslotted(title='Foo')
+        doc.other = 1
+        other = pickle.loads(pickle.dumps(doc))
+        self.assertEqual(1, other.other)
+
+    def test_copy(self):
+        doc = Slotted(id='foo', title='Foo')
+        other = copy.copy(doc)
+        self.assertEqual('foo', other.id)
+        self.assertTrue(other._data is doc._data)
+
+
+class FetchDocsTestCase(unittest.TestCase):
+
+    class Post(mapping.Document):
+        title = mapping.TextField()
+        views = mapping.IntegerField()
+
+    def setUp(self):
+        # Rows only carry the title, documents also have the views count
+        self.db = testutil.RowsBucket([{'id': 'post-%d' % i, 'key': i,
+                                        'value': {'title': 'Post %d' % i}}
+                                       for i in range(7)])
+        for i in range(7):
+            self.Post(id='post-%d' % i, title='Post %d' % i,
+                      views=i).store(self.db)
+        self.db.calls = 0
+
+    def test_view(self):
+        posts = self.Post.view(self.db, '_design/posts/_view/all',
+                               fetch_docs=True)
+        self.assertEqual(range(7), [post.views for post in posts])
+        self.assertEqual(2, self.db.calls)
+
+    def test_view_missing(self):
+        del self.db.data['post-3']
+        posts = self.Post.view(self.db, '_design/posts/_view/all',
+                               fetch_docs=True)
+        self.assertEqual([0, 1, 2, 4, 5, 6], [post.views for post in posts])
+
+    def test_iterview(self):
+        posts = self.Post.iterview(self.db, '_design/posts/_view/all',
+                                   page_size=3, fetch_docs=True)
+        self.assertEqual(range(7), [post.views for post in posts])
+        # One view request and one multi-get per page
+        self.assertEqual(6, self.db.calls)
+
+    def test_iterview_prefetch(self):
+        posts = self.Post.iterview(self.db, '_design/posts/_view/all',
+                                   page_size=3, fetch_docs=True,
+                                   prefetch=True)
+        self.assertEqual('post-0', next(posts).id)
+        self.assertEqual(range(1, 7), [post.views for post in posts])
+        self.assertEqual(6, self.db.calls)
+
+    def test_iterview_values(self):
+        posts = self.Post.iterview(self.db, '_design/posts/_view/all',
+                                   page_size=3)
+        self.assertEqual([None] * 7, [post.views for post in posts])
+
+
+class ViewRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        class Person(mapping.Document):
+            name = mapping.TextField()
+            by_name = mapping.ViewField('registry_people',
+                                        'function(doc) { emit(doc.name); }')
+            count = mapping.ViewField('registry_people', 'function(doc) {}',
+                                      '_count')
+
+        class Employee(Person):
+            by_company = mapping.ViewField('registry_work',
+                                           'function(doc) {}')
+
+        class Company(mapping.Document):
+            by_name = mapping.ViewField('registry_people',
+                                        'function(doc) { emit(doc.name); }')
+        self.classes = Person, Employee, Company
+        self.designs = ['registry_people', 'registry_work']
+        self.db = testutil.MemoryBucket()
+
+    def test_registered_views(self):
+        views = mapping.registered_views(self.designs)
+        self.assertEqual(['registry_people', 'registry_work'], sorted(views))
+        self.assertEqual(['by_name', 'count'],
+                         [view.name for view in views['registry_people']])
+        self.assertEqual(['by_company'],
+                         [view.name for view in views['registry_work']])
+
+    def test_conflict(self):
+        class Other(mapping.Document):
+            by_name = mapping.ViewField('registry_people',
+                                        'function(doc) { emit(doc.id); }')
+        self.assertRaises(ValueError, mapping.registered_views, self.designs)
+        del Other
+        gc.collect()
+        mapping.registered_views(self.designs)
+
+    def test_sync_all(self):
+        self.db['_design/registry_work'] = {
+            'views': {'old': {'map': 'function(doc) {}'}}}
+        rebuilt = mapping.sync_all(self.db, designs=self.designs)
+        self.assertEqual({'registry_people': ['by_name', 'count'],
+                          'registry_work': ['by_company', 'old']}, rebuilt)
+        doc = self.db['_design/registry_people'].ddoc
+        self.assertEqual('_count', doc['views']['count']['reduce'])
+
+        self.assertEqual({}, mapping.sync_all(self.db, designs=self.designs))
+        rebuilt = mapping.sync_all(self.db, remove_missing=True,
+                                   designs=self.designs)
+        self.assertEqual({'registry_work': ['by_company']}, rebuilt)
+
+    def test_sync_all_writes_each_design_once(self):
+        written = []
+        mapping.sync_all(self.db, designs=self.designs,
+                         callback=written.append)
+        self.assertEqual(2, len(written))
+
+
+class IndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        class User(mapping.Document):
+            __index_design__ = 'index_users'
+            __indexes__ = [('city', 'born')]
+            email = mapping.TextField(index=True)
+            city = mapping.TextField()
+            born = mapping.DateField()
+        self.User = User
+        self.db = testutil.RowsBucket([
+            {'id': 'joe', 'key': 'joe@example.com', 'value': None},
+            {'id': 'joe2', 'key': 'joe@example.com', 'value': None},
+            {'id': 'jane', 'key': 'jane@example.com', 'value': None},
+            {'id': 'jane', 'key': ['Paris', '1980-01-02'], 'value': None},
+            {'id': 'gone', 'key': 'gone@example.com', 'value': None},
+        ])
+        for id, email in [('joe', 'joe@example.com'),
+                          ('joe2', 'joe@example.com'),
+                          ('jane', 'jane@example.com')]:
+            User(id=id, email=email).store(self.db)
+
+    def test_generated_views(self):
+        view = self.User.by_email
+        self.assertEqual(('index_users', 'by_email'), (view.design, view.name))
+        self.assertEqual('function(doc) {\n'
+                         '    if (doc["email"] !== undefined) {\n'
+                         '        emit(doc["email"], null);\n'
+                         '    }\n'
+                         '}', view.map_fun)
+        self.assertTrue('emit([doc["city"], doc["born"]], null);' in
+                        self.User.by_city_and_born.map_fun)
+        views = mapping.registered_views(['index_users'])['index_users']
+        self.assertEqual(['by_city_and_born', 'by_email'],
+                         [view.name for view in views])
+
+    def test_condition(self):
+        class Item(mapping.Document):
+            __index_condition__ = "doc.kind == 'item'"
+            name = mapping.TextField(index=True)
+        self.assertEqual('item', Item.by_name.design)
+        self.assertTrue("if ((doc.kind == 'item') && doc[\"name\"] !== "
+                        "undefined) {" in Item.by_name.map_fun)
+
+    def test_find(self):
+        users = self.User.find_by_email(self.db, 'joe@example.com')
+        self.assertEqual(['joe', 'joe2'], [user.id for user in users])
+        self.assertEqual(u'joe@example.com', users[0].email)
+        self.assertEqual([], self.User.find_by_email(self.db, 'x@example.com'))
+
+    def test_find_special_characters(self):
+        # ``+`` and ``&`` have a meaning of their own in query strings
+        emails = ['joe+tag@example.com', 'a&b@example.com']
+        db = testutil.RowsBucket([{'id': 'a&b', 'key': emails[1],
+                                   'value': None},
+                                  {'id': 'joe+tag', 'key': emails[0],
+                                   'value': None}])
+        for email in emails:
+            self.User(id=email.split('@')[0], email=email).store(db)
+        users = self.User.find_by_email(db, emails[0])
+        self.assertEqual(['joe+tag'], [user.id for user in users])
+        results = self.User.find_by_email_many(db, emails)
+        self.assertEqual([['joe+tag'], ['a&b']],
+                         [[user.id for user in users] for users in results])
+
+    def test_find_many(self):
+        calls = self.db.calls
+        results = self.User.find_by_email_many(
+            self.db, ['jane@example.com', 'gone@example.com',
+                      'joe@example.com', 'jane@example.com'])
+        self.assertEqual([['jane'], [], ['joe', 'joe2'], ['jane']],
+                         [[user.id for user in users] for users in results])
+        self.assertFalse(results[0][0] is results[3][0])
+        # One view request and one multi-get
+        self.assertEqual(calls + 2, self.db.calls)
+
+    def test_composite(self):
+        users = self.User.find_by_city_and_born(self.db,
+                                                ('Paris', date(1980, 1, 2)))
+        self.assertEqual(['jane'], [user.id for user in users])
+        self.assertEqual('[["Paris","1980-01-02"]]',
+                         urllib.unquote(self.db.requests[-1]['keys']))
+        self.assertRaises(ValueError, self.User.find_by_city_and_born,
+                          self.db, 'Paris')
+
+    def test_options(self):
+        self.User.find_by_email(self.db, 'joe@example.com', stale=False)
+        self.assertEqual(False, self.db.requests[-1]['stale'])
+
+    def test_containers(self):
+        class Item(mapping.Document):
+            tags = mapping.ListField(mapping.TextField(), index=True)
+            size = mapping.DictField(mapping.Mapping.build(
+                width=mapping.IntegerField()), index=True)
+        db = testutil.RowsBucket([{'id': 'item', 'key': ['a', 'b'],
+                                   'value': None}])
+        Item(id='item', tags=['a', 'b']).store(db)
+        self.assertTrue('emit(doc["tags"], null);' in Item.by_tags.map_fun)
+        self.assertEqual(['item'], [item.id for item in
+                                    Item.find_by_tags(db, ['a', 'b'])])
+        Item.find_by_size(db, {'width': 2})
+        self.assertEqual('[{"width":2}]',
+                         urllib.unquote(db.requests[-1]['keys']))
+
+    def test_invalid(self):
+        def unknown_field():
+            class Item(mapping.Document):
+                __indexes__ = [('name', 'size')]
+                name = mapping.TextField()
+        self.assertRaises(ValueError, unknown_field)
+
+        def clash():
+            class Item(mapping.Document):
+                name = mapping.TextField(index=True)
+                by_name = mapping.ViewField('items', 'function(doc) {}')
+        self.assertRaises(ValueError, clash)
+
+
 class ListFieldTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
 
     def test_to_json(self):
@@ -294,11 +1085,15 @@ class WrappingTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
         design.ViewDefinition.sync_many(
             self.db, [self.Item.with_include_docs,
                       self.Item.without_include_docs])
-        time.sleep(10)  # Wait for the new view to be defined and indexed.
+        if isinstance(self.db, MemoryBucket):
+            for name in ('with_include_docs', 'without_include_docs'):
+                self.db.register_view('test', name,
+                                      lambda doc, meta: [(meta['id'], None)])
+        self.wait_for_indexing()
 
     def test_viewfield_property(self):
         self.Item(id='1', name='item #1').store(self.db)
-        time.sleep(10)
+        self.wait_for_indexing()
         results = self.Item.with_include_docs(self.db,
                                               connection_timeout=60000,
                                               stale=False)
@@ -325,7 +1120,7 @@ class WrappingTestCase(testutil.TempDatabaseMixin, unittest.TestCase):
 
     def test_view(self):
         self.Item(id='2', name='item #2').store(self.db)
-        time.sleep(10)
+        self.wait_for_indexing()
         results = self.Item.view(self.db,
                                  '_design/test/_view/without_include_docs',
                                  connection_timeout=60000,
@@ -345,6 +1140,18 @@ def suite():
     suite = unittest.TestSuite()
     suite.addTest(doctest.DocTestSuite(mapping))
     suite.addTest(unittest.makeSuite(DocumentTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(LoadManyTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(StoreManyTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(DirtyTrackingTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(MemoizeTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(DateTimeParsingTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(GeneratedCodecTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(SlotsTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(LazyDefaultsTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(LazyLoadTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(FetchDocsTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ViewRegistryTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(IndexTestCase, 'test'))
     suite.addTest(unittest.makeSuite(ListFieldTestCase, 'test'))
     suite.addTest(unittest.makeSuite(WrappingTestCase, 'test'))
     return suite
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+
+import doctest
+import json
+import time
+import unittest
+
+from couchbase.exception import MemcachedError
+
+from couchbase_mapping import codec, memory
+
+
+class KeyValueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = memory.MemoryBucket()
+
+    def test_get_set(self):
+        self.db.set('foo', 0, 4, '{"a": 1}')
+        self.assertEqual((4, 0, '{"a": 1}'), self.db.get('foo'))
+        self.assertEqual((4, 0, '{"a": 1}'), self.db['foo'])
+        self.db['bar'] = {'b': 2}
+        self.assertEqual({'b': 2}, json.loads(self.db.get('bar')[2]))
+        self.assertRaises(MemcachedError, self.db.get, 'baz')
+
+    def test_multi(self):
+        self.assertEqual({}, self.db.set_multi(0, 2, {'a': '1', 'b': '2'}))
+        self.assertEqual({'a': (2, 0, '1'), 'b': (2, 0, '2')},
+                         self.db.get_multi(['a', 'b', 'c']))
+        self.assertEqual(2, self.db.calls)
+
+    def test_delete(self):
+        self.db.set('foo', 0, 0, '1')
+        self.db.delete('foo')
+        self.assertRaises(MemcachedError, self.db.get, 'foo')
+        self.assertRaises(MemcachedError, self.db.delete, 'foo')
+
+    def test_design_docs(self):
+        self.assertRaises(MemcachedError, self.db.__getitem__, '_design/foo')
+        doc = {'views': {'all': {'map': 'function(doc) {}'}}}
+        self.db['_design/foo'] = doc
+        doc['views'].clear()
+        design_doc = self.db['_design/foo']
+        self.assertEqual('foo', design_doc.name)
+        self.assertEqual({'views': {'all': {'map': 'function(doc) {}'}}},
+                         design_doc.ddoc)
+
+
+class ViewTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.db = memory.MemoryBucket()
+        for id, name, age in [('a', 'Joe', 30), ('b', 'Jane', 25),
+                              ('c', 'Jim', 30), ('d', 'Ann', 40)]:
+            self.db['person-' + id] = {'name': name, 'age': age}
+        self.db.set('blob', 0, codec.find('marshal').flag, 'binary')
+        self.db.set('text', 0, 0, 'not json')
+        self.db.register_view('people', 'by_age',
+                              lambda doc, meta: [(doc['age'], doc['name'])],
+                              '_count')
+        self.db.register_view('people', 'by_name_age',
+                              lambda doc, meta: [([doc['name'], doc['age']],
+                                                  None)])
+
+    def query(self, name='by_age', **options):
+        return self.db.view('_design/people/_view/' + name, **options)
+
+    def test_map(self):
+        rows = self.query(reduce=False)
+        self.assertEqual([(25, 'person-b'), (30, 'person-a'), (30, 'person-c'),
+                          (40, 'person-d')],
+                         [(row['key'], row['id']) for row in rows])
+        self.assertEqual(u'Jane', rows[0]['value'])
+
+    def test_key_and_keys(self):
+        rows = self.query(reduce=False, key=30)
+        self.assertEqual(['person-a', 'person-c'], [row['id'] for row in rows])
+        rows = self.query(reduce=False, keys='[40, 1, 25, 40]')
+        self.assertEqual(['person-d', 'person-b', 'person-d'],
+                         [row['id'] for row in rows])
+
+    def test_range(self):
+        rows = self.query(reduce=False, start_key=30, end_key=40,
+                          inclusive_end=False)
+        self.assertEqual(['person-a', 'person-c'], [row['id'] for row in rows])
+        rows = self.query(reduce=False, startkey='30',
+                          startkey_docid='person-c')
+        self.assertEqual(['person-c', 'person-d'], [row['id'] for row in rows])
+        rows = self.query(reduce=False, descending=True, start_key=30,
+                          end_key=25)
+        self.assertEqual(['person-c', 'person-a', 'person-b'],
+                         [row['id'] for row in rows])
+        rows = self.query(reduce='false', descending='true', endkey='30',
+                          inclusive_end='false')
+        self.assertEqual(['person-d'], [row['id'] for row in rows])
+
+    def test_array_keys(self):
+        rows = self.query('by_name_age', start_key=['J'], end_key=['K'])
+        self.assertEqual([['Jane', 25], ['Jim', 30], ['Joe', 30]],
+                         [row['key'] for row in rows])
+
+    def test_skip_limit(self):
+        rows = self.query(reduce=False, skip=1, limit=2)
+        self.assertEqual(['person-a', 'person-c'], [row['id'] for row in rows])
+
+    def test_include_docs(self):
+        rows = self.query(reduce=False, include_docs=True, key=40)
+        self.assertEqual({'meta': {'id': 'person-d', 'flags': 0},
+                          'json': {'name': 'Ann', 'age': 40}}, rows[0]['doc'])
+
+    def test_reduce(self):
+        self.assertEqual([{'key': None, 'value': 4}], self.query())
+        self.assertEqual([{'key': 25, 'value': 1}, {'key': 30, 'value': 2},
+                          {'key': 40, 'value': 1}], self.query(group=True))
+        self.db.register_view('people', 'by_name_age',
+                              lambda doc, meta: [([doc['name'], doc['age']],
+                                                  doc['age'])],
+                              lambda keys, values: max(values))
+        self.assertEqual([{'key': ['Ann'], 'value': 40},
+                          {'key': ['Jane'], 'value': 25}],
+                         self.query('by_name_age', group_level=1, limit=2))
+        self.assertEqual([], self.query(key=99))
+
+    def test_index_updates(self):
+        self.assertEqual(4, self.query()[0]['value'])
+        self.db['person-e'] = {'name': 'Eve', 'age': 20}
+        self.assertEqual(5, self.query()[0]['value'])
+        self.db.delete('person-e')
+        self.assertEqual(4, self.query()[0]['value'])
+
+    def test_unregistered(self):
+        self.assertRaises(ValueError, self.query, 'unknown')
+        self.assertRaises(ValueError, self.db.view, 'people/by_age')
+
+
+class InjectionTestCase(unittest.TestCase):
+
+    def test_latency(self):
+        db = memory.MemoryBucket(latency={'get_multi': 0.05})
+        start = time.time()
+        db.set('foo', 0, 0, '1')
+        self.assertTrue(time.time() - start < 0.04)
+        db.get_multi(['foo'])
+        self.assertTrue(time.time() - start >= 0.05)
+
+    def test_jitter(self):
+        db = memory.MemoryBucket(latency=0.01, jitter=0.02, seed=1)
+        start = time.time()
+        for i in range(5):
+            db.set('foo', 0, 0, '1')
+        elapsed = time.time() - start
+        self.assertTrue(0.05 <= elapsed < 0.2)
+
+    def test_errors(self):
+        def failures(seed):
+            db = memory.MemoryBucket(error_rate=0.5, seed=seed)
+            retval = []
+            for i in range(50):
+                try:
+                    db.set('foo', 0, 0, '1')
+                except MemcachedError as e:
+                    self.assertEqual(memory.ERR_TEMPORARY_FAILURE, e.status)
+                    retval.append(i)
+            return retval
+        self.assertTrue(0 < len(failures(1)) < 50)
+        self.assertEqual(failures(1), failures(1))
+
+    def test_custom_error(self):
+        db = memory.MemoryBucket(error_rate={'view': 1},
+                                 error=lambda: IOError('down'))
+        db.set('foo', 0, 0, '1')
+        self.assertRaises(IOError, db.view, '_design/a/_view/b')
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(memory))
+    suite.addTest(unittest.makeSuite(KeyValueTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(ViewTestCase, 'test'))
+    suite.addTest(unittest.makeSuite(InjectionTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
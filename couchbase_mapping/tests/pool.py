@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+
+import doctest
+import threading
+import time
+import unittest
+
+from couchbase.exception import MemcachedError
+
+from couchbase_mapping import mapping, pool
+from couchbase_mapping.exception import NotFoundError, PoolTimeoutError
+from couchbase_mapping.tests import testutil
+
+
+class Client(object):
+    """Stands for the memcached client of a `Bucket`."""
+
+    def __init__(self):
+        self.closed = False
+
+    def done(self):
+        self.closed = True
+
+
+class BucketPoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.buckets = []
+        self.pool = pool.BucketPool(self.factory, size=2, timeout=0.1)
+
+    def factory(self):
+        bucket = testutil.MemoryBucket()
+        bucket.mc_client = Client()
+        self.buckets.append(bucket)
+        return bucket
+
+    def test_reuse(self):
+        with self.pool.connection() as db:
+            pass
+        with self.pool.connection() as db2:
+            self.assertTrue(db is db2)
+        self.assertEqual(1, len(self.buckets))
+
+    def test_bounded(self):
+        db1 = self.pool.checkout()
+        db2 = self.pool.checkout()
+        self.assertTrue(db1 is not db2)
+        self.assertEqual(2, len(self.pool))
+        self.assertRaises(PoolTimeoutError, self.pool.checkout)
+        self.pool.checkin(db1)
+        self.assertTrue(self.pool.checkout() is db1)
+
+    def test_wait_for_checkin(self):
+        db = self.pool.checkout()
+        self.pool.checkout()
+        timer = threading.Timer(0.02, self.pool.checkin, [db])
+        timer.start()
+        self.assertTrue(self.pool.checkout(timeout=1) is db)
+        timer.join()
+
+    def test_health_check(self):
+        db = self.pool.checkout()
+        self.pool.checkin(db)
+        self.pool.check = lambda bucket: bucket is not db
+        self.assertTrue(self.pool.checkout() is not db)
+        self.assertEqual(2, len(self.buckets))
+        self.assertEqual(1, len(self.pool))
+        self.assertTrue(db.mc_client.closed)
+
+    def test_idle_eviction(self):
+        self.pool.max_idle = 0.01
+        self.pool.checkin(self.pool.checkout())
+        self.assertEqual(1, len(self.pool))
+        time.sleep(0.02)
+        self.pool.evict_idle()
+        self.assertEqual(0, len(self.pool))
+        self.assertTrue(self.buckets[0].mc_client.closed)
+
+    def test_discard(self):
+        db = self.pool.checkout()
+        self.pool.discard(db)
+        self.assertEqual(0, len(self.pool))
+        self.assertTrue(db.mc_client.closed)
+        self.assertTrue(self.pool.checkout() is not db)
+
+    def test_documents(self):
+        class Person(mapping.Document):
+            name = mapping.TextField()
+        person = Person(name='John Doe').store(self.pool)
+        self.assertEqual('John Doe', Person.load(self.pool, person.id).name)
+        self.assertRaises(NotFoundError, Person.load, self.pool, 'missing')
+        people = Person.load_many(self.pool, [person.id])
+        self.assertEqual(person.id, people[0].id)
+        self.assertEqual(1, len(self.buckets))
+
+    def test_get_multi(self):
+        class Bucket(testutil.MemoryBucket):
+            get_multi = None
+        data = {}
+
+        def factory():
+            bucket = Bucket(latency=0.05)
+            bucket.data = data
+            self.buckets.append(bucket)
+            return bucket
+        self.pool = pool.BucketPool(factory, size=4, timeout=1)
+        for key in 'abcdefgh':
+            data[key] = (0, '{}')
+        start = time.time()
+        found = self.pool.get_multi('abcdefghxy')
+        # Ten gets over four connections
+        self.assertTrue(time.time() - start < 0.25)
+        self.assertEqual(list('abcdefgh'), sorted(found))
+        self.assertEqual((0, 0, '{}'), found['a'])
+        self.assertEqual(4, len(self.buckets))
+
+    def test_get_multi_error(self):
+        class Bucket(testutil.MemoryBucket):
+            get_multi = None
+        self.pool.factory = lambda: Bucket(error_rate={'get': 1})
+        self.assertRaises(MemcachedError, self.pool.get_multi, ['a', 'b'])
+        self.assertEqual(2, len(self.pool))
+
+    def test_get_multi_concurrent(self):
+        class Bucket(testutil.MemoryBucket):
+            get_multi = None
+        data = dict((key, (0, '{}')) for key in 'abcdefgh')
+
+        def factory():
+            bucket = Bucket(latency=0.01)
+            bucket.data = data
+            return bucket
+        self.pool = pool.BucketPool(factory, size=2)
+        results = []
+
+        def worker():
+            results.append(self.pool.get_multi('abcdefgh'))
+        threads = [threading.Thread(target=worker) for i in range(2)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(2)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual([list('abcdefgh')] * 2,
+                         [sorted(found) for found in results])
+
+    def test_get_multi_holding_connection(self):
+        class Bucket(testutil.MemoryBucket):
+            get_multi = None
+        bucket = Bucket()
+        bucket.set('a', 0, 0, '{}')
+        data = bucket.data
+
+        def factory():
+            bucket = Bucket()
+            bucket.data = data
+            return bucket
+        self.pool.factory = factory
+        self.pool.timeout = None
+        with self.pool.connection():
+            found = self.pool.get_multi(['a', 'b', 'c'])
+        self.assertEqual(['a'], sorted(found))
+        self.assertEqual(2, len(self.pool))
+
+    def test_set_multi(self):
+        class Bucket(testutil.MemoryBucket):
+            set_multi = None
+        data = {}
+
+        def factory():
+            bucket = Bucket(latency=0.05, error_rate={'set': 0})
+            bucket.data = data
+            self.buckets.append(bucket)
+            return bucket
+        self.pool = pool.BucketPool(factory, size=4, timeout=1)
+        items = dict((key, '{}') for key in 'abcdefgh')
+        start = time.time()
+        self.assertEqual({}, self.pool.set_multi(0, 0, items))
+        # Eight sets over four connections
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertEqual(list('abcdefgh'), sorted(data))
+        self.assertEqual(4, len(self.buckets))
+        self.buckets[0].error_rate = {'set': 1}
+        errors = self.pool.set_multi(0, 0, items)
+        self.assertEqual(2, len(errors))
+        self.assertTrue(all(isinstance(error, MemcachedError)
+                            for error in errors.values()))
+
+    def test_store_many(self):
+        class Bucket(testutil.MemoryBucket):
+            set_multi = None
+        class Person(mapping.Document):
+            name = mapping.TextField()
+        self.pool.factory = Bucket
+        report = Person.store_many(self.pool, [Person(id='a', name='A')])
+        self.assertEqual([None], [error for doc, error in report])
+        self.assertEqual('A', Person.load(self.pool, 'a').name)
+
+    def test_missing_method(self):
+        self.assertFalse(hasattr(self.pool, 'apply_async'))
+
+    def test_attributes_need_no_connection(self):
+        class Person(mapping.Document):
+            name = mapping.TextField()
+        Person(id='joe', name='Joe').store(self.pool)
+        self.pool.size = 1
+        with self.pool.connection():
+            self.assertFalse(hasattr(self.pool, 'apply_async'))
+            self.assertTrue(callable(self.pool.get_multi))
+            pending = Person.aload(self.pool, 'joe')
+        self.assertEqual('Joe', pending.get().name)
+
+    def test_threads(self):
+        class Person(mapping.Document):
+            name = mapping.TextField()
+        self.pool.timeout = None
+        errors = []
+
+        def worker(i):
+            try:
+                with self.pool.connection() as db:
+                    Person(id=str(i), name=str(i)).store(db)
+                    self.assertEqual(str(i), Person.load(db, str(i)).name)
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=worker, args=(i,))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        self.assertTrue(len(self.buckets) <= 2)
+
+
+def suite():
+    suite = unittest.TestSuite()
+    suite.addTest(doctest.DocTestSuite(pool))
+    suite.addTest(unittest.makeSuite(BucketPoolTestCase, 'test'))
+    return suite
+
+
+if __name__ == '__main__':
+    unittest.main(defaultTest='suite')
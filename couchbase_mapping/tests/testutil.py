@@ -6,11 +6,21 @@
 # This software is licensed as described in the file COPYING, which
 # you should have received as part of this distribution.
 
+import json
+import os
 import random
 import sys
+import time
+import urllib
 
 from couchbase import Couchbase
 
+from couchbase_mapping.memory import MemoryBucket
+
+# The host of the Couchbase server the tests create buckets on, or
+# ``memory`` to run them offline against `MemoryBucket` instances
+SERVER = os.environ.get('COUCHBASE_MAPPING_TEST_SERVER', 'localhost')
+
 
 class TempDatabaseMixin(object):
 
@@ -18,10 +28,13 @@ class TempDatabaseMixin(object):
     _db = None
 
     def setUp(self):
-        self.server = Couchbase('localhost', 'Administrator', 'password')
+        if SERVER == 'memory':
+            self.server = None
+        else:
+            self.server = Couchbase(SERVER, 'Administrator', 'password')
 
     def tearDown(self):
-        if self.temp_dbs:
+        if self.temp_dbs and self.server is not None:
             for name in self.temp_dbs:
                 self.server.delete(name)
 
@@ -33,16 +46,53 @@ class TempDatabaseMixin(object):
             name = 'couchbase-mapping-python_%d' % random.randint(0, sys.maxint)
             if name not in self.temp_dbs:
                 break
-        db = self.server.create(name)
+        if self.server is None:
+            db = MemoryBucket(name=name)
+        else:
+            db = self.server.create(name)
         self.temp_dbs[name] = db
         return name, db
 
     def del_db(self, name):
         del self.temp_dbs[name]
-        self.server.delete(name)
+        if self.server is not None:
+            self.server.delete(name)
+
+    def wait_for_indexing(self):
+        # Views of a `MemoryBucket` are always up to date
+        if self.server is not None:
+            time.sleep(10)
 
     @property
     def db(self):
         if self._db is None:
             name, self._db = self.temp_db()
         return self._db
+
+
+class RowsBucket(MemoryBucket):
+    """`MemoryBucket` that also serves a single view from a list of rows
+    sorted by key and ID, honoring the options used for paging and multi-key
+    lookups.
+    """
+
+    def __init__(self, rows, latency=0):
+        MemoryBucket.__init__(self, latency)
+        self.rows = rows
+        self.requests = []
+
+    def view(self, viewname, **options):
+        self._round_trip('view')
+        self.requests.append(options)
+        rows = self.rows
+        if 'keys' in options:
+            # Compared as JSON, where ``true`` and ``1`` differ
+            keys = json.loads(urllib.unquote_plus(options['keys']))
+            rows = [row for key in keys
+                    for row in rows
+                    if json.dumps(row['key']) == json.dumps(key)]
+        if 'start_key' in options:
+            start = (options['start_key'], options.get('startkey_docid', ''))
+            rows = [row for row in rows if (row['key'], row['id']) >= start]
+        rows = rows[options.get('skip', 0):]
+        return rows[:options.get('limit')]
@@ -43,6 +43,7 @@ setup(
         'Topic :: Database :: Front-Ends',
         'Topic :: Software Development :: Libraries :: Python Modules',
     ],
-    packages=['couchbase_mapping', 'couchbase_mapping.tests'],
+    packages=['couchbase_mapping', 'couchbase_mapping.benchmarks',
+              'couchbase_mapping.tests'],
     **setuptools_options
 )